@@ -51,6 +51,24 @@ for further choices as necessary.</p>
     Iterative.__init__(self, b)
     MethodPlugin.__init__(self)
     self.prec = 0
+    self.ranked = []       # ranked[r][c] is the weight of c's votes at rank r
+    self.shortWeight = []  # shortWeight[r] is the weight of ballots with r rankings or less
+
+  def preCount(self):
+    Iterative.preCount(self)
+
+    # Tally every ranking position once instead of once per round
+    (self.ranked, lengths) = self.b.getRankHistogram()
+    self.shortWeight = [0] * self.b.numCandidates
+    total = 0
+    for r in range(self.b.numCandidates):
+      if r < len(lengths):
+        total += lengths[r]
+      self.shortWeight[r] = total
+
+  def countBound(self):
+    "A candidate gets at most one vote from each ballot."
+    return self.b.numBallots
 
   def countBallots(self):
     "Count the votes with the Bucklin system."
@@ -70,13 +88,10 @@ for further choices as necessary.</p>
         self.exhausted[self.R] = self.exhausted[self.R-1]
 
       # Count votes using multiple rankings
-      for i in range(self.b.numWeightedBallots):
-        weight, blt = self.b.getWeightedBallot(i)
-        if len(blt) > self.R:
-          c = blt[self.R]
-          self.count[self.R][c] += weight
-        else:
-          self.exhausted[self.R] += weight
+      if self.R < len(self.ranked):
+        for c in range(self.b.numCandidates):
+          self.count[self.R][c] += self.ranked[self.R][c]
+      self.exhausted[self.R] += self.shortWeight[self.R]
 
       # Check for winners.  Could be more than we need.
       potWinners = []
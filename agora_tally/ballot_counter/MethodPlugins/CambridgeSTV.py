@@ -16,6 +16,7 @@ __revision__ = "$Id: CambridgeSTV.py 715 2010-02-27 17:00:55Z jeff.oneill $"
 
 import os.path
 import string
+from itertools import chain
 
 from agora_tally.ballot_counter.STV import OrderDependentSTV
 from agora_tally.ballot_counter.plugins import MethodPlugin
@@ -509,41 +510,39 @@ Need at least %d ballots but have only %d.""" % (
     skip = int(round(1.0 * total / surplus)) # decimation factor
     start = skip - 1                         # starting point
 
-    # compute the order in which ballots will be considered for transfer
+    # compute the order in which ballots will be considered for transfer:
+    # every skip-th ballot from start, then from start+1, and so on, and
+    # finally the ballots before start
     if surplus == 1:
-      order = range(total)
-      order = order[-1:] + order[:-1]
+      order = chain([total-1], range(total-1))
     else:
-      order = []
-      for i in range(start, start+skip):
-        for j in range(i, total, skip):
-          order.append(j)
-      for i in range(start):
-        order.append(i)
+      order = chain(*([range(i, total, skip) for i in range(start, start+skip)]
+                      + [range(start)]))
 
     # transfer the ballots
     nTransferred = 0
     ctng = self.continuing.copy()  # candidates who can receive votes
     # attempt to transfer votes in the precalculated order
-    cSurplusVotes = self.votes[cSurplus][:] # use this to loop over c0's votes
+    cSurplusVotes = list(self.votes[cSurplus]) # use this to loop over c0's votes
     for i in order:   # i is the ith vote of a candidate
       bi = cSurplusVotes[i]  # bi is the bith ballot
       # Get the next candidate.
       # If no next candidate, then the vote is not transferable and
       # remains with the current candidate.
-      c = self.b.getTopChoiceFromBallot(bi, ctng)
+      c = self.cursors.getTopChoiceFromBallot(bi, ctng)
       if c != None:
-        self.votes[c].append(bi)
+        self.votes.add(c, bi)
         # If the receiving candidate is now a winner, then that
         # candidate can no longer receive any more votes.
         if len(self.votes[c]) >= self.thresh[self.R-1]:
           ctng.remove(c)
-        self.votes[cSurplus].remove(bi)
         nTransferred += 1
       # Check if the entire surplus has been transferred
       if nTransferred == surplus:
         break
 
+    if not self.narrative:
+      return ""
     desc = "Count after transferring surplus votes from %s by using the "\
            "Cincinnati method with a skip value of %d. " \
            % (self.b.names[cSurplus], skip)
@@ -566,17 +565,19 @@ Need at least %d ballots but have only %d.""" % (
       descTie += desc
       eliminationOrder.append(loser)
       remainingLosers.remove(loser)
-      for bi in self.votes[loser]:
-        c = self.b.getTopChoiceFromBallot(bi, ctng)
+      for bi in list(self.votes[loser]):
+        c = self.cursors.getTopChoiceFromBallot(bi, ctng)
         if c != None:
-          self.votes[c].append(bi)
+          self.votes.add(c, bi)
           # If receiving candidate becomes a winner, then that
           # candidate can't receive any more votes.
           if len(self.votes[c]) >= self.thresh[self.R-1]:
             ctng.remove(c)
 
-      self.votes[loser] = []
+      self.votes.clear(loser)
 
+    if not self.narrative:
+      return ""
     desc = "Count after eliminating %s and transferring votes. " % \
          self.b.joinList(eliminationOrder)
     return desc + descTie
@@ -602,7 +603,7 @@ Need at least %d ballots but have only %d.""" % (
 
       # Create a unique filename
       cName = self.b.names[c]
-      cNameNorm = string.join((x for x in cName if x in validChars), "")
+      cNameNorm = "".join(x for x in cName if x in validChars)
       fName = os.path.join(self.outputDir, cNameNorm + ".blt")
       i = 1
       while os.path.exists(fName):
@@ -15,6 +15,8 @@
 __revision__ = "$Id: Condorcet.py 715 2010-02-27 17:00:55Z jeff.oneill $"
 
 from agora_tally.ballot_counter.STV import NonIterative
+from agora_tally.ballot_counter import pairwise
+from agora_tally.ballot_counter.ballots import BallotsView
 from agora_tally.ballot_counter.plugins import MethodPlugin
 from agora_tally.ballot_counter.MethodPlugins.Borda import Borda
 from agora_tally.ballot_counter.MethodPlugins.IRV import IRV
@@ -59,6 +61,8 @@ There are three choices for the completion method:</p>
     self.SSDinfo = ""
     self.pMat = []
     self.dMat = []
+    # Use the numpy engine for the pairwise matrix, Smith set and beatpaths
+    self.vectorized = pairwise.available()
     
   def preCount(self):
     NonIterative.preCount(self)
@@ -72,6 +76,10 @@ There are three choices for the completion method:</p>
   def computePMat(self):
     "Compute the pairwise comparison matrix."
 
+    if self.vectorized:
+      self.pMat = pairwise.pairwiseMatrix(self.b).tolist()
+      return
+
     # Intialize space
     self.pMat = []
     for c in range(self.b.numCandidates):
@@ -80,7 +88,7 @@ There are three choices for the completion method:</p>
     # Compute pMat
     for i in range(self.b.numWeightedBallots):
       weight, ballot = self.b.getWeightedBallot(i)
-      remainingC = range(self.b.numCandidates)
+      remainingC = list(range(self.b.numCandidates))
       for c in ballot:
         remainingC.remove(c)
         for d in remainingC:
@@ -89,6 +97,10 @@ There are three choices for the completion method:</p>
   def computeSmithSet(self):
     "Compute the Smith set."
 
+    if self.vectorized:
+      self.smithSet = pairwise.smithSet(pairwise.numpy.array(self.pMat))
+      return
+
     dMat = []
     for c in range(self.b.numCandidates):
       dMat.append([0] * self.b.numCandidates)
@@ -96,7 +108,7 @@ There are three choices for the completion method:</p>
     # compute the Smith set
     # Adapted from code posted by Markus Schulze at
     # http://groups.yahoo.com/group/election-methods-list/message/6493
-    self.smithSet = range(self.b.numCandidates)
+    self.smithSet = list(range(self.b.numCandidates))
     for c in range(self.b.numCandidates):
       for d in range(self.b.numCandidates):
         if c != d:
@@ -123,6 +135,29 @@ There are three choices for the completion method:</p>
   def SchwartzSequentialDropping(self):
     "Complete with SSD."
 
+    if self.vectorized:
+      dMat = pairwise.beatpathMatrix(pairwise.numpy.array(self.pMat))
+      self.dMat = dMat.tolist()
+      ctng = pairwise.beatpathWinners(dMat)
+    else:
+      ctng = self.computeBeatpaths()
+
+    if len(ctng) > 1:
+      ctng.sort()
+      self.SSDinfo = """
+Candidates remaining after SSD: %s
+
+Tie broken randomly.""" % self.b.joinList(ctng)
+      (c0, desc) = self.breakStrongTie(ctng)
+    else:
+      self.SSDinfo = ""
+      c0 = ctng[0]
+
+    return c0
+
+  def computeBeatpaths(self):
+    "Compute the beatpaths and return the candidates not beaten by any."
+
     # Initialize the defeats matrix: dMat[i][j] gives the magnitude of i's
     # defeat of j. If i doesn't defeat j, then dMat[i][j] == 0.
     self.dMat = []
@@ -157,24 +192,13 @@ There are three choices for the completion method:</p>
               self.dMat[c][k] = dmin
               changing = 1
 
-    ctng = range(self.b.numCandidates)[:]
+    ctng = list(range(self.b.numCandidates))
     for c in ctng[:]:
       for d in ctng[:]:
         if self.dMat[d][c] > self.dMat[c][d] and c in ctng:
           ctng.remove(c)
 
-    if len(ctng) > 1:
-      ctng.sort()
-      self.SSDinfo = """
-Candidates remaining after SSD: %s
-
-Tie broken randomly.""" % self.b.joinList(ctng)
-      (c0, desc) = self.breakStrongTie(ctng)
-    else:
-      self.SSDinfo = ""
-      c0 = ctng[0]
-
-    return c0
+    return ctng
 
   def countBallots(self):
     "Count the votes using Condorcet voting."
@@ -193,15 +217,13 @@ Tie broken randomly.""" % self.b.joinList(ctng)
       if self.completion == "Schwartz Sequential Dropping":
         c0 = self.SchwartzSequentialDropping()
       elif self.completion in ["IRV on Smith Set", "Borda on Smith Set"]:
-        # Copy ballots and get rid of candidates not in Smith set
+        # View the ballots without the candidates not in Smith set
         withdrawList = []
         for c in range(self.b.numCandidates):
           if (c not in self.smithSet):
             withdrawList.append(c)
-        dirtyBallots = self.b.copy()
-        dirtyBallots.withdrawn = withdrawList
-        dirtyBallots.numSeats = 1
-        cleanBallots = dirtyBallots.getCleanBallots()
+        cleanBallots = BallotsView(self.b, withdrawList)
+        cleanBallots.numSeats = 1
         if self.completion == "IRV on Smith Set":
           self.e = IRV(cleanBallots)
           self.e.strongTieBreakMethod = self.strongTieBreakMethod
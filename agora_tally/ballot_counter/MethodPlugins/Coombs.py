@@ -43,44 +43,79 @@ candidates, then the unranked candidates share the last-place vote.</p>
     self.stopCond = ["N"]
     self.batchElimination = "None"
     self.unranked = []
+    self.unrankedVotes = []
+    self.unrankedShare = []
+    self.scale = 1
+    self.last = []
+    self.lastVotes = []
+    self.lastWeight = []
 
   def preCount(self):
     NoSurplusSTV.preCount(self)
     
-    # Create data structures for speeding up mostLast()
+    # Create data structures for speeding up mostLast().  unranked[i] lists
+    # the candidates not ranked on ballot i and unrankedVotes[c] the ballots
+    # not ranking c, whose shares of the last place votes add up to
+    # unrankedShare[c].  Shares are scaled by a multiple of every possible
+    # number of unranked candidates so that they are exact.  Ballots with
+    # no unranked candidates left are in lastVotes[c], where c is the
+    # candidate at position last[i], with their total weight in
+    # lastWeight[c].
+    n = self.b.numCandidates
+    self.scale = 1
+    for k in range(2, n + 1):
+      (a, b) = (self.scale, k)
+      while b > 0:
+        (a, b) = (b, a % b)
+      self.scale = self.scale * k // a
     self.unranked = [None] * self.b.numWeightedBallots
+    self.unrankedVotes = [[] for c in range(n)]
+    self.unrankedShare = [0] * n
+    self.last = [0] * self.b.numWeightedBallots
+    self.lastVotes = [[] for c in range(n)]
+    self.lastWeight = [0] * n
     for i in range(self.b.numWeightedBallots):
-      u = []
-      b = self.b.getWeightedBallot(i)[1]
-      for c in self.continuing:
-        if c in b: 
-          continue
-        u.append(c)
+      weight, b = self.b.getWeightedBallot(i)
+      ranked = set(b)
+      u = [c for c in self.continuing if c not in ranked]
       self.unranked[i] = u
-    
+      self.last[i] = len(b) - 1
+      if len(u) == 0:
+        self.addLast(i, weight)
+        continue
+      share = weight * self.scale // len(u)
+      for c in u:
+        self.unrankedVotes[c].append(i)
+        self.unrankedShare[c] += share
+
+  def addLast(self, i, weight):
+    "Give the last place vote of a ballot to its last continuing candidate."
+    blt = self.b.getWeightedBallot(i)[1]
+    while self.last[i] > 0 and blt[self.last[i]] not in self.continuing:
+      self.last[i] -= 1
+    c = blt[self.last[i]]
+    self.lastVotes[c].append(i)
+    self.lastWeight[c] += weight
+
   def mostLast(self):
     "Count the number of last-place votes per candidate."
 
     desc = ""
 
+    # Move the last place votes of candidates no longer continuing
+    for c in range(self.b.numCandidates):
+      if c not in self.continuing and len(self.lastVotes[c]) > 0:
+        votes = self.lastVotes[c]
+        self.lastVotes[c] = []
+        self.lastWeight[c] = 0
+        for i in votes:
+          self.addLast(i, self.b.getWeight(i))
+
     # Count last place votes per candidate
-    total = [0] * self.b.numCandidates
-    for i in range(self.b.numWeightedBallots):
-      nUnranked = len(self.unranked[i])
-      weight, blt = self.b.getWeightedBallot(i)
-      # If no unranked cands, last place candidate gets the vote
-      if nUnranked == 0:
-        ballot = blt[:]
-        ballot.reverse()
-        for c in ballot:
-          if c in self.continuing:
-            break
-        total[c] += weight
-      # Otherwise unranked cands share the last place vote
-      else:
-        share = 1.0 * weight / nUnranked
-        for c in self.unranked[i]:
-          total[c] += share
+    # Unranked cands share the last place vote of a ballot, otherwise the
+    # last place candidate gets the vote
+    total = [self.lastWeight[c] * self.scale + self.unrankedShare[c]
+             for c in range(self.b.numCandidates)]
 
     # Resolve ties
     ctng = list(self.continuing)
@@ -93,17 +128,29 @@ candidates, then the unranked candidates share the last-place vote.</p>
       (c0, desc2) = self.breakStrongTie(ctng[:numTied])
       desc += desc2
 
-    desc += "Last place votes: "
-    ctng.sort()
-    for c in ctng[:-1]:
-      desc += "%s, %f; "  % (self.b.names[c], total[c])
-    c = ctng[-1] 
-    desc += "and %s, %f. "  % (self.b.names[c], total[c])
+    if self.narrative:
+      desc += "Last place votes: "
+      ctng.sort()
+      for c in ctng[:-1]:
+        desc += "%s, %f; "  % (self.b.names[c], 1.0 * total[c] / self.scale)
+      c = ctng[-1] 
+      desc += "and %s, %f. "  % (self.b.names[c], 1.0 * total[c] / self.scale)
 
     # Update data structures
-    for i in range(self.b.numWeightedBallots):
-      if c0 in self.unranked[i]: 
-        self.unranked[i].remove(c0)
+    # Only the ballots not ranking c0 are affected
+    for i in self.unrankedVotes[c0]:
+      weight = self.b.getWeight(i)
+      u = self.unranked[i]
+      u.remove(c0)
+      if len(u) == 0:
+        self.addLast(i, weight)
+        continue
+      change = weight * self.scale // len(u) - \
+               weight * self.scale // (len(u) + 1)
+      for c in u:
+        self.unrankedShare[c] += change
+    self.unrankedVotes[c0] = []
+    self.unrankedShare[c0] = 0
 
     return (c0, desc)
 
@@ -530,17 +530,18 @@ adequately represent the electorate until the next election.
     self.S = 0
     self.stages = []    # Stores rounds for each stage
                         # [ [0] [1] [2] [3 4] [5] ... ]
+    self.stageOfRound = []  # Stores the stage of each round
 
   def postCount(self):
     GregorySTV.postCount(self)
     self.numStages = self.S+1
+    self.stageOfRound = []
+    for s, rounds in enumerate(self.stages):
+      self.stageOfRound.extend([s] * len(rounds))
   
   def roundToStage(self, r):
     "Return the stage corresponding to a given round."
-    for s in range(len(self.stages)):
-      if r in self.stages[s]: 
-        return s
-    assert(0)
+    return self.stageOfRound[r]
 
   def allocateRound(self):
     "Add quota allocation."
@@ -650,15 +651,14 @@ adequately represent the electorate until the next election.
     for loser in cList:
       for i in self.votes[loser]:
         v = self.transferValue[i]
-        if v not in self.votesByTransferValue.keys():
-          self.votesByTransferValue[v] = []
-        self.votesByTransferValue[v].append(i)
+        self.votesByTransferValue.setdefault(v, []).append(i)
 
-    self.transferValues = self.votesByTransferValue.keys()
-    self.transferValues.sort(reverse=True)
+    self.transferValues = sorted(self.votesByTransferValue, reverse=True)
 
   def describeRound(self, nonFinalSubstage=False):
-    
+
+    if not self.narrative:
+      return
     if self.roundInfo[self.R]["action"][0] == "first":
       text = "Count of first choices. "
     elif self.roundInfo[self.R]["action"][0] == "surplus":
@@ -696,10 +696,11 @@ adequately represent the electorate until the next election.
       # This will happen when all eliminated candidates have 0 votes
       self.updateRound()
       self.updateWinners()
-      self.roundInfo[self.R]["eliminate"] += \
-          "Count after eliminating %s. No votes are "\
-          "transferred since all eliminated candidates "\
-          "have zero votes. " % self.b.joinList(elimList)
+      if self.narrative:
+        self.roundInfo[self.R]["eliminate"] += \
+            "Count after eliminating %s. No votes are "\
+            "transferred since all eliminated candidates "\
+            "have zero votes. " % self.b.joinList(elimList)
       self.describeRound()
     else:
       for i, v in enumerate(self.transferValues):
@@ -709,11 +710,12 @@ adequately represent the electorate until the next election.
           self.roundInfo[self.R]["eliminate"] = ""
           self.roundInfo[self.R]["action"] = self.roundInfo[self.R-1]["action"]
           self.stages[self.S].append(self.R)
-        self.roundInfo[self.R]["eliminate"] += \
-            "Count after substage %d of %d of eliminating "\
-            "%s. Transferred votes with value %s. "\
-            % (i+1, nTransferValues, self.b.joinList(elimList),
-               self.displayValue(v))
+        if self.narrative:
+          self.roundInfo[self.R]["eliminate"] += \
+              "Count after substage %d of %d of eliminating "\
+              "%s. Transferred votes with value %s. "\
+              % (i+1, nTransferValues, self.b.joinList(elimList),
+                 self.displayValue(v))
         self.transferVotesWithValue(v)
         self.updateRound()
         self.describeRound(i+1 < nTransferValues)
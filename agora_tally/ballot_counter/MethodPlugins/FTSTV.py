@@ -14,7 +14,6 @@
 
 __revision__ = "$Id: FTSTV.py 715 2010-02-27 17:00:55Z jeff.oneill $"
 
-import string
 
 from agora_tally.ballot_counter.STV import WeightedInclusiveSTV
 from agora_tally.ballot_counter.plugins import MethodPlugin
@@ -88,5 +87,5 @@ set to "Batch".
     WeightedInclusiveSTV.preCount(self)
 
     self.optionsMsg = "Using a %s threshold." % \
-                      string.join(self.threshName, "-")
+                      "-".join(self.threshName)
     
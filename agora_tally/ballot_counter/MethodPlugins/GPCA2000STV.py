@@ -62,4 +62,5 @@ for the rationale.</p>
   def updateCandidateStatus(self):
     "Update candidate status at end of election."
 
-    self.newLosers(list(self.continuing))
+    if len(self.continuing) > 0:
+      self.newLosers(list(self.continuing))
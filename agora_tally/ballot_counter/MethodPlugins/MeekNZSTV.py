@@ -98,7 +98,7 @@ number generator for breaking ties.</p>
     MeekSTV.preCount(self)
     self.strongTieBreakMethod = "random" # documentation only; we override breakStrongTie()
 
-    self.surplusLimit = self.p / 10000	# 0.0001 per clause 13
+    self.surplusLimit = self.p // 10000	# 0.0001 per clause 13
     # initialize PRNG per clause 42
     prng = MeekNZSTV.NZprng(c=self.b.numCandidates, n=self.numSeats, v=self.b.numBallots)
     for c in self.continuing:
@@ -111,19 +111,21 @@ number generator for breaking ties.</p>
   #  This is a variation on MeekSTV.treeCount that rounds up
   #  keep factors per NZ clause 10
   #
-  def updateCount(self, tree=None, remainder=None):
-    "Traverse the tree to count the ballots."
-
-    if tree is None:
-      tree = self.tree
-    if remainder is None:
-      remainder = self.p
-
-    # Iterate over the next candidates on the ballots
-    for c in tree.keys():
-      if c == "n" or c == "bi":
+  def updateCount(self):
+    "Sweep the tree to count the ballots."
+
+    count = self.count[self.R]
+    keepFactor = self.keepFactor[self.R]
+    remainder = [0] * len(self.tree)
+    remainder[0] = self.p
+
+    # Parents come before their children, so the remainder left on the
+    # ballots of a node is known when the node is reached
+    for k, c, parent, n in self.tree.nodes():
+      rrr = remainder[parent]
+      # If ballot used up, nothing left to allocate
+      if rrr == 0:
         continue
-      rrr = remainder
       #
       #  allocate votes for this ballot
       #
@@ -133,27 +135,25 @@ number generator for breaking ties.</p>
       if method == "hill":
         # this appears to produce results consistent with David Hill's implementation
         # and (presumably) the NZ STV Calculator
-        keep, rem = divmod(rrr * self.keepFactor[self.R][c], self.p)
+        keep, rem = divmod(rrr * keepFactor[c], self.p)
         if rem > 0:
           keep += 1   # round up per clause 10
-        self.count[self.R][c] += keep * tree[c]["n"]  # times ballot count
+        count[c] += keep * n  # times ballot count
         rrr -= keep
       elif method == "nz":
         # this is the method according to NZ Schedule 1A clause 10
-        keep, rem = divmod(rrr * self.keepFactor[self.R][c], self.p)
+        keep, rem = divmod(rrr * keepFactor[c], self.p)
         if rem > 0:
           keep += 1   # round up per clause 10
-        self.count[self.R][c] += keep * tree[c]["n"]  # times ballot count
-        rrr, rem = divmod(rrr * (1 - self.keepFactor[self.R][c]), self.p)
+        count[c] += keep * n  # times ballot count
+        rrr, rem = divmod(rrr * (1 - keepFactor[c]), self.p)
         if rem > 0:
           rrr += 1    # round up per clause 10
       else:
         # this is the method used by MeekSTV.py
-        self.count[self.R][c] += rrr * self.keepFactor[self.R][c] * tree[c]["n"] / self.p
-        rrr = rrr * (self.p - self.keepFactor[self.R][c]) / self.p
-      # If ballot not used up, keep going
-      if rrr > 0:
-        self.updateCount(tree[c], rrr)
+        count[c] += rrr * keepFactor[c] * n // self.p
+        rrr = rrr * (self.p - keepFactor[c]) // self.p
+      remainder[k] = rrr
 
   def inInfiniteLoop(self):
     "Detect hangs by looking for at keep factor changes"
@@ -275,17 +275,22 @@ number generator for breaking ties.</p>
           if rem > 0:
             kf += 1
         self.keepFactor[self.R][c] = kf
-        winners.append("%s, %s" % (self.b.names[c],
-                                  self.displayValue(self.keepFactor[self.R][c])))
+        if self.narrative:
+          winners.append("%s, %s" % (self.b.names[c],
+                                    self.displayValue(self.keepFactor[self.R][c])))
       else:
         self.keepFactor[self.R][c] = self.keepFactor[self.R-1][c]
 
+    if not self.narrative:
+      return ""
     if len(self.winners) != 0:
       desc += self.b.joinList(winners, convert="none") + ". "
     return desc
 
   def describeRound(self):
     "Update message for this round"
+    if not self.narrative:
+      return
     if self.roundInfo[self.R]["action"][0] == "first":
       text = "Count of first choices. "
     elif "surplus" in self.roundInfo[self.R] and \
@@ -306,12 +311,14 @@ number generator for breaking ties.</p>
     "Count the ballots using NZ Meek STV."
 
     # Count first place votes
-    self.allocateRound()
-    self.initialVoteTally()
-    self.updateRound()
-    self.describeRound()
+    if not self.resumed:
+      self.allocateRound()
+      self.initialVoteTally()
+      self.updateRound()
+      self.describeRound()
 
     while (not self.electionOver()):
+      self.checkpointRound(self.R + 1)
       self.R += 1
       self.allocateRound()
       self.eliminateCandidates()
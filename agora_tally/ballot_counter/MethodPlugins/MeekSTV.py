@@ -15,6 +15,7 @@
 __revision__ = "$Id: MeekSTV.py 715 2010-02-27 17:00:55Z jeff.oneill $"
 
 from agora_tally.ballot_counter.STV import RecursiveSTV
+from agora_tally.ballot_counter.qx import QXArray
 from agora_tally.ballot_counter.plugins import MethodPlugin
 
 ##################################################################
@@ -43,25 +44,44 @@ transferred as if the candidate never entered the election.</p>
     MethodPlugin.__init__(self)
     self.createGuiOptions(["prec", "thresh0", "thresh1", "thresh2"])
     
-  def updateCount(self, tree=None, remainder=None):
-    "Traverse the tree to count the ballots."
-    
-    if tree is None: 
-      tree = self.tree
-    if remainder is None: 
-      remainder = self.p
+  def updateCount(self):
+    "Sweep the tree to count the ballots."
+
+    if self.tree.vectorized():
+      self.updateCountByLevels()
+      return
     
-    # Iterate over the next candidates on the ballots
+    # remainder[k] is the portion of a vote left after the candidates on
+    # the path to node k have taken their share.  Parents come before their
+    # children so the remainders are known when they are needed.
     count = self.count[self.R]
     keepFactor = self.keepFactor[self.R]
     p = self.p
-    updateCount = self.updateCount
-    for c in tree:
-      if c == "n" or c == "bi": 
+    remainder = [0] * len(self.tree)
+    remainder[0] = p
+    for k, c, parent, n in self.tree.nodes():
+      rrr = remainder[parent]
+      # If ballot used up, nothing left for this node and below
+      if rrr == 0:
         continue
-      rrr = remainder
-      count[c] += rrr * keepFactor[c] * tree[c]["n"] / p
-      rrr = rrr * (self.p - keepFactor[c]) / p
-      # If ballot not used up, keep going
-      if rrr > 0:
-        updateCount(tree[c], rrr)
+      count[c] += rrr * keepFactor[c] * n // p
+      remainder[k] = rrr * (p - keepFactor[c]) // p
+
+  def updateCountByLevels(self):
+    "Sweep the tree one level at a time, with the same rounding."
+
+    p = self.p
+    keepFactor = QXArray.array(self.keepFactor[self.R])
+    total = QXArray.zeros(self.b.numCandidates, p * self.b.numBallots)
+    remainder = QXArray.zeros(len(self.tree), p)
+    remainder[0] = p
+    for nodes, candidates, parents, weights in self.tree.getLevels():
+      rrr = remainder[parents]
+      kf = keepFactor[candidates]
+      QXArray.addAt(total, candidates,
+                    QXArray.mulDiv(QXArray.mul(rrr, weights), kf, p))
+      remainder[nodes] = QXArray.mulDiv(rrr, QXArray.sub(p, kf), p)
+
+    count = self.count[self.R]
+    for c in range(self.b.numCandidates):
+      count[c] += int(total[c])
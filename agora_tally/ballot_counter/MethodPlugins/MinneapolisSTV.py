@@ -64,15 +64,17 @@ condition, consistent with mathematical impossibility.</p>
     # Transfer all of the votes at a fraction of their value
     surplus = self.count[self.R-1][cSurplus] - self.thresh[self.R-1]
     # Calculate surplus fraction to specified precision
-    surplusFraction = (surplus * self.p)/self.count[self.R-1][cSurplus]
-    for i in self.votes[cSurplus][:]:
-      self.transferValue[i] = self.transferValue[i] * surplusFraction / self.p
-      c = self.b.getTopChoiceFromWeightedBallot(i, self.continuing)
+    surplusFraction = (surplus * self.p)//self.count[self.R-1][cSurplus]
+    for i in list(self.votes[cSurplus]):
+      self.transferValue[i] = self.transferValue[i] * surplusFraction // self.p
+      c = self.cursors.getTopChoiceFromWeightedBallot(i, self.continuing)
       if c is not None:
-        self.votes[c].append(i)
+        self.giveVote(c, i)
 
-    self.votes[cSurplus] = []
-    
+    self.votes.clear(cSurplus)
+
+    if not self.narrative:
+      return ""
     desc = "Count after transferring surplus votes from %s with a transfer "\
          "value of %s/%s. " % \
          (self.b.names[cSurplus], 
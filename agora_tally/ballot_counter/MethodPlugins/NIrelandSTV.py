@@ -448,21 +448,16 @@ of votes shall be made.
     for loser in cList:
       for i in self.votes[loser]:
         v = self.transferValue[i]
-        if i in self.batches[loser][0]:
+        if self.batches.inBatch(loser, 0, i):
           key = "first"
         else:
           key = v
-        if key not in self.votesByTransferValue.keys():
-          self.votesByTransferValue[key] = []
-        self.votesByTransferValue[key].append(i)
-
-    self.transferValues = self.votesByTransferValue.keys()
-    if "first" in self.transferValues:
-      self.transferValues.remove("first")
-      self.transferValues.sort(reverse=True)
+        self.votesByTransferValue.setdefault(key, []).append(i)
+
+    self.transferValues = sorted([v for v in self.votesByTransferValue
+                                  if v != "first"], reverse=True)
+    if "first" in self.votesByTransferValue:
       self.transferValues.insert(0, "first")
-    else:
-      self.transferValues.sort(reverse=True)      
 
   def transferVotesFromCandidates(self, elimList):
     elimList.sort()
@@ -471,15 +466,17 @@ of votes shall be made.
       # This will happen when all eliminated candidates have 0 votes
       self.updateRound()
       self.updateWinners()
-      self.roundInfo[self.R]["eliminate"] += \
-          "Count after eliminating %s. No votes are "\
-          "transferred since all eliminated candidates "\
-          "have zero votes. " % self.b.joinList(elimList)
+      if self.narrative:
+        self.roundInfo[self.R]["eliminate"] += \
+            "Count after eliminating %s. No votes are "\
+            "transferred since all eliminated candidates "\
+            "have zero votes. " % self.b.joinList(elimList)
       self.describeRound()
     else:
-      self.roundInfo[self.R]["eliminate"] += \
-          "Count after eliminating %s and transferring "\
-          "votes. " % self.b.joinList(elimList)
+      if self.narrative:
+        self.roundInfo[self.R]["eliminate"] += \
+            "Count after eliminating %s and transferring "\
+            "votes. " % self.b.joinList(elimList)
       for v in self.transferValues:
         self.transferVotesWithValue(v)
         self.updateRound()
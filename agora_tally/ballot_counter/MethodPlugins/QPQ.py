@@ -14,9 +14,14 @@
 
 __revision__ = "$Id: QPQ.py 715 2010-02-27 17:00:55Z jeff.oneill $"
 
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
 from agora_tally.ballot_counter.STV import Iterative
 from agora_tally.ballot_counter.plugins import MethodPlugin
-from agora_tally.ballot_counter.qx import QX
+from agora_tally.ballot_counter.qx import QX, QXArray
 
 ##  Procedure (from Woodall paper http://www.votingmatters.org.uk/ISSUE17/I17P1.PDF)
 ##
@@ -47,8 +52,12 @@ class QPQ(Iterative, MethodPlugin):
   longMethodName = "Quota Preferential by Quotient"
   onlySingleWinner = False
   threshMethod = True
+  exactTies = False
   status = 2
 
+  # Number of ballots looked at at once when finding top choices
+  rowsPerChunk = 1 << 16
+
   htmlBody = """
 <p>Quota Preferential by Quotient (QPQ) is a proportional system
 that, like STV, meets the <i>Droop proportionality criterion</i>.</p>
@@ -79,7 +88,16 @@ that, like STV, meets the <i>Droop proportionality criterion</i>.</p>
     self.tx = []         # tx[r] is contribution of inactive ballots at round r
     self.thresh = []     # thresh[r] is the winning quota at round r
     self.votes = []      # votes[c] stores the indices of all votes for candidate c.
+    self.contrib = []    # contrib[i] is the contribution of weighted ballot i
     self.restart = False
+    # With numpy, the ballots are stored as arrays instead of piles:
+    # holder[i] is the hopeful candidate of weighted ballot i, or -1,
+    # and rankings[i] lists its rankings padded with numCandidates.
+    self.arrays = False
+    self.holder = None
+    self.rankings = None
+    self.weights = None
+    self.fixedWeights = None
 
   def preCount(self):
     "QPQ pre-count"
@@ -96,6 +114,47 @@ that, like STV, meets the <i>Droop proportionality criterion</i>.</p>
     for c in range(self.b.numCandidates):
       self.votes.append([])
 
+    self.arrays = QXArray.available()
+    if self.arrays:
+      self.buildRankings()
+
+  def buildRankings(self):
+    "Store the ballots as arrays."
+
+    n = self.b.numCandidates
+    ballots = [self.b.getWeightedBallot(i)[1]
+               for i in range(self.b.numWeightedBallots)]
+    width = max([len(ballot) for ballot in ballots] + [1])
+    self.rankings = numpy.full((len(ballots), width), n,
+                               numpy.int16 if n < 2**15 - 1 else numpy.int32)
+    for i, ballot in enumerate(ballots):
+      self.rankings[i, :len(ballot)] = ballot
+    self.weights = QXArray.array([self.b.getWeight(i)
+                                  for i in range(self.b.numWeightedBallots)])
+    self.fixedWeights = QXArray.fix(self.weights)
+
+  def topChoices(self, ballots):
+    """Return the top choice among continuing candidates of each of an array
+    of weighted ballots, or -1 for ballots without any."""
+
+    hopeful = numpy.zeros(self.b.numCandidates + 1, bool)
+    hopeful[list(self.continuing)] = True
+    top = numpy.full(len(ballots), -1, numpy.int64)
+    for start in range(0, len(ballots), QPQ.rowsPerChunk):
+      ranked = self.rankings[ballots[start:start+QPQ.rowsPerChunk]]
+      rows = numpy.arange(len(ranked))
+      isHopeful = hopeful[ranked]
+      first = isHopeful.argmax(axis=1)
+      top[start:start+len(ranked)] = numpy.where(isHopeful[rows, first],
+                                                 ranked[rows, first], -1)
+    return top
+
+  def setContributions(self, ballots, values):
+    "Set the contributions of an array of weighted ballots."
+    if values.dtype == object and self.contrib.dtype != object:
+      self.contrib = self.contrib.astype(object)
+    self.contrib[ballots] = values
+
   def displayValue(self, value):
     "Format a value with specified precision."
 
@@ -104,6 +163,7 @@ that, like STV, meets the <i>Droop proportionality criterion</i>.</p>
   def allocateRound(self):
     "Allocate space for all data structures for one round."
 
+    self.startRoundSpan()
     self.msg.append("")
     self.roundInfo.append({})
     self.vc.append([0] * self.b.numCandidates)
@@ -158,11 +218,17 @@ that, like STV, meets the <i>Droop proportionality criterion</i>.</p>
       desc = self.newWinners([cWin])
       self.roundInfo[self.R]["action"] = ("surplus", [cWin])
       # distribute ballots to next choice
-      for i in self.votes[cWin][:]:
-        self.b.contrib[i] = self.b.getWeight(i) * QX.div(QX.One, self.count[self.R][cWin])
-        c = self.b.getTopChoiceFromWeightedBallot(i, self.continuing)
-        if c is not None:
-          self.votes[c].append(i)
+      share = QX.div(QX.One, self.count[self.R][cWin])
+      if self.arrays:
+        held = numpy.flatnonzero(self.holder == cWin)
+        self.setContributions(held, QXArray.mul(self.weights[held], share))
+        self.holder[held] = self.topChoices(held)
+      else:
+        for i in self.votes[cWin][:]:
+          self.contrib[i] = self.b.getWeight(i) * share
+          c = self.b.getTopChoiceFromWeightedBallot(i, self.continuing)
+          if c is not None:
+            self.votes[c].append(i)
       self.votes[cWin] = []
     else:
       # if no winner, exclude one candidate
@@ -170,10 +236,14 @@ that, like STV, meets the <i>Droop proportionality criterion</i>.</p>
       self.roundInfo[self.R]["action"] = ("eliminate", elimList)
       cLose = elimList[0]
       # distribute ballots to next choice
-      for i in self.votes[cLose][:]:
-        c = self.b.getTopChoiceFromWeightedBallot(i, self.continuing)
-        if c is not None:
-          self.votes[c].append(i)
+      if self.arrays:
+        held = numpy.flatnonzero(self.holder == cLose)
+        self.holder[held] = self.topChoices(held)
+      else:
+        for i in self.votes[cLose][:]:
+          c = self.b.getTopChoiceFromWeightedBallot(i, self.continuing)
+          if c is not None:
+            self.votes[c].append(i)
       self.votes[cLose] = []
       self.restart = self.optRestart
     return desc
@@ -195,12 +265,16 @@ that, like STV, meets the <i>Droop proportionality criterion</i>.</p>
     "Find initial first place votes."
 
     # Allocate ballots to candidates based on the first choices.
-    self.b.contrib = []
-    for i in range(self.b.numWeightedBallots):
-      c = self.b.getTopChoiceFromWeightedBallot(i, self.continuing)
-      if c is not None:
-        self.votes[c].append(i)
-      self.b.contrib.append(0)
+    if self.arrays:
+      self.holder = self.topChoices(numpy.arange(self.b.numWeightedBallots))
+      self.contrib = QXArray.zeros(self.b.numWeightedBallots, 0)
+    else:
+      self.contrib = []
+      for i in range(self.b.numWeightedBallots):
+        c = self.b.getTopChoiceFromWeightedBallot(i, self.continuing)
+        if c is not None:
+          self.votes[c].append(i)
+        self.contrib.append(0)
     self.roundInfo[self.R]["action"] = ("first", [])
 
   def restartVoteTally(self):
@@ -221,17 +295,31 @@ that, like STV, meets the <i>Droop proportionality criterion</i>.</p>
     "Update quotients."
 
     # Count contribution of all ballots (will eventually subtract active contributions)
-    for i in range(self.b.numWeightedBallots):
-      self.tx[self.R] += self.b.contrib[i]
-
     # Count number (vc) and contribution (tc) of active ballots (ranking hopeful candidates);
+    if self.arrays:
+      self.tx[self.R] += QXArray.sum(self.contrib)
+      active = self.holder >= 0
+      holders = self.holder[active]
+      vc = QXArray.groupSum(self.fixedWeights[active], holders,
+                            self.b.numCandidates)
+      tc = QXArray.groupSum(self.contrib[active], holders,
+                            self.b.numCandidates)
+    else:
+      for i in range(self.b.numWeightedBallots):
+        self.tx[self.R] += self.contrib[i]
+      vc = [0] * self.b.numCandidates
+      tc = [0] * self.b.numCandidates
+      for c in range(self.b.numCandidates):
+        for i in self.votes[c]:
+          vc[c] += QX.fix(self.b.getWeight(i))
+          tc[c] += self.contrib[i]
+
     # Calculate quotient for each hopeful candidate (qc=count)
     # Count total number of active ballots (va)
     # Adjust tx.
     for c in range(self.b.numCandidates):
-      for i in self.votes[c]:
-        self.vc[self.R][c] += QX.fix(self.b.getWeight(i))
-        self.tc[self.R][c] += self.b.contrib[i]
+      self.vc[self.R][c] += vc[c]
+      self.tc[self.R][c] += tc[c]
       self.count[self.R][c] = QX.div(self.vc[self.R][c], QX.One + self.tc[self.R][c])
       self.va[self.R] += self.vc[self.R][c]
       self.tx[self.R] -= self.tc[self.R][c]
@@ -245,6 +333,7 @@ that, like STV, meets the <i>Droop proportionality criterion</i>.</p>
     # Do the rounds...
     while (not self.electionOver()):
 
+      self.checkpointRound(self.R)
       self.allocateRound()
       if (self.R == 0):
         self.initialVoteTally()
@@ -14,7 +14,8 @@
 
 __revision__ = "$Id: RTSTV.py 715 2010-02-27 17:00:55Z jeff.oneill $"
 
-import string
+
+from itertools import islice
 
 from agora_tally.ballot_counter.STV import OrderDependentSTV
 from agora_tally.ballot_counter.plugins import MethodPlugin
@@ -79,19 +80,22 @@ set to "Batch".
     OrderDependentSTV.preCount(self)
 
     self.optionsMsg = "Using a %s threshold." % \
-                      string.join(self.threshName, "-")
+                      "-".join(self.threshName)
     
   def transferSurplusVotesFromCandidate(self, cSurplus):
     "Transfer surplus votes with random transfer rules."
 
     # transfer whole votes in excess of the threshold
     surplus = int(self.count[self.R-1][cSurplus] - self.thresh[self.R-1])
-    for i in self.votes[cSurplus][:surplus]:
-      c = self.b.getTopChoiceFromBallot(i, self.continuing)
-      self.votes[cSurplus].remove(i)
+    for i in list(islice(self.votes[cSurplus], surplus)):
+      c = self.cursors.getTopChoiceFromBallot(i, self.continuing)
       if c != None:
-        self.votes[c].append(i)
+        self.votes.add(c, i)
+      else:
+        self.votes.remove(i)
 
+    if not self.narrative:
+      return ""
     desc = "Count after transferring surplus votes from %s. " \
          % self.b.names[cSurplus]
     return desc
@@ -101,13 +105,15 @@ set to "Batch".
 
     # Transfer whole votes from losers.
     for loser in elimList:
-      for i in self.votes[loser]:
-        c = self.b.getTopChoiceFromBallot(i, self.continuing)
+      for i in list(self.votes[loser]):
+        c = self.cursors.getTopChoiceFromBallot(i, self.continuing)
         if c != None:
-          self.votes[c].append(i)
-      self.votes[loser] = []
+          self.votes.add(c, i)
+      self.votes.clear(loser)
 
     elimList.sort()
+    if not self.narrative:
+      return ""
     desc = "Count after eliminating %s and transferring votes. " \
           % self.b.joinList(elimList)
     return desc
@@ -15,6 +15,7 @@
 __revision__ = "$Id: WarrenSTV.py 715 2010-02-27 17:00:55Z jeff.oneill $"
 
 from ..STV import RecursiveSTV
+from ..qx import QXArray
 from ..plugins import MethodPlugin
 
 ##################################################################
@@ -40,25 +41,44 @@ in a different way.</p>
 
     self.createGuiOptions(["prec", "thresh0", "thresh1", "thresh2"])
 
-  def updateCount(self, tree=None, remainder=None):
-    "Traverse the tree to count the ballots."
-    
-    if tree is None: 
-      tree = self.tree
-    if remainder is None: 
-      remainder = self.p
+  def updateCount(self):
+    "Sweep the tree to count the ballots."
+
+    if self.tree.vectorized():
+      self.updateCountByLevels()
+      return
     
-    # Iterate over the next candidates on the ballots
-    for c in tree.keys():
-      if c == "n" or c == "bi": 
+    # remainder[k] is the portion of a vote left after the candidates on
+    # the path to node k have taken their share.
+    count = self.count[self.R]
+    keepFactor = self.keepFactor[self.R]
+    remainder = [0] * len(self.tree)
+    remainder[0] = self.p
+    for k, c, parent, n in self.tree.nodes():
+      rrr = remainder[parent]
+      if rrr == 0:
         continue
-      rrr = remainder
-      if self.keepFactor[self.R][c] < rrr:
-        self.count[self.R][c] += self.keepFactor[self.R][c] * tree[c]["n"]
-        rrr -= self.keepFactor[self.R][c]
+      if keepFactor[c] < rrr:
+        count[c] += keepFactor[c] * n
+        remainder[k] = rrr - keepFactor[c]
       else:
-        self.count[self.R][c] += rrr * tree[c]["n"]
-        rrr = 0
-      # If ballot not used up and more candidates, keep going
-      if rrr > 0:
-        self.updateCount(tree[c], rrr)
+        count[c] += rrr * n
+
+  def updateCountByLevels(self):
+    "Sweep the tree one level at a time."
+
+    p = self.p
+    keepFactor = QXArray.array(self.keepFactor[self.R])
+    total = QXArray.zeros(self.b.numCandidates, p * self.b.numBallots)
+    remainder = QXArray.zeros(len(self.tree), p)
+    remainder[0] = p
+    for nodes, candidates, parents, weights in self.tree.getLevels():
+      rrr = remainder[parents]
+      # Each candidate takes its keep factor, or what is left of the vote
+      take = QXArray.minimum(keepFactor[candidates], rrr)
+      QXArray.addAt(total, candidates, QXArray.mul(take, weights))
+      remainder[nodes] = rrr - take
+
+    count = self.count[self.R]
+    for c in range(self.b.numCandidates):
+      count[c] += int(total[c])
@@ -295,7 +295,7 @@ Matrix of beatpath magnitudes:
       nCol += 1 # Thresh
     # maxnSubCol is the maximum number of columns that can fit in a
     # single row.  This is used to determine how many rows we need.
-    maxnSubCol = (self.maxWidth-2)/(self.maxColWidth+1)
+    maxnSubCol = (self.maxWidth-2)//(self.maxColWidth+1)
     # nRow is the number of rows needed to display all of the columns    
     (nRow, r) = divmod(nCol, maxnSubCol)
     if r > 0: 
@@ -305,7 +305,7 @@ Matrix of beatpath magnitudes:
     if r > 0: 
       nSubCol += 1
     # colWidth is the width of a column in characters
-    colWidth = (self.maxWidth-2)/nSubCol - 1
+    colWidth = (self.maxWidth-2)//nSubCol - 1
     # width is the actual width of the table
     width = 2 + nSubCol*(colWidth+1)
 
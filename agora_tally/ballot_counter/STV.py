@@ -27,6 +27,18 @@ Class ElectionMethod
 __revision__ = "$Id: STV.py 822 2010-11-21 05:25:43Z jeff.oneill $"
 
 import random
+import copy
+import bisect
+import os
+import pickle
+from array import array
+from itertools import repeat
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+from agora_tally import instrumentation
 
 ##################################################################
 
@@ -91,6 +103,21 @@ class ElectionMethod(object):
 
     optionsMsg -- Stores test describing options used in the method for 
     reporting purposes.
+
+    narrative -- If False, the text describing the count is not produced
+    while counting.  It is produced afterwards by generateNarrative() when a
+    report needs it, by counting again from a copy of the initial state.
+
+    initialState -- The copy of the initial state saved when narrative is
+    False, with the state of the random number generator.
+
+    seed, rng -- The seed of the random number generator owned by the
+    election, used to break ties randomly.  Set it with setSeed() to make the
+    count reproducible whatever else runs in the process.  Otherwise a seed
+    is drawn from the random module when the election is run.
+
+    manualTies -- The candidates chosen when strong ties were broken
+    manually, so that the count can be replayed.
   
   """
 
@@ -99,6 +126,7 @@ class ElectionMethod(object):
   onlySingleWinner = False
   iterative = None
   threshMethod = None
+  roundSpan = None   # instrumentation span of the current round
 
   def __init__(self, b):
 
@@ -117,15 +145,92 @@ class ElectionMethod(object):
     self.p = 1
     self.guiOptions = []
     self.optionsMsg = ""
+    self.narrative = True
+    self.initialState = None
+    self.manualTies = []
+    self.replayTies = None
+    self.seed = None
+    self.rng = None
     
     self.winners = set()
     self.losers = set()
     self.continuing = set(range(self.b.numCandidates))
     
+  def setSeed(self, seed):
+    "Seed the random number generator of the election."
+    self.seed = seed
+    self.rng = random.Random(seed)
+
   def runElection(self):
-    self.preCount()
-    self.countBallots()
-    self.postCount()
+    if self.rng is None:
+      self.setSeed(random.getrandbits(64))
+    if not self.narrative:
+      self.saveInitialState()
+    args = {"method": self.methodName, "narrative": self.narrative}
+    with instrumentation.span("preCount", "count", **args):
+      self.preCount()
+    self.continueElection()
+
+  def continueElection(self):
+    "Count the ballots after preCount(), or finish a resumed count."
+    args = {"method": self.methodName, "narrative": self.narrative}
+    with instrumentation.span("countBallots", "count", **args):
+      self.countBallots()
+      self.endRoundSpan()
+    with instrumentation.span("postCount", "count", **args):
+      self.postCount()
+
+  def startRoundSpan(self):
+    "Time the rounds from the allocation of one to that of the next."
+    self.endRoundSpan()
+    self.roundSpan = instrumentation.start_span("round", "count",
+                                                method=self.methodName,
+                                                round=self.R)
+
+  def endRoundSpan(self):
+    "End the instrumentation span of the current round, if any."
+    if self.roundSpan is not None:
+      self.roundSpan.set(winners=len(self.winners),
+                         continuing=len(self.continuing))
+      self.roundSpan.end()
+      self.roundSpan = None
+
+  def saveInitialState(self):
+    "Save what is needed to count again with the narrative."
+
+    # The ballots, the queues and the random number generator are shared
+    # rather than copied
+    memo = {id(self.b): self.b,
+            id(self.breakTieRequestQueue): self.breakTieRequestQueue,
+            id(self.breakTieResponseQueue): self.breakTieResponseQueue,
+            id(self.rng): self.rng}
+    self.initialState = (copy.deepcopy(self.__dict__, memo),
+                         self.rng.getstate())
+
+  def generateNarrative(self):
+    """Produce the text describing a count run with narrative set to False.
+
+    The count is done again with the narrative from the saved initial state,
+    replaying the same random choices and manual tie breaks, and its results
+    replace those of this election.
+    """
+
+    if self.narrative or self.initialState is None:
+      return
+
+    (state, randomState) = self.initialState
+    e = copy.copy(self)
+    e.__dict__ = copy.copy(state)
+    e.narrative = True
+    e.replayTies = list(self.manualTies)
+    e.rng = random.Random()
+    e.rng.setstate(randomState)
+    e.runElection()
+
+    assert(e.winners == self.winners)
+    e.initialState = None
+    e.replayTies = None
+    self.__dict__ = e.__dict__
 
   def preCount(self):
 
@@ -233,7 +338,7 @@ Need at least %d candidates but have only %d.""" % (
     
     # Break the tie randomly.
     elif self.strongTieBreakMethod == "random":
-      c = random.choice(tiedCandidates)
+      c = self.rng.choice(tiedCandidates)
       desc = "Candidate %s was chosen by breaking the tie randomly. "\
            % self.b.names[c]
 
@@ -252,11 +357,15 @@ Need at least %d candidates but have only %d.""" % (
             "number. " % self.b.names[c]
       
     elif self.strongTieBreakMethod == "manual":
-      self.breakTieRequestQueue.put(
-        [tiedCandidates, [self.b.names[c] for c in tiedCandidates], what])
-      c = self.breakTieResponseQueue.get(True)
+      if self.replayTies is not None:
+        c = self.replayTies.pop(0)
+      else:
+        self.breakTieRequestQueue.put(
+          [tiedCandidates, [self.b.names[c] for c in tiedCandidates], what])
+        c = self.breakTieResponseQueue.get(True)
+      self.manualTies.append(c)
       if c == None:
-        c = random.choice(tiedCandidates)
+        c = self.rng.choice(tiedCandidates)
         desc = "Candidate %s was chosen by breaking the tie randomly. "\
              % self.b.names[c]
       else:
@@ -312,15 +421,235 @@ class NonIterative(ElectionMethod):
 
 ##################################################################
 
+class RoundTable(object):
+  """The values of each candidate at each round of an iterative count.
+
+  table[r][c] is the value of candidate c at round r, and a new row of zeros
+  is added with appendRow().  When the values are integers whose magnitude
+  is known not to exceed a bound that fits in 64 bits, the rows are stored
+  in preallocated blocks of machine integers, each row being a writable
+  view into a block.  Blocks are never resized, so that the rows of past
+  rounds stay valid, and each new block is twice as large as the previous
+  one.  Otherwise, for instance when the values are floats, every row is a
+  list.  Either way, reading a value returns a Python number.
+  
+  """
+
+  # Largest bound on the values that can be stored in machine integers
+  maxBound = 2**62
+  firstBlockRows = 16
+
+  def __init__(self, numColumns, bound=None):
+    self.numColumns = numColumns
+    if bound is not None and bound <= RoundTable.maxBound:
+      self.typecode = "q"
+    else:
+      self.typecode = None
+    self.rows = []
+    self.blocks = []
+    self.free = 0        # number of unused rows in the last block
+
+  def __len__(self):
+    return len(self.rows)
+
+  def __getitem__(self, r):
+    return self.rows[r]
+
+  def __setitem__(self, r, values):
+    self.rows[r][:] = array(self.typecode, values) \
+                      if self.typecode else list(values)
+
+  def __iter__(self):
+    return iter(self.rows)
+
+  def __repr__(self):
+    return repr(self.toList())
+
+  def __eq__(self, other):
+    if isinstance(other, RoundTable):
+      other = other.toList()
+    return self.toList() == other
+
+  def __ne__(self, other):
+    return not self == other
+
+  def __getstate__(self):
+    return (self.numColumns, self.typecode, self.toList())
+
+  def __setstate__(self, state):
+    (self.numColumns, self.typecode, rows) = state
+    self.rows = []
+    self.blocks = []
+    self.free = 0
+    for row in rows:
+      self.appendRow()
+      self[-1] = row
+
+  def appendRow(self):
+    "Add a row of zeros for a new round."
+    if self.typecode is None:
+      self.rows.append([0] * self.numColumns)
+      return
+    if self.free == 0:
+      if self.blocks:
+        numRows = 2 * len(self.blocks[-1]) // max(self.numColumns, 1)
+      else:
+        numRows = RoundTable.firstBlockRows
+      self.blocks.append(array(self.typecode, [0]) * 
+                         (numRows * self.numColumns))
+      self.free = numRows
+    block = memoryview(self.blocks[-1])
+    start = len(block) - self.free * self.numColumns
+    self.rows.append(block[start:start + self.numColumns])
+    self.free -= 1
+
+  def vectorized(self):
+    "Return True if the rows can be looked at as a numpy array."
+    return self.typecode is not None and numpy is not None
+
+  def newColumn(self):
+    "Return an empty sequence for one value per round, stored alike."
+    if self.typecode is None:
+      return []
+    return array(self.typecode)
+
+  def toList(self):
+    "Return the table as a list of lists."
+    return [list(row) for row in self.rows]
+
+  def toArray(self, cList=None):
+    """Return the rows so far as a numpy array of rounds by candidates,
+    restricted to the candidates in cList if given, or None if the table is
+    not vectorized."""
+
+    if not self.vectorized():
+      return None
+    arrays = []
+    numRows = len(self.rows)
+    for block in self.blocks:
+      a = numpy.frombuffer(block, numpy.int64).reshape(-1, self.numColumns)
+      a = a[:numRows]
+      numRows -= len(a)
+      if cList is not None:
+        a = a[:, cList]
+      arrays.append(a)
+    if len(arrays) == 0:
+      return numpy.zeros((0, len(cList) if cList is not None
+                          else self.numColumns), numpy.int64)
+    return numpy.concatenate(arrays)
+
+  def narrowTie(self, cList, rounds, mostfewest):
+    """Break a tie among the candidates in cList using other rounds.
+
+    The rounds are looked at in the given order and, at each one, only the
+    candidates with the most or the fewest votes stay tied.  All rounds at
+    which the tied candidates have the same values are skipped at once.
+    Returns the candidates still tied and the round at which the tie was
+    broken, or None if it was not.  The table must be vectorized.
+    """
+
+    values = self.toArray(cList)[rounds]
+    tied = numpy.arange(len(cList))
+    start = 0
+    while len(tied) > 1 and start < len(values):
+      sub = values[start:, tied]
+      differ = (sub != sub[:, :1]).any(axis=1)
+      if not differ.any():
+        break
+      r = start + int(numpy.argmax(differ))
+      row = values[r, tied]
+      best = row.min() if mostfewest == "fewest" else row.max()
+      tied = tied[row == best]
+      start = r + 1
+    cList = [cList[k] for k in tied.tolist()]
+    if len(cList) == 1:
+      return cList, rounds[r]
+    return cList, None
+
+##################################################################
+
+class Standings(object):
+  """The continuing candidates of a round ordered by their values.
+
+  The candidates are kept in a list of (value, candidate) pairs sorted in
+  increasing order, so that the candidates tied for first or last place and
+  the sure losers can be found without sorting the candidates again.  A
+  candidate who stops continuing during the round is removed with discard(),
+  which keeps the list sorted.  Values are compared exactly.
+  
+  """
+
+  def __init__(self, R, values, candidates):
+    self.R = R
+    self.value = dict((c, values[c]) for c in candidates)
+    self.order = sorted([(v, c) for (c, v) in self.value.items()])
+
+  def __len__(self):
+    return len(self.order)
+
+  def discard(self, c):
+    "Remove a candidate who is no longer continuing."
+    if c in self.value:
+      i = bisect.bisect_left(self.order, (self.value.pop(c), c))
+      del self.order[i]
+
+  def fewest(self):
+    "Return the candidates tied for last place."
+    value = self.order[0][0]
+    end = bisect.bisect_left(self.order, (value, float("inf")))
+    return [c for (_v, c) in self.order[:end]]
+
+  def most(self):
+    "Return the candidates tied for first place."
+    value = self.order[-1][0]
+    start = bisect.bisect_left(self.order, (value, -1))
+    return [c for (_v, c) in self.order[start:]]
+
+  def top(self):
+    "Return the candidate with the most votes and the lowest number."
+    return self.most()[0]
+
+  def sureLosers(self, surplus, maxNumLosers, inclusive=False):
+    """Return the largest group of candidates with the fewest votes whose
+    votes, together with the surplus, are fewer than those of the next
+    candidate, where candidates tied with each other are kept together.
+    With inclusive, having as many votes as the next candidate is enough.
+    """
+
+    losers = []
+    s = surplus
+    n = len(self.order)
+    i = 0
+    while i < n and i <= maxNumLosers:
+      value = self.order[i][0]
+      # Move to the end of the cluster of candidates tied with this one
+      j = i + 1
+      while j < n and self.order[j][0] == value:
+        j += 1
+      if j == n:
+        break
+      s += (j - i) * value
+      nextValue = self.order[j][0]
+      if (s < nextValue or (inclusive and s == nextValue)) and \
+         j <= maxNumLosers:
+        losers = self.order[:j]
+      i = j
+    return [c for (_v, c) in losers]
+
+##################################################################
+
 class Iterative(ElectionMethod):
   """Class that provides additional funcationilty for iterative methods.
 
   Attributes:
   
     count -- Contains the vote counts for candidates for each round.  
-    count[r][c] stores candidate c's vote count at round r.
+    count[r][c] stores candidate c's vote count at round r.  It is a
+    RoundTable created at the first round, when the precision of the
+    count is known.
   
-    exhausted -- A list of exhausted votes at each round.
+    exhausted -- A list of exhausted votes at each round, stored in the same
+    way as the counts.
   
     msg -- A list containing strings describing each round of the count.
   
@@ -335,6 +664,9 @@ class Iterative(ElectionMethod):
 
     R -- The number of the current round.
 
+    standings -- The continuing candidates of the round last looked at,
+    ordered by their votes.  See Standings and getStandings().
+
     numRounds -- The total number of rounds.
   
     winnersOver, winnersEven -- The union of these two is always the same as
@@ -351,11 +683,23 @@ class Iterative(ElectionMethod):
         roundInfo[r]["winners"] = "Text describing winners"
         roundInfo[r]["surplus"] = "Text describing surplus transfer"
         roundInfo[r]["eliminate"] = "Text describing candidate elimination"
+
+    checkpointInterval, checkpointPath -- When both are set, the state of the
+    count is saved to checkpointPath every checkpointInterval rounds, so that
+    the count can be resumed with loadCheckpoint() if it is interrupted.
+    Each checkpoint replaces the previous one.
+
+    header -- Identifies the count in its checkpoints: the method, its
+    options, the seed and the ballots, as they were when the count started.
+
+    resumed -- True if the count was restored from a checkpoint, in which case
+    countBallots() continues from the round after it.
   
   """
   
   iterative = True
   threshMethod = True # methods may override this
+  exactTies = True    # False when findTiedCand compares within a tolerance
 
   def __init__(self, b):
     ElectionMethod.__init__(self, b)
@@ -374,17 +718,96 @@ class Iterative(ElectionMethod):
     self.winnersOver = set() # winners who still have a surplus
     self.wonAtRound = [None] * self.b.numCandidates
     self.lostAtRound = [None] * self.b.numCandidates
+    self.standings = None
+
+    self.checkpointInterval = None
+    self.checkpointPath = None
+    self.lastCheckpoint = None # number of rounds done at the last checkpoint
+    self.resumed = False
+    self.header = None
+
+  def runElection(self):
+    if self.rng is None:
+      self.setSeed(random.getrandbits(64))
+    # Identify the count before it starts, for its checkpoints
+    if self.checkpointPath is not None and self.checkpointInterval:
+      self.header = checkpointHeader(self)
+    ElectionMethod.runElection(self)
     
   def postCount(self):
     ElectionMethod.postCount(self)
     self.numRounds = self.R+1
   
+  def countBound(self):
+    """Return a bound on the magnitude of the counts, or None if there is
+    none or the counts are not integers."""
+    return None
+
+  def createRoundTables(self):
+    "Create the storage for the values of each round."
+    self.count = RoundTable(self.b.numCandidates, self.countBound())
+    self.exhausted = self.count.newColumn()
+
+  def checkpointRound(self, roundsDone):
+    """Save a checkpoint if one is due after roundsDone rounds.
+
+    Called by countBallots() at the top of its loop over the rounds, which is
+    where a resumed count starts."""
+
+    if self.checkpointPath is None or not self.checkpointInterval or \
+       roundsDone == 0 or roundsDone == self.lastCheckpoint or \
+       roundsDone % self.checkpointInterval != 0:
+      return
+    self.lastCheckpoint = roundsDone
+    self.saveCheckpoint(self.checkpointPath)
+
+  def saveCheckpoint(self, path):
+    """Save the state of the count to a file.
+
+    Everything but the ballots is saved: the counts, the piles or tree of
+    votes, the keep factors, the winners, losers and continuing candidates
+    and the state of the random number generator.  The file is replaced
+    atomically so that a crash never leaves a partial checkpoint."""
+
+    if self.header is None:
+      self.header = checkpointHeader(self)
+    with instrumentation.span("checkpoint", "count", method=self.methodName,
+                              round=self.R):
+      tmpPath = path + ".tmp"
+      with open(tmpPath, "wb") as f:
+        CheckpointPickler(f, self).dump((self.header, self))
+      os.replace(tmpPath, path)
+
   def allocateRound(self):  
+    self.startRoundSpan()
+    if self.R == 0:
+      self.createRoundTables()
     self.msg.append("")
     self.roundInfo.append({})
-    self.count.append([0] * self.b.numCandidates)
+    self.count.appendRow()
     self.exhausted.append(0)
 
+  def getStandings(self, R):
+    """Return the standings of the continuing candidates at round R.
+
+    The counts of the current round may still change, so its standings are
+    built every time.  Those of a past round are kept until another round is
+    looked at, and candidates leaving continuing through newWinners() and
+    newLosers() are removed from them.  They are built again if continuing
+    changed in any other way.
+    """
+
+    if R >= self.R:
+      return Standings(R, self.count[R], self.continuing)
+    if not self.hasStandings(R):
+      self.standings = Standings(R, self.count[R], self.continuing)
+    return self.standings
+
+  def hasStandings(self, R):
+    "Return True if the standings of round R are kept."
+    return self.standings is not None and self.standings.R == R and \
+           R < self.R and len(self.standings) == len(self.continuing)
+
   def breakWeakTie(self, R, candidateList, mostfewest, what=""):
     """Break ties using previous rounds.
 
@@ -397,14 +820,27 @@ class Iterative(ElectionMethod):
     """
 
     assert(mostfewest in ["most", "fewest"])
-    tiedCandidates = self.findTiedCand(candidateList, mostfewest, self.count[R])
+    # Scanning the candidates is cheaper than sorting them, so the standings
+    # are only used when they have already been built for this round.
+    if candidateList is self.continuing and self.exactTies and \
+       self.hasStandings(R):
+      standings = self.standings
+      if mostfewest == "most":
+        tiedCandidates = standings.most()
+      else:
+        tiedCandidates = standings.fewest()
+    else:
+      tiedCandidates = self.findTiedCand(candidateList, mostfewest,
+                                         self.count[R])
     if len(tiedCandidates) == 1:
       return (tiedCandidates[0], "") # no tie
 
     # Let the user know what is going on.
     tiedCandidates.sort()
-    desc = "Candidates %s were tied when choosing %s. "\
-           % (self.b.joinList(tiedCandidates), what)
+    desc = ""
+    if self.narrative:
+      desc = "Candidates %s were tied when choosing %s. "\
+             % (self.b.joinList(tiedCandidates), what)
     
     # When method is "strong", we go straight to strong tie breaking.
     if self.weakTieBreakMethod == "strong":
@@ -412,16 +848,28 @@ class Iterative(ElectionMethod):
       return c, desc + desc2
 
     # When method is "forward" or "backward" we use other rounds
-    order = range(R)
+    order = list(range(R))
     if self.weakTieBreakMethod == "backward":
       order.reverse()
-    
-    if self.weakTieBreakMethod in ["forward", "backward"]:
+
+    if self.weakTieBreakMethod in ["forward", "backward"] and \
+       self.exactTies and self.count.vectorized():
+      # Look at all of the rounds at once
+      (tiedCandidates, i) = self.count.narrowTie(tiedCandidates, order,
+                                                 mostfewest)
+      if i is not None:
+        if self.narrative:
+          desc += "Candidate %s was chosen by breaking the tie at round %d. "\
+                  % (self.b.names[tiedCandidates[0]], i+1)
+        return (tiedCandidates[0], desc)
+
+    elif self.weakTieBreakMethod in ["forward", "backward"]:
       for i in order:
         tiedCandidates = self.findTiedCand(tiedCandidates, mostfewest, self.count[i])
         if len(tiedCandidates) == 1:
-          desc += "Candidate %s was chosen by breaking the tie at round %d. "\
-                  % (self.b.names[tiedCandidates[0]], i+1)
+          if self.narrative:
+            desc += "Candidate %s was chosen by breaking the tie at round %d. "\
+                    % (self.b.names[tiedCandidates[0]], i+1)
           return (tiedCandidates[0], desc)
 
     # The tie can't be broken with other rounds so do strong tie break.
@@ -437,10 +885,14 @@ class Iterative(ElectionMethod):
     for c in newWinnersList:
       assert(self.count[self.R][c] > 0)
       self.continuing.remove(c)
+      if self.standings is not None:
+        self.standings.discard(c)
       self.winnersOver.add(c)
       self.wonAtRound[c] = self.R
     self.winners = self.winnersOver | self.winnersEven
-    
+
+    if not self.narrative:
+      return ""
     if len(newWinnersList) == 1 and status == "over":
       desc = "Candidate %s has reached the threshold and is elected. "\
              % self.b.joinList(newWinnersList)
@@ -462,6 +914,8 @@ class Iterative(ElectionMethod):
     assert(len(newLosersList) > 0)
     for c in newLosersList:
       self.continuing.remove(c)
+      if self.standings is not None:
+        self.standings.discard(c)
       self.losers.add(c)
       self.lostAtRound[c] = self.R
 
@@ -491,6 +945,186 @@ class Iterative(ElectionMethod):
 
 ##################################################################
 
+# Arrays of the ballots saved as references rather than copied
+checkpointBallotArrays = ["uniqueBallots", "ballotOrder"]
+
+# Attributes of an election that change with the checkpoints rather than
+# with the way the count is run
+checkpointVolatile = ["checkpointInterval", "checkpointPath", "lastCheckpoint",
+                      "resumed"]
+
+def checkpointSettings(e):
+  """Return the settings of an election that has not started counting.
+
+  These are the attributes holding numbers, strings or lists of them, which
+  include the number of seats, the seed and the options of the method."""
+
+  scalar = (type(None), bool, int, float, str)
+  settings = {}
+  for (name, value) in vars(e).items():
+    if name in checkpointVolatile:
+      continue
+    if isinstance(value, scalar):
+      settings[name] = value
+    elif isinstance(value, (list, tuple)) and \
+         all(isinstance(x, scalar) for x in value):
+      # A copy, as some of these lists are filled during the count
+      settings[name] = list(value)
+  return settings
+
+def checkpointHeader(e):
+  "Identify a count, as it was set up, in its checkpoints."
+  return {"method": e.__class__.__name__, "settings": checkpointSettings(e),
+          "names": list(e.b.names), "numBallots": e.b.numBallots,
+          "numWeightedBallots": e.b.numWeightedBallots,
+          "digest": e.b.getDigest()}
+
+class CheckpointPickler(pickle.Pickler):
+  """Pickle an election without its ballots.
+
+  The ballots are saved as references to be replaced with the ballots given
+  when loading, and the queues and instrumentation spans are dropped."""
+
+  def __init__(self, f, e):
+    pickle.Pickler.__init__(self, f, pickle.HIGHEST_PROTOCOL)
+    self.references = {id(e.b): "ballots"}
+    if e.b.dirtyBallots is not None:
+      self.references[id(e.b.dirtyBallots)] = "dirtyBallots"
+    # The cursors keep these, which are memoryviews on shared ballots.  Views
+    # of ballots build new arrays on every access, so keep them alive while
+    # pickling for their ids not to be reused.
+    self.arrays = [getattr(e.b, name) for name in checkpointBallotArrays]
+    for (name, a) in zip(checkpointBallotArrays, self.arrays):
+      self.references[id(a)] = name
+    for obj in [e.breakTieRequestQueue, e.breakTieResponseQueue]:
+      if obj is not None:
+        self.references[id(obj)] = "none"
+
+  def persistent_id(self, obj):
+    if isinstance(obj, instrumentation.Span):
+      return "none"
+    return self.references.get(id(obj))
+
+class CheckpointUnpickler(pickle.Unpickler):
+  "Load an election pickled by CheckpointPickler with the given ballots."
+
+  def __init__(self, f, b):
+    pickle.Unpickler.__init__(self, f)
+    self.b = b
+
+  def persistent_load(self, pid):
+    if pid == "ballots":
+      return self.b
+    elif pid == "dirtyBallots":
+      return self.b.dirtyBallots
+    elif pid in checkpointBallotArrays:
+      return getattr(self.b, pid)
+    return None
+
+def loadCheckpoint(path, e):
+  """Restore the count of an election from a checkpoint.
+
+  e is the election to count, set up but not run.  The checkpoint must have
+  been saved by the same method with the same ballots, options and seed, or
+  a RuntimeError is raised.  Call continueElection() on the election
+  returned to finish the count."""
+
+  with open(path, "rb") as f:
+    (header, restored) = CheckpointUnpickler(f, e.b).load()
+  if header != checkpointHeader(e):
+    raise RuntimeError("The checkpoint %s was saved by another count." % path)
+  restored.resumed = True
+  return restored
+
+def resumeCheckpoint(path, e):
+  """Return the count of an election restored from a checkpoint, as
+  loadCheckpoint(), or None if there is no usable checkpoint at path."""
+
+  if path is None or not os.path.exists(path):
+    return None
+  try:
+    return loadCheckpoint(path, e)
+  except (RuntimeError, EOFError, pickle.UnpicklingError):
+    # Saved by another count, or unreadable; count again
+    return None
+
+##################################################################
+
+class VotePiles(object):
+  """The piles of votes held by the candidates in an STV count.
+
+  Each vote is held by at most one candidate.  votes[c] is the pile of
+  candidate c, which can be iterated in the order in which the votes were
+  received and checked for membership in constant time.  Piles must only be
+  modified with the methods below so that the holder of each vote is known.
+
+  A vote can be given with its value to the candidate, and totals[c] is the
+  sum of the values of the votes in the pile of candidate c.  The totals are
+  updated as votes move, so that reading them does not require a recount.
+
+  Votes are numbered from 0 to numVotes-1, and the holder of each vote is
+  stored in an array of 32-bit integers, with -1 for votes held by nobody.
+  
+  """
+
+  def __init__(self, numCandidates, numVotes):
+    self.piles = [{} for _c in range(numCandidates)]
+    self.holder = array("i", [-1]) * numVotes
+    self.totals = [0] * numCandidates
+
+  def __len__(self):
+    return len(self.piles)
+
+  def __getitem__(self, c):
+    return self.piles[c]
+
+  def getHolder(self, i):
+    "Return the candidate holding vote i, or None."
+    c = self.holder[i]
+    if c < 0:
+      return None
+    return c
+
+  def getValue(self, i):
+    "Return the value with which vote i is held."
+    return self.piles[self.holder[i]][i]
+
+  def add(self, c, i, value=0):
+    "Give vote i to candidate c, taking it from its previous holder."
+    d = self.holder[i]
+    if d >= 0:
+      self.totals[d] -= self.piles[d].pop(i)
+    self.piles[c][i] = value
+    self.totals[c] += value
+    self.holder[i] = c
+
+  def remove(self, i):
+    "Take vote i from the candidate holding it."
+    c = self.holder[i]
+    if c >= 0:
+      self.holder[i] = -1
+      self.totals[c] -= self.piles[c].pop(i)
+
+  def extend(self, c, votes, value=0):
+    "Give votes not held by any candidate to candidate c, all with a value."
+    pile = self.piles[c]
+    n = len(pile)
+    pile.update(zip(votes, repeat(value)))
+    holder = self.holder
+    for i in votes:
+      holder[i] = c
+    self.totals[c] += value * (len(pile) - n)
+
+  def clear(self, c):
+    "Take all of the votes from candidate c."
+    holder = self.holder
+    for i in self.piles[c]:
+      holder[i] = -1
+    self.piles[c] = {}
+    self.totals[c] = 0
+
+##################################################################
+
 class STV(Iterative):
   """Class that provides additional functionality for STV methods.
   
@@ -508,8 +1142,12 @@ class STV(Iterative):
   
     thresh -- A list contiaining the winning threshold at each round.
   
-    votes -- Contains the votes assigned to each candidate.  votes[c] is a list
-    containing the index numbers of all votes assigned to candidate c.
+    votes -- Contains the votes assigned to each candidate.  votes[c] is the
+    pile of index numbers of all votes assigned to candidate c.  See
+    VotePiles.
+
+    cursors -- Used to look up the top choice of a ballot among continuing
+    candidates.  See BallotCursors.
 
     batchElimination -- Some methods allow multiple candidates to be eliminated
     in a single round.  Allowable values are "None" (no batch elimination), 
@@ -522,6 +1160,9 @@ class STV(Iterative):
   
     firstEliminationRound -- Initially set to true.  Set to false after the
     first elimination round.
+
+    sureLosers -- The sure losers last found by getSureLosers(), with the
+    round and the state of the count they were found for.
   
   """
 
@@ -533,16 +1174,31 @@ class STV(Iterative):
     self.batchElimination = None       # must be overridden
     self.batchCutoff = None
     self.firstEliminationRound = True
+    self.sureLosers = None
     self.surplus = []    # surplus[r] is number of surplus votes
     self.thresh = []     # thresh[r] is the winning threshold
     # votes[c] stores the indices of all votes for candidate c.
-    self.votes = []
+    self.votes = None
+    self.cursors = None
 
   def preCount(self):
     Iterative.preCount(self)
-    for _c in range(self.b.numCandidates):
-      self.votes.append([])
+    self.votes = VotePiles(self.b.numCandidates, self.getNumVotes())
+    self.cursors = self.b.getCursors()
  
+  def getNumVotes(self):
+    "Return the number of votes, one for each weighted ballot."
+    return self.b.numWeightedBallots
+
+  def countBound(self):
+    "No count, threshold or surplus can exceed all of the votes."
+    return self.p * self.b.numBallots
+
+  def createRoundTables(self):
+    Iterative.createRoundTables(self)
+    self.surplus = self.count.newColumn()
+    self.thresh = self.count.newColumn()
+
   def allocateRound(self):
     "Allocate space for all data structures for one round."
     Iterative.allocateRound(self)
@@ -580,9 +1236,9 @@ class STV(Iterative):
       threshNum = self.p * self.b.numBallots - self.exhausted[self.R]
 
     if self.threshName[2] == "Whole":
-      thresh = threshNum/threshDen/self.p*self.p + self.p
+      thresh = threshNum//threshDen//self.p*self.p + self.p
     elif self.threshName[2] == "Fractional":
-      thresh = threshNum/threshDen + 1
+      thresh = threshNum//threshDen + 1
 
     self.thresh[self.R] = thresh
   
@@ -620,7 +1276,9 @@ class STV(Iterative):
     self.updateWinners()
     
   def describeRound(self):
-    
+
+    if not self.narrative:
+      return
     if self.roundInfo[self.R]["action"][0] == "first":
       text = "Count of first choices. "
     elif self.roundInfo[self.R]["action"][0] == "surplus":
@@ -683,51 +1341,42 @@ class STV(Iterative):
     raise NotImplementedError
   
   def getSureLosers(self, R=None):
-    "Return all candidates who are sure losers."
+    """Return all candidates who are sure losers.
 
-    # Return all candidates who are sure losers but do not look at previous
-    # rounds to break ties.
+    The losers of a past round are computed once for a given state of the
+    count, since they are asked for both when deciding whether to transfer a
+    surplus and when choosing the candidates to eliminate.
+    """
 
     if R is None: 
       R = self.R - 1
-      
+    if R >= self.R:
+      return self.computeSureLosers(R)
+
+    key = (R, len(self.continuing), len(self.winners), self.surplus[R])
+    if self.sureLosers is None or self.sureLosers[0] != key:
+      self.sureLosers = (key, self.computeSureLosers(R))
+    return list(self.sureLosers[1])
+
+  def computeSureLosers(self, R):
+    "Compute the sure losers at round R."
+
+    # Return all candidates who are sure losers but do not look at previous
+    # rounds to break ties.
+
     maxNumLosers = len(self.continuing) + len(self.winners) - self.numSeats
     assert(maxNumLosers < len(self.continuing))
-    losers = []
+    standings = self.getStandings(R)
 
     # If all continuing candidates have zero votes and there is no surplus
     # then they are all sure losers.
-    totalContinuingVote = sum([self.count[R][c] for c in self.continuing])
-    if totalContinuingVote == 0 and self.surplus[R] == 0:
-      losers = list(self.continuing)
-      return losers
-    
-    # We need to make sure that all candidates with the same number of votes
-    # are treated the same, so group candidates with the same number of votes
-    # together and sort clusters in order of votes (fewest first).
-    continuing = list(self.continuing)
-    continuing.sort(key=lambda a, f=self.count[R]: f[a])
-    clusteredContinuing = [[continuing[0]]]
-    for c in continuing[1:]:
-      if self.count[R][c] == self.count[R][ clusteredContinuing[-1][0] ]:
-        clusteredContinuing[-1].append(c)
-      else:
-        clusteredContinuing.append([c])
-
-    s = self.surplus[R]
-    potentialLosers = []
-    for i, cluster in enumerate(clusteredContinuing[:-1]):
-      currentClusterCount = self.count[R][ cluster[0] ]
-      nextClusterCount = self.count[R][ clusteredContinuing[i+1][0] ]
-      s += len(cluster) * currentClusterCount
-      potentialLosers += cluster
-      
-      if ((self.batchElimination != "LosersERS97" and s < nextClusterCount) or
-          (self.batchElimination == "LosersERS97" and s <= nextClusterCount))\
-         and len(potentialLosers) <= maxNumLosers:
-        losers = potentialLosers[:]
-        
-    return losers
+    if standings.order[-1][0] == 0 and self.surplus[R] == 0:
+      return [c for (_v, c) in standings.order]
+
+    # Candidates with the same number of votes are treated the same, so
+    # candidates are grouped with those tied with them.
+    return standings.sureLosers(self.surplus[R], maxNumLosers,
+                                self.batchElimination == "LosersERS97")
 
   def eliminateCandidates(self):
     (elimList, selectLosersDesc) = self.selectCandidatesToEliminate()
@@ -811,7 +1460,8 @@ class STV(Iterative):
 
     if len(self.winners) == self.numSeats:
       # All others are losers
-      self.newLosers(list(self.continuing))
+      if len(self.continuing) > 0:
+        self.newLosers(list(self.continuing))
 
     else:
       # Candidates with no votes are losers
@@ -833,14 +1483,16 @@ class STV(Iterative):
     "Count the votes with STV."
 
     # Count first place votes
-    self.allocateRound()
-    self.initialVoteTally()    
-    self.updateRound()
-    self.describeRound()
+    if not self.resumed:
+      self.allocateRound()
+      self.initialVoteTally()    
+      self.updateRound()
+      self.describeRound()
     
     # Transfer surplus votes or eliminate candidates until done
     while (not self.electionOver()):
       
+      self.checkpointRound(self.R + 1)
       self.R += 1
       self.allocateRound()
 
@@ -861,25 +1513,38 @@ class OrderDependentSTV(STV):
   dependent of the order of the ballots.  Order dependent methods must use
   individual ballots and cannot use weighted ballots.
   
-  No additional attributes.
+  Attributes:
+
+    stream -- The individual ballots in order, grouped in runs of identical
+    consecutive ballots.  See BallotStream.
   
   """
 
   def __init__(self, b):    
     STV.__init__(self, b)
+    self.stream = None
 
   def preCount(self):
     STV.preCount(self)
     assert(self.threshName[2] == "Whole")
+    self.stream = self.b.getBallotStream()
+
+  def getNumVotes(self):
+    "Return the number of votes, one for each ballot."
+    return self.b.numBallots
       
   def initialVoteTally(self):
     "Count the first place votes with order dependent rules."
 
-    # Allocate votes to candidates bases on the first choices.
-    for i in range(self.b.numBallots):
-      c = self.b.getTopChoiceFromBallot(i, self.continuing)
-      if c is not None: 
-        self.votes[c].append(i)
+    # Allocate votes to candidates bases on the first choices.  The first
+    # choice only depends on the unique ballot, and each candidate receives
+    # its ballots at once, in order.
+    topChoice = [self.cursors.getTopChoiceFromWeightedBallot(j, self.continuing)
+                 for j in range(self.b.numWeightedBallots)]
+    received = self.stream.groupBy(topChoice)
+    for c in range(self.b.numCandidates):
+      if c in received:
+        self.votes.extend(c, received[c])
 
     self.roundInfo[self.R]["action"] = ("first", [])
     
@@ -896,18 +1561,46 @@ class OrderIndependentSTV(STV):
   independent of the order of the ballots.  Order independent methods can use
   weighted ballots to speed up the count.
   
-  No additional attributes.
+  Attributes:
+
+    checkCount -- The vote totals are updated as votes are transferred
+    instead of being recounted in each round.  If this is True, they are
+    also recounted and both counts are checked to be the same.
   
   """
 
+  def __init__(self, b):
+    STV.__init__(self, b)
+    self.checkCount = False
+
+  def getVoteValue(self, i):
+    "Return the current value of vote i."
+    return self.b.getWeight(i)
+
+  def giveVote(self, c, i):
+    "Give vote i to candidate c with its current value."
+    self.votes.add(c, i, self.getVoteValue(i))
+
+  def recount(self, c):
+    "Return the vote total of candidate c summed over the pile."
+    total = 0
+    for i in self.votes[c]:
+      total += self.getVoteValue(i)
+    return total
+
+  def checkTotals(self, cList):
+    "Check that the vote totals match a recount of the piles."
+    for c in cList:
+      assert(self.votes.totals[c] == self.recount(c))
+
   def initialVoteTally(self):
     "Count the first place votes."
 
     # Allocate votes to candidates based on the first choices.
     for i in range(self.b.numWeightedBallots):
-      c = self.b.getTopChoiceFromWeightedBallot(i, self.continuing)
+      c = self.cursors.getTopChoiceFromWeightedBallot(i, self.continuing)
       if c is not None: 
-        self.votes[c].append(i)
+        self.giveVote(c, i)
     self.roundInfo[self.R]["action"] = ("first", [])
 
 ##################################################################
@@ -943,12 +1636,14 @@ class NoSurplusSTV(OrderIndependentSTV):
     "Eliminate candidates for NoSurplus methods."
 
     for loser in elimList:
-      for i in self.votes[loser]:
-        c = self.b.getTopChoiceFromWeightedBallot(i, self.continuing)
+      for i in list(self.votes[loser]):
+        c = self.cursors.getTopChoiceFromWeightedBallot(i, self.continuing)
         if c is not None:
-          self.votes[c].append(i)
-      self.votes[loser] = []
+          self.giveVote(c, i)
+      self.votes.clear(loser)
 
+    if not self.narrative:
+      return ""
     desc = "Count after eliminating %s and transferring votes. " \
          % self.b.joinList(elimList)
     return desc
@@ -960,10 +1655,47 @@ class NoSurplusSTV(OrderIndependentSTV):
   def updateCount(self):
     "Update the vote totals after a transfer of votes for NoSurplus methods."
 
-    # Recount votes for all candidates
+    # The piles keep their totals as votes are transferred
+    if self.checkCount:
+      self.checkTotals(range(self.b.numCandidates))
     for c in range(self.b.numCandidates):
-      for i in self.votes[c]:
-        self.count[self.R][c] += self.b.getWeight(i)
+      self.count[self.R][c] = self.votes.totals[c]
+
+##################################################################
+
+class TransferLog(object):
+  """The batches of votes received by each candidate in a Gregory count.
+
+  The vote indices of all of the batches are appended to a single array in
+  the order in which the batches are received, and batches[c] is the list of
+  (start, end) offsets of the batches of candidate c into that array.  The
+  offset at which each vote was last received is kept, so that the batch
+  holding a vote can be found without searching the batches.
+  
+  """
+
+  def __init__(self, numCandidates, numVotes):
+    self.entries = array("l")
+    self.batches = [[] for _c in range(numCandidates)]
+    self.position = array("l", [-1]) * numVotes
+
+  def addBatch(self, c, votes):
+    "Add a batch of votes received by candidate c."
+    start = len(self.entries)
+    self.entries.extend(votes)
+    for k in range(start, len(self.entries)):
+      self.position[self.entries[k]] = k
+    self.batches[c].append((start, len(self.entries)))
+
+  def getBatch(self, c, k):
+    "Return the vote indices of the k-th batch of candidate c."
+    (start, end) = self.batches[c][k]
+    return self.entries[start:end]
+
+  def inBatch(self, c, k, i):
+    "Return True if vote i was last received in the k-th batch of c."
+    (start, end) = self.batches[c][k]
+    return start <= self.position[i] < end
 
 ##################################################################
 
@@ -985,11 +1717,11 @@ class GregorySTV(OrderIndependentSTV):
 
     votesByTransferValue -- In eliminating candidates, Gregory methods transfer
     votes in packets having the same transfer value.  votesByTransferValue[v]
-    is a list of vote indices having that transfer value.
+    is a list of vote indices having that transfer value, and transferValues
+    lists the values in the order in which they are transferred.
   
     batches -- In doing secondary transfers, Gregory methods transfer the last
-    batch of votes received by a candidate.  batches[c] is a list of batches
-    of votes received by candidate c.  Each batch is a list of vote indices.
+    batch of votes received by a candidate.  See TransferLog.
   
     transferValue -- Each ballot has a transfer value.  Initially, it is set 
     to 1, but may be reduced when a vote is part of a surplus transfer.
@@ -1001,10 +1733,10 @@ class GregorySTV(OrderIndependentSTV):
     self.quota = 0
     self.S = 0
     self.stages = []
-    self.votesByTransferValue = []
+    self.votesByTransferValue = {}
     # Gregory rules do last batch transfers
     # Need to store batches for each cand
-    self.batches = []
+    self.batches = None
     self.transferValue = []
     self.transferValues = []
 
@@ -1012,8 +1744,12 @@ class GregorySTV(OrderIndependentSTV):
     OrderIndependentSTV.preCount(self)
     
     self.transferValue = [self.p] * self.b.numWeightedBallots
-    for _c in range(self.b.numCandidates):
-      self.batches.append([])
+    self.batches = TransferLog(self.b.numCandidates,
+                               self.b.numWeightedBallots)
+
+  def getVoteValue(self, i):
+    "Return the current value of vote i with its transfer value."
+    return self.b.getWeight(i) * self.transferValue[i]
   
   def initialVoteTally(self):
     "Count the first place votes with Gregory rules."
@@ -1022,16 +1758,14 @@ class GregorySTV(OrderIndependentSTV):
     
     # The first batch is all the votes a candidate has.
     for c in range(self.b.numCandidates):
-      self.batches[c].append(self.votes[c][:])
+      self.batches.addBatch(c, self.votes[c])
 
   def transferSurplusVotesFromCandidate(self, cSurplus):
     "Transfer surplus votes according to the Gregory rules."
 
     # Each candidate will receive a new batch of votes so
     # create a data structure to store the vote indices.
-    newBatch = []
-    for c in range(self.b.numCandidates):
-      newBatch.append([])
+    newBatch = {}
 
     # We need to compute several quantities:
     #   surplus -- the number of votes of the transferor over quota
@@ -1040,11 +1774,11 @@ class GregorySTV(OrderIndependentSTV):
       surplus = self.count[self.R-1][cSurplus] - self.quota[self.R-1]
     elif self.methodName == "N. Ireland STV":
       surplus = self.count[self.R-1][cSurplus] - self.thresh[self.R-1]
-    lastBatch = self.batches[cSurplus][-1]
+    lastBatch = self.batches.getBatch(cSurplus, -1)
     transferableValue = 0
     nTransferable = 0
     for i in lastBatch:
-      if self.b.getTopChoiceFromWeightedBallot(i, self.continuing) \
+      if self.cursors.getTopChoiceFromWeightedBallot(i, self.continuing) \
          is not None:
         transferableValue += \
                           self.b.getWeight(i) * self.transferValue[i]
@@ -1053,19 +1787,20 @@ class GregorySTV(OrderIndependentSTV):
     # Do the transfer
     for i in lastBatch:
       if transferableValue > surplus:
-        self.transferValue[i] = self.p * surplus / nTransferable
-      c = self.b.getTopChoiceFromWeightedBallot(i, self.continuing)
+        self.transferValue[i] = self.p * surplus // nTransferable
+      c = self.cursors.getTopChoiceFromWeightedBallot(i, self.continuing)
       if c is not None:
-        self.votes[c].append(i)
-        newBatch[c].append(i)
+        self.giveVote(c, i)
+        newBatch.setdefault(c, []).append(i)
 
     # for candidates who received votes, add new batch
-    for c in self.continuing:
-      if len(newBatch[c]) > 0:
-        self.batches[c].append(newBatch[c])
+    for c in sorted(newBatch):
+      self.batches.addBatch(c, newBatch[c])
 
-    self.votes[cSurplus] = []
+    self.votes.clear(cSurplus)
 
+    if not self.narrative:
+      return ""
     desc = "Count after transferring surplus votes from %s. " % \
          self.b.names[cSurplus]
     return desc
@@ -1076,11 +1811,11 @@ class GregorySTV(OrderIndependentSTV):
     # Update counts for losers, continuing, and winnersOver.
     # Because of substage transfers with ERS97, losing candidates
     # will sometimes have a count greater than 0.
-    for c in self.losers | self.continuing | self.winnersOver:
-      self.count[self.R][c] = 0
-      for i in self.votes[c]:
-        self.count[self.R][c] += \
-            self.b.getWeight(i) * self.transferValue[i]
+    cList = self.losers | self.continuing | self.winnersOver
+    if self.checkCount:
+      self.checkTotals(cList)
+    for c in cList:
+      self.count[self.R][c] = self.votes.totals[c]
 
     # Set counts for winnersEven.  This will always be the same as the
     # previous round.
@@ -1104,25 +1839,20 @@ class GregorySTV(OrderIndependentSTV):
     "Eliminate candidates according to the Gregory rules."
 
     # Set up holders for transferees
-    newBatch = []
-    for c in range(self.b.numCandidates):
-      newBatch.append([])
+    newBatch = {}
 
     # Transfer votes of this value
     for i in self.votesByTransferValue[v]:
-      c = self.b.getTopChoiceFromWeightedBallot(i, self.continuing)
+      c = self.cursors.getTopChoiceFromWeightedBallot(i, self.continuing)
       if c is not None:
-        self.votes[c].append(i)
-        newBatch[c].append(i)
-      # Don't know where this vote came from so try all losers
-      for d in self.losers:
-        if i in self.votes[d]:
-          self.votes[d].remove(i)
+        self.giveVote(c, i)
+        newBatch.setdefault(c, []).append(i)
+      else:
+        self.votes.remove(i)
 
     # For candidates who received votes, add new batch
-    for c in self.continuing:
-      if len(newBatch[c]) > 0:
-        self.batches[c].append(newBatch[c])
+    for c in sorted(newBatch):
+      self.batches.addBatch(c, newBatch[c])
 
   def eliminateCandidates(self):
     (elimList, selectLosersDesc) = self.selectCandidatesToEliminate()
@@ -1138,17 +1868,19 @@ class GregorySTV(OrderIndependentSTV):
     "Count the votes with Gregory rules."
 
     # Count first place votes
-    self.allocateRound()
-    if self.methodName == "ERS97 STV":
-      self.stages.append([])
-      self.stages[self.S].append(self.R)
-    self.initialVoteTally()    
-    self.updateRound()
-    self.describeRound()
+    if not self.resumed:
+      self.allocateRound()
+      if self.methodName == "ERS97 STV":
+        self.stages.append([])
+        self.stages[self.S].append(self.R)
+      self.initialVoteTally()    
+      self.updateRound()
+      self.describeRound()
     
     # Transfer surplus votes or eliminate candidates until done
     while (not self.electionOver()):
       
+      self.checkpointRound(self.R + 1)
       self.R += 1
       self.allocateRound()
       if self.methodName == "ERS97 STV":
@@ -1185,21 +1917,27 @@ class WeightedInclusiveSTV(OrderIndependentSTV):
   def preCount(self):
     OrderIndependentSTV.preCount(self)
     self.transferValue = [self.p] * self.b.numWeightedBallots
+
+  def getVoteValue(self, i):
+    "Return the current value of vote i with its transfer value."
+    return self.b.getWeight(i) * self.transferValue[i]
     
   def transferSurplusVotesFromCandidate(self, cSurplus):
     "Transfer the surplus votes of one candidate."
 
     # Transfer all of the votes at a fraction of their value
     surplus = self.count[self.R-1][cSurplus] - self.thresh[self.R-1]
-    for i in self.votes[cSurplus][:]:
-      self.transferValue[i] = self.transferValue[i] * surplus / \
+    for i in list(self.votes[cSurplus]):
+      self.transferValue[i] = self.transferValue[i] * surplus // \
           self.count[self.R-1][cSurplus]
-      c = self.b.getTopChoiceFromWeightedBallot(i, self.continuing)
+      c = self.cursors.getTopChoiceFromWeightedBallot(i, self.continuing)
       if c is not None:
-        self.votes[c].append(i)
+        self.giveVote(c, i)
 
-    self.votes[cSurplus] = []
-    
+    self.votes.clear(cSurplus)
+
+    if not self.narrative:
+      return ""
     desc = "Count after transferring surplus votes from %s with a transfer "\
          "value of %s/%s. " \
          % (self.b.names[cSurplus], self.displayValue(surplus),
@@ -1210,11 +1948,11 @@ class WeightedInclusiveSTV(OrderIndependentSTV):
     "Update the vote totals after a transfer of votes."
 
     # Update counts for losers, continuing, and winnersOver.
-    for c in self.losers | self.continuing | self.winnersOver:
-      self.count[self.R][c] = 0
-      for i in self.votes[c]:
-        self.count[self.R][c] += \
-            self.b.getWeight(i) * self.transferValue[i]
+    cList = self.losers | self.continuing | self.winnersOver
+    if self.checkCount:
+      self.checkTotals(cList)
+    for c in cList:
+      self.count[self.R][c] = self.votes.totals[c]
 
     # Set counts for winnersEven.  This will always be the same as the
     # previous round.
@@ -1233,19 +1971,196 @@ class WeightedInclusiveSTV(OrderIndependentSTV):
 
     # Transfer votes from losers simultaneously.
     for loser in elimList:
-      for i in self.votes[loser]:
-        c = self.b.getTopChoiceFromWeightedBallot(i, self.continuing)
+      for i in list(self.votes[loser]):
+        c = self.cursors.getTopChoiceFromWeightedBallot(i, self.continuing)
         if c is not None:
-          self.votes[c].append(i)
-      self.votes[loser] = []
+          self.giveVote(c, i)
+      self.votes.clear(loser)
 
     elimList.sort()
+    if not self.narrative:
+      return ""
     desc = "Count after eliminating %s and transferring votes. " \
          % self.b.joinList(elimList)
     return desc
 
 ##################################################################
 
+class BallotTree(object):
+  """The ballots of a recursive STV count stored as a flattened tree.
+
+  Node 0 is the root, and every other node k holds the ballots whose first
+  non-losing candidates are, in order, the candidates on the path from the
+  root to k.  Losing candidates are ignored and treated as if they do not
+  appear on the ballots, so that a node for candidates [c, d] includes the
+  ballots [c d], [x c d], [c x d] and [x c x x d] when x is a loser.
+  
+  Attributes:
+
+    candidate -- candidate[k] is the candidate of node k, or -1 for the root
+    and for nodes that have been removed.
+
+    parent -- parent[k] is the parent node of node k.
+
+    weight -- weight[k] is the number of ballots going through node k.
+
+    firstChild, nextSibling -- The children of node k, linked from 
+    firstChild[k] through nextSibling, where -1 ends the list.
+
+    ballots -- ballots[k] lists the ballot indices stopping at node k.  Only
+    nodes of continuing candidates hold ballots, and only nodes of winning
+    candidates have children.
+
+    position -- position[i] is where the candidate holding ballot i is
+    ranked on it, so that the ballot can be passed further down the tree
+    without slicing it.
+
+  Nodes are always created after their parent, so a forward sweep over the
+  lists visits every node after its parent.  With numpy, the nodes can also
+  be swept one level of the tree at a time with getLevels().
+  
+  """
+
+  # Smallest tree that is swept by levels
+  minVectorNodes = 256
+
+  def __init__(self, b):
+    self.b = b
+    self.candidate = [-1]
+    self.parent = [-1]
+    self.weight = [0]
+    self.firstChild = [-1]
+    self.nextSibling = [-1]
+    self.ballots = [[]]
+    self.position = [0] * b.numWeightedBallots
+    self.children = {}     # children[(k, c)] is the child of k for c
+    self.leaves = {}       # leaves[c] holds the nodes of c with ballots
+    self.levels = None     # cached result of getLevels()
+
+  def __len__(self):
+    return len(self.candidate)
+
+  def nodes(self):
+    "Iterate over (node, candidate, parent, weight) of the non-root nodes."
+    for k in range(1, len(self.candidate)):
+      c = self.candidate[k]
+      if c >= 0:
+        yield k, c, self.parent[k], self.weight[k]
+
+  def vectorized(self):
+    "Return True if the tree should be swept by levels."
+    return numpy is not None and len(self) >= BallotTree.minVectorNodes
+
+  def getLevels(self):
+    """Return the non-root nodes grouped by depth.
+
+    Each level is a tuple of numpy arrays of the nodes, their candidates,
+    their parents and their weights, and the levels are ordered from the
+    children of the root down, so that the parents of a level are in the
+    previous ones.  The levels are kept until the tree changes.
+    """
+
+    if self.levels is None:
+      depth = [0] * len(self)
+      levels = []
+      for k, c, parent, n in self.nodes():
+        d = depth[parent]
+        depth[k] = d + 1
+        if d == len(levels):
+          levels.append(([], [], [], []))
+        level = levels[d]
+        level[0].append(k)
+        level[1].append(c)
+        level[2].append(parent)
+        level[3].append(n)
+      self.levels = [tuple(numpy.array(x, numpy.int64) for x in level)
+                     for level in levels]
+    return self.levels
+
+  def getChild(self, k, c):
+    "Return the child of node k for candidate c, creating it if necessary."
+    child = self.children.get((k, c))
+    if child is None:
+      child = len(self.candidate)
+      self.candidate.append(c)
+      self.parent.append(k)
+      self.weight.append(0)
+      self.firstChild.append(-1)
+      self.nextSibling.append(self.firstChild[k])
+      self.ballots.append([])
+      self.firstChild[k] = child
+      self.children[(k, c)] = child
+    return child
+
+  def removeNode(self, k):
+    "Unlink the childless node k from its parent."
+    assert(self.firstChild[k] == -1)
+    self.levels = None
+    parent = self.parent[k]
+    if self.firstChild[parent] == k:
+      self.firstChild[parent] = self.nextSibling[k]
+    else:
+      j = self.firstChild[parent]
+      while self.nextSibling[j] != k:
+        j = self.nextSibling[j]
+      self.nextSibling[j] = self.nextSibling[k]
+    del self.children[(parent, self.candidate[k])]
+    self.candidate[k] = -1
+    self.weight[k] = 0
+    self.ballots[k] = []
+
+  def addBallot(self, i, k, pos, continuing, winners):
+    """Add ballot i below node k, looking at its rankings from position pos.
+
+    The ballot goes down the tree through the nodes of the winning candidates
+    it ranks until it reaches a continuing candidate.  If the ballot contains
+    only winning and losing candidates, it will not need to be transferred
+    again so it is thrown away after the last winner.
+    """
+
+    self.levels = None
+    weight, ballot = self.b.getWeightedBallot(i)
+    while True:
+      for pos in range(pos, len(ballot)):
+        c = ballot[pos]
+        if c in continuing or c in winners:
+          break
+      else:
+        return
+      k = self.getChild(k, c)
+      self.weight[k] += weight
+      if c in continuing:
+        self.ballots[k].append(i)
+        self.position[i] = pos
+        self.leaves.setdefault(c, {})[k] = None
+        return
+      pos += 1
+
+  def update(self, continuing, winners):
+    """Update the tree to account for new winners and losers.
+
+    The ballots held by a new winner are passed on to the next levels below
+    its node.  The node of a loser is removed and its ballots are passed on
+    to the next candidates below its parent.  Either way only the ballots of
+    those nodes are looked at, starting after the candidate holding them.
+    """
+
+    for c in list(self.leaves):
+      if c in continuing:
+        continue
+      for k in self.leaves.pop(c):
+        ballots = self.ballots[k]
+        if c in winners:
+          self.ballots[k] = []
+          start = k
+        else:
+          start = self.parent[k]
+          self.removeNode(k)
+        for i in ballots:
+          self.addBallot(i, start, self.position[i] + 1, continuing, winners)
+
+##################################################################
+
 class RecursiveSTV(OrderIndependentSTV):
   """Class that provides additional functionality for recursive STV methods.
   
@@ -1255,11 +2170,11 @@ class RecursiveSTV(OrderIndependentSTV):
     set to 1.  When a candidate's vote exceeds the winning threshold, the
     keep factor is reduced to transfer surplus votes to other candidates.
     
-    tree -- A data structure that stores the votes in a tree and allows for
+    tree -- A BallotTree that stores the votes in a tree and allows for
     faster algorithms.  The first level (below the root) contains the current 
     active first choices.  When a candidate has exceeded the winning threshold,
     then that node of the tree is expanded to another level.  When a candidate
-    is eliminated, the tree is rebuilt to remove that canddiate entirely as if
+    is eliminated, the tree is updated to remove that canddiate entirely as if
     the candidate had never been in the election.
     
   """
@@ -1273,7 +2188,7 @@ class RecursiveSTV(OrderIndependentSTV):
     self.delayedTransfer = "On"
     self.batchElimination = "Losers"
     self.keepFactor = []
-    self.tree = {}
+    self.tree = None
 
   def allocateRound(self):
     "Add keep factor allocation."
@@ -1281,7 +2196,9 @@ class RecursiveSTV(OrderIndependentSTV):
     self.keepFactor.append([0] * self.b.numCandidates)
     
   def describeRound(self):
-    
+
+    if not self.narrative:
+      return
     if self.roundInfo[self.R]["action"][0] == "first":
       text = "Count of first choices. "
     elif self.roundInfo[self.R]["action"][0] == "surplus":
@@ -1311,120 +2228,13 @@ class RecursiveSTV(OrderIndependentSTV):
     for c in range(self.b.numCandidates):
       self.keepFactor[0][c] = self.p
 
+    self.tree = BallotTree(self.b)
     for i in range(self.b.numWeightedBallots):
-      self.addBallotToTree(self.tree, i)
+      self.tree.addBallot(i, 0, 0, self.continuing, self.winners)
 
-  def addBallotToTree(self, tree, ballotIndex, ballot=""):
-    """Add one ballot to the tree.
-    
-    The root of the tree is a dictionary that has as keys the indicies of all 
-    continuing and winning candidates.  For each candidate, the value is also
-    a dictionary, and the keys of that dictionary include "n" and "bi".
-    tree[c]["n"] is the number of ballots that rank candidate c first.
-    tree[c]["bi"] is a list of ballot indices where the ballots rank c first.
-    
-    If candidate c is a winning candidate, then that portion of the tree is
-    expanded to indicate the breakdown of the subsequently ranked candidates.
-    In this situation, additional keys are added to the tree[c] dictionary
-    corresponding to subsequently ranked candidates.
-    tree[c]["n"] is the number of ballots that rank candidate c first.
-    tree[c]["bi"] is a list of ballot indices where the ballots rank c first.
-    tree[c][d]["n"] is the number of ballots that rank c first and d second.
-    tree[c][d]["bi"] is a list of the corresponding ballot indices.
-    
-    Where the second ranked candidates is also a winner, then the tree is 
-    expanded to the next level.  
-    
-    Losing candidates are ignored and treated as if they do not appear on the 
-    ballots.  For example, tree[c][d]["n"] is the total number of ballots
-    where candidate c is the first non-losing candidate, c is a winner, and
-    d is the next non-losing candidate.  This will include the following
-    ballots, where x represents a losing candidate:
-    [c d]
-    [x c d]
-    [c x d]
-    [x c x x d]
-    
-    During the count, the tree is dynamically updated as candidates change
-    their status.  The parameter "tree" to this method may be the root of the
-    tree or may be a sub-tree.
-    """
-
-    if ballot == "":
-      # Add the complete ballot to the tree
-      weight, ballot = self.b.getWeightedBallot(ballotIndex)
-    else:
-      # When ballot is not "", we are adding a truncated ballot to the tree,
-      # because a higher-ranked candidate is a winner.
-      weight = self.b.getWeight(ballotIndex)
-    
-    # Get the top choice among candidates still in the running
-    # Note that we can't use Ballots.getTopChoiceFromWeightedBallot since
-    # we are looking for the top choice over a truncated ballot.
-    for c in ballot:
-      if c in self.continuing | self.winners:
-        break # c is the top choice so stop
-    else:
-      c = None # no candidates left on this ballot
-
-    if c is None:
-      # This will happen if the ballot contains only winning and losing
-      # candidates.  The ballot index will not need to be transferred
-      # again so it can be thrown away.
-      return
-
-    # Create space if necessary.
-    if c not in tree:
-      tree[c] = {}
-      tree[c]["n"] = 0
-      tree[c]["bi"] = []
-
-    tree[c]["n"] += weight
-
-    if c in self.winners:
-      # Because candidate is a winner, a portion of the ballot goes to
-      # the next candidate.  Pass on a truncated ballot so that the same
-      # candidate doesn't get counted twice.
-      i = ballot.index(c)
-      ballot2 = ballot[i+1:]
-      self.addBallotToTree(tree[c], ballotIndex, ballot2)
-    else:
-      # Candidate is in continuing so we stop here.
-      tree[c]["bi"].append(ballotIndex)
-      
-  def updateTree(self, tree, loserSet):    
+  def updateTree(self):
     "Update the tree data structure to account for new winners and losers."
-    self.updateLoserTree(tree, loserSet)
-    self.updateWinnerTree(tree, loserSet)
-
-  def updateLoserTree(self, tree, loserSet):
-    "Update the tree data structure to account for new losers."
-    for c in loserSet.intersection(tree):
-      for i in tree[c]["bi"]:
-        ballot = self.b.getWeightedBallot(i)[1] # drop weight
-        j = ballot.index(c)
-        ballot2 = ballot[j+1:]
-        self.addBallotToTree(tree, i, ballot2)
-      del tree[c]
-
-  def updateWinnerTree(self, tree, loserSet):
-    "Update the tree data structure to account for new winners."
-    for c in self.winners.intersection(tree):
-      if len(tree[c]["bi"]) > 0:
-        # The current candidate is a new winner (has ballot indices), so
-        # expand this node to the next level.  There is no need to call
-        # updateTree() recursively since addBallotToTree() will appropriately
-        # expand lower nodes.
-        for i in tree[c]["bi"]:
-          ballot = self.b.getWeightedBallot(i)[1]
-          j = ballot.index(c)
-          ballot2 = ballot[j+1:]
-          self.addBallotToTree(tree[c], i, ballot2)
-        tree[c]["bi"] = []
-      else:
-        # The current candidate is an old winner, so recurse to see if
-        # anything needs to be done at lower levels.
-        self.updateTree(tree[c], loserSet)
+    self.tree.update(self.continuing, self.winners)
 
   def inInfiniteLoop(self):
     "detect stable state as infinite loop"
@@ -1443,7 +2253,7 @@ class RecursiveSTV(OrderIndependentSTV):
   
   def transferSurplusVotes(self):
     self.roundInfo[self.R]["action"] = ("surplus", [])
-    self.updateTree(self.tree, self.losers)
+    self.updateTree()
     desc = self.updateKeepFactors()
     self.roundInfo[self.R]["surplus"] = \
         "Count after transferring surplus votes. " + desc
@@ -1453,7 +2263,7 @@ class RecursiveSTV(OrderIndependentSTV):
     self.roundInfo[self.R]["action"] = ("eliminate", elimList)
     descTrans = self.transferVotesFromCandidates(elimList)
     self.roundInfo[self.R]["eliminate"] = descTrans + descChoose
-    self.updateTree(self.tree, self.losers)
+    self.updateTree()
     self.copyKeepFactors()
     
   def selectCandidatesToEliminate(self):
@@ -1474,6 +2284,8 @@ class RecursiveSTV(OrderIndependentSTV):
     "Eliminate any losing candidates."
     
     elimList.sort()
+    if not self.narrative:
+      return ""
     desc = "Count after eliminating %s and transferring votes. "\
            % self.b.joinList(elimList)
     return desc
@@ -1503,13 +2315,16 @@ class RecursiveSTV(OrderIndependentSTV):
         if rem > 0: 
           kf += 1
         self.keepFactor[self.R][c] = kf
-        winners.append("%s, %s"\
-                       % (self.b.names[c],
-                          self.displayValue(self.keepFactor[self.R][c]))
-                       )
+        if self.narrative:
+          winners.append("%s, %s"\
+                         % (self.b.names[c],
+                            self.displayValue(self.keepFactor[self.R][c]))
+                         )
       else:
         self.keepFactor[self.R][c] = self.keepFactor[self.R-1][c]
 
+    if not self.narrative:
+      return ""
     if len(self.winners) != 0:
       desc += self.b.joinList(winners, convert="none") + ". "
     return desc
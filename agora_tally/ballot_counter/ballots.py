@@ -15,6 +15,8 @@
 __revision__ = "$Id: ballots.py 821 2010-11-19 23:36:17Z jeff.oneill $"
 
 import os
+import hashlib
+from array import array
 from agora_tally.ballot_counter.plugins import getLoaderPlugins, getLoaderPluginClass
 
 ##################################################################
@@ -103,6 +105,10 @@ class Ballots(object):
     # If the file does not have ballot IDs, then this list remains empty and
     # the ballotID is computed from the ballot index (1 .. N).
 
+    self._cleanBallots = {}
+    # Clean versions of these ballots computed by getCleanBallots(), by
+    # cleaning options.  Emptied whenever the ballots change.
+
     self.loader = None
     
   def copy(self, copyBallots=True):
@@ -149,6 +155,7 @@ class Ballots(object):
     return self._names
   
   def setNames(self, names):
+    self._cleanBallots.clear()
     self._names = list(names)
     for index, name in enumerate(names):
       self._n2i[name] = index
@@ -183,6 +190,7 @@ class Ballots(object):
       self.ballotIDsList.append(ballotID)
 
     ballotIndex = len(self.ballotOrder) # Index of the ballot being added
+    self._cleanBallots.clear()
     if ballotString in self.uniqueBallotsLookup:
       # We have seen this ballot before 
       uniqueBallotIndex = self.uniqueBallotsLookup[ballotString]
@@ -271,6 +279,7 @@ class Ballots(object):
       self.appendBallot(ballot, ballotID)
     
   def deleteBallots(self):
+    self._cleanBallots.clear()
     self.uniqueBallots = []
     self.uniqueBallotIndexToBallotIndices = []
     self.uniqueBallotsLookup = {}
@@ -296,6 +305,36 @@ class Ballots(object):
         return c
     return None
 
+  def getCursors(self):
+    "Return cursors for looking up the top choices on these ballots."
+    return BallotCursors(self.uniqueBallots, self.ballotOrder)
+
+  def getBallotStream(self):
+    "Return the individual ballots in order, grouped in runs."
+    return BallotStream(self.ballotOrder)
+
+  def getDigest(self):
+    """Return a digest of the weighted ballots and of the order of the
+    individual ballots, the same for packed ballots."""
+    return PackedBallots.digestArrays(PackedBallots.pack(self))
+
+  def getRankHistogram(self):
+    """Return the weight of the ballots ranking each candidate at each
+    position.  ranked[r][c] is the weight of the ballots ranking candidate c
+    at position r and lengths[n] is the weight of those with n rankings."""
+
+    ranked = []
+    lengths = [0]
+    for i in range(self.numWeightedBallots):
+      weight, ballot = self.getWeightedBallot(i)
+      while len(ranked) < len(ballot):
+        ranked.append([0] * self.numCandidates)
+        lengths.append(0)
+      for r, c in enumerate(ballot):
+        ranked[r][c] += weight
+      lengths[len(ballot)] += weight
+    return (ranked, lengths)
+
   def getCleanBallots(self, removeEmpty=True, removeOvervotes="Cambridge",
                       removeDupes=True, removeWithdrawn=True):
     """Ballots can be cleaned in several ways:
@@ -317,15 +356,55 @@ class Ballots(object):
     
     (6) Does not currently check for duplicate ballot IDs, but we might want
     to add this later.
+
+    Each unique ballot is cleaned only once.  The result is remembered until
+    the ballots change, and each call returns a copy of it that can be
+    modified like any other ballots.
     
     """
 
+    # Cleaning only depends on the contents of the ballots and on these
+    # options, so the result is computed once and shared afterwards.
+    withdrawn = tuple(sorted(set(self.withdrawn)))
+    key = (removeEmpty, removeOvervotes, removeDupes, removeWithdrawn, withdrawn)
+    if key not in self._cleanBallots:
+      self._cleanBallots[key] = self._cleanUniqueBallots(
+        removeEmpty, removeOvervotes, removeDupes, removeWithdrawn,
+        set(withdrawn))
+    (uniqueBallots, uniqueBallotCount, uniqueBallotIndexToBallotIndices,
+     uniqueBallotsLookup, ballotOrder, ballotIDsList) = self._cleanBallots[key]
+
     # We want to keep track of the link between dirty and clean ballots
     cleanBallots = self.copy(False)
     cleanBallots.withdrawn = []
     cleanBallots.customBallotIDs = True
     cleanBallots.dirtyBallots = self
+
+    # The clean ballots get their own lists so that appending to them leaves
+    # the remembered ones alone.  The unique ballots themselves are shared,
+    # since they are replaced rather than modified.
+    cleanBallots.uniqueBallots = uniqueBallots[:]
+    cleanBallots.uniqueBallotCount = uniqueBallotCount[:]
+    cleanBallots.uniqueBallotIndexToBallotIndices = \
+      [set(indices) for indices in uniqueBallotIndexToBallotIndices]
+    cleanBallots.uniqueBallotsLookup = uniqueBallotsLookup.copy()
+    cleanBallots.ballotOrder = ballotOrder[:]
+    cleanBallots.ballotIDsList = ballotIDsList[:]
+
+    # Remove the withdrawn candidates names
+    cleanBallots.names = [self.names[c] for c in range(self.numCandidates)
+                          if c not in withdrawn]
     
+    return cleanBallots
+
+  def _cleanUniqueBallots(self, removeEmpty, removeOvervotes, removeDupes,
+                          removeWithdrawn, withdrawn):
+    """Clean each unique ballot once and return the data of the clean ballots.
+
+    Ballots are added to the clean ballots in the same order as if each
+    individual ballot was cleaned and appended, so the result is identical.
+    """
+
     # Set up a translation list for candidate numbers for removing
     # withdrawn candidates.  c2 = c2c[c] translates an original candidate
     # number "c" to a translated candidate number "c2" taking into account
@@ -335,62 +414,96 @@ class Ballots(object):
     if removeWithdrawn:
       n = 0
       for i in range(self.numCandidates):
-        if i in self.withdrawn:
+        if i in withdrawn:
           c2c[i] = None
           n += 1
         else:
           c2c[i] -= n
 
-    # Loop over ballots and perform requested cleaning
-    for i in range(self.numBallots):
-      ballot, ballotID = self.getBallotAndID(i)
-      seenCandidates = set()
-      cleanBallot = [] # This will be a cleaned version of ballot
-      for item in ballot:
-        
-        # Candidate may have to pass two tests to get in the cleaned ballots.
-        # First, candidate must not be withdrawn.
-        # Second, candidate must not already be on the ballot when removeDupes
-        # is true.
-
-        if isinstance(item, list):
-          assert(len(item) > 1)
-          if removeOvervotes == "Cambridge":
-            continue
-          elif removeOvervotes == "San Francisco":
-            break
-          cleanItem = []
-          for c in item:
-            if c == -1:
-              continue  # Skipped ranking
-            c2 = c2c[c] # Candidate number after removing withdrawn candidates
-            if not ((c in self.withdrawn) or (removeDupes and c2 in seenCandidates)):
-              assert(c2 is not None)
-              cleanItem.append(c2)
-              seenCandidates.add(c2)
-          if len(cleanItem) > 1:
-            cleanBallot.append(cleanItem)
-          elif len(cleanItem) == 1:
-            cleanBallot.append(cleanItem[0])
-          
-        else:
-          c = item
+    uniqueBallots = []
+    uniqueBallotsLookup = {}
+
+    # cleanIndex[j] is the index of the clean version of the jth unique
+    # ballot, or None if the clean ballot is removed.  Unique ballots are
+    # visited in the order in which they first appear.
+    dirtyBallots = self.uniqueBallots
+    cleanIndex = [None] * len(dirtyBallots)
+    for j in dict.fromkeys(self.ballotOrder):
+      cleanBallot = self._cleanBallot(dirtyBallots[j], c2c, withdrawn,
+                                      removeOvervotes, removeDupes)
+      if not removeEmpty or len(cleanBallot) > 0:
+        ballotString = str(cleanBallot)
+        if ballotString not in uniqueBallotsLookup:
+          uniqueBallotsLookup[ballotString] = len(uniqueBallots)
+          uniqueBallots.append(cleanBallot)
+        cleanIndex[j] = uniqueBallotsLookup[ballotString]
+
+    # Translate the individual ballots
+    if self.customBallotIDs:
+      ballotIDs = self.ballotIDsList
+    else:
+      ballotIDs = range(1, self.numBallots + 1)
+    ballotOrder = [cleanIndex[j] for j in self.ballotOrder]
+    if None in ballotOrder:
+      ballotIDsList = [ballotID for ballotID, k in zip(ballotIDs, ballotOrder)
+                       if k is not None]
+      ballotOrder = [k for k in ballotOrder if k is not None]
+    else:
+      ballotIDsList = list(ballotIDs)
+
+    uniqueBallotCount = [0] * len(uniqueBallots)
+    uniqueBallotIndexToBallotIndices = [set() for k in uniqueBallots]
+    for i, k in enumerate(ballotOrder):
+      uniqueBallotCount[k] += 1
+      uniqueBallotIndexToBallotIndices[k].add(i)
+
+    return (uniqueBallots, uniqueBallotCount, uniqueBallotIndexToBallotIndices,
+            uniqueBallotsLookup, ballotOrder, ballotIDsList)
+
+  def _cleanBallot(self, ballot, c2c, withdrawn, removeOvervotes,
+                   removeDupes):
+    "Return a cleaned version of a ballot."
+
+    seenCandidates = set()
+    cleanBallot = [] # This will be a cleaned version of ballot
+    for item in ballot:
+      
+      # Candidate may have to pass two tests to get in the cleaned ballots.
+      # First, candidate must not be withdrawn.
+      # Second, candidate must not already be on the ballot when removeDupes
+      # is true.
+
+      if isinstance(item, list):
+        assert(len(item) > 1)
+        if removeOvervotes == "Cambridge":
+          continue
+        elif removeOvervotes == "San Francisco":
+          break
+        cleanItem = []
+        for c in item:
           if c == -1:
             continue  # Skipped ranking
           c2 = c2c[c] # Candidate number after removing withdrawn candidates
-          if not ((c in self.withdrawn) or (removeDupes and c2 in seenCandidates)):
+          if not ((c in withdrawn) or (removeDupes and c2 in seenCandidates)):
             assert(c2 is not None)
-            cleanBallot.append(c2)
+            cleanItem.append(c2)
             seenCandidates.add(c2)
+        if len(cleanItem) > 1:
+          cleanBallot.append(cleanItem)
+        elif len(cleanItem) == 1:
+          cleanBallot.append(cleanItem[0])
+        
+      else:
+        c = item
+        if c == -1:
+          continue  # Skipped ranking
+        c2 = c2c[c] # Candidate number after removing withdrawn candidates
+        if not ((c in withdrawn) or (removeDupes and c2 in seenCandidates)):
+          assert(c2 is not None)
+          cleanBallot.append(c2)
+          seenCandidates.add(c2)
 
-      if not removeEmpty or len(cleanBallot) > 0:
-        cleanBallots.appendBallot(cleanBallot, ballotID)
-
-    # Remove the withdrawn candidates names
-    cleanBallots.names = [self.names[c] for c in range(self.numCandidates)
-                          if c not in self.withdrawn]
-    
-    return cleanBallots
+    return cleanBallot
 
   def appendFile(self, fName):
     "Append ballot data from a file."
@@ -480,13 +593,13 @@ class Ballots(object):
 
     if order == None:
       # Default is alphabetical order
-      order = range(self.numCandidates)
+      order = list(range(self.numCandidates))
       order.sort(key=lambda c: self.names[c])
 
     # Check to make sure that all candidates are included
-    check = order[:]
+    check = list(order)
     check.sort()
-    if check != range(self.numCandidates):
+    if check != list(range(self.numCandidates)):
       raise RuntimeError("Must specify all the candidates when reordering.")
 
     # Set up a translation list.
@@ -503,11 +616,13 @@ class Ballots(object):
 
     # Easier to create a new uniqueBallotsLookup
     self.uniqueBallotsLookup = {}
+    self._cleanBallots.clear()
 
     # Loop over all the weighted ballots
+    # The ballots are replaced rather than modified, since clean ballots
+    # share them with the ballots they were cleaned from.
     for i in range(self.numWeightedBallots):
-      for j, c in enumerate(self.uniqueBallots[i]):
-        self.uniqueBallots[i][j] = c2c[c]
+      self.uniqueBallots[i] = [c2c[c] for c in self.uniqueBallots[i]]
       ballotString = str(list(self.uniqueBallots[i]))
       self.uniqueBallotsLookup[ballotString] = i
       
@@ -546,3 +661,394 @@ class Ballots(object):
         return False
     return True
   
+
+##################################################################
+
+class BallotCursors(object):
+  """Cursors on the current top choice of each ballot.
+
+  Iterative methods repeatedly look for the top choice of a ballot among the
+  candidates still in the running.  A cursor remembers, for each unique
+  ballot, the position of the last top choice found, so that the next lookup
+  continues from there instead of scanning the ballot from the beginning.
+  The top choice of a ballot only depends on the unique ballot, so all the
+  individual ballots share the same cursor.
+
+  Cursors only move forward, so they are only valid as long as the choices
+  given in successive lookups never gain a candidate.  Use reset() otherwise.
+  """
+
+  def __init__(self, uniqueBallots, ballotOrder):
+    self.uniqueBallots = uniqueBallots
+    self.ballotOrder = ballotOrder
+    self.position = [0] * len(uniqueBallots)
+
+  def reset(self):
+    "Move all the cursors back to the first ranking."
+    self.position = [0] * len(self.uniqueBallots)
+
+  def getTopChoiceFromBallot(self, i, choices):
+    "Return the top choice on a ballot among candidates still in the running."
+    return self.getTopChoiceFromWeightedBallot(self.ballotOrder[i], choices)
+
+  def getTopChoiceFromWeightedBallot(self, i, choices):
+    "Return the top choice on a ballot among candidates still in the running."
+
+    ballot = self.uniqueBallots[i]
+    j = self.position[i]
+    while j < len(ballot):
+      if ballot[j] in choices:
+        self.position[i] = j
+        return ballot[j]
+      j += 1
+    self.position[i] = j
+    return None
+
+##################################################################
+
+class BallotStream(object):
+  """The individual ballots in the order in which they were cast.
+
+  Order dependent methods look at individual ballots rather than weighted
+  ballots.  order[i] is the index of the unique ballot of the ith ballot,
+  stored as a 32-bit integer, and runs[k] is the index of the first ballot
+  of the kth run of identical consecutive ballots.  All of the ballots of a
+  run have the same top choice, so they can be handled together.
+  """
+
+  def __init__(self, ballotOrder):
+    self.order = array("i", ballotOrder)
+    order = self.order
+    self.runs = array("i", (i for i in range(len(order))
+                            if i == 0 or order[i] != order[i-1]))
+
+  def __len__(self):
+    return len(self.order)
+
+  def getRuns(self):
+    "Yield the start, end and unique ballot of each run of ballots."
+    ends = self.runs[1:]
+    ends.append(len(self.order))
+    for start, end in zip(self.runs, ends):
+      yield (start, end, self.order[start])
+
+  def groupBy(self, key):
+    """Group the ballots by key[j], where j is their unique ballot.
+
+    Return a dictionary giving the list of ballots in order for each key.
+    When runs are long, each run is added at once, and otherwise it is
+    faster to add the ballots one by one.
+    """
+
+    groups = dict((k, []) for k in set(key))
+    if 4 * len(self.runs) <= len(self.order):
+      for (start, end, j) in self.getRuns():
+        groups[key[j]].extend(range(start, end))
+    else:
+      for i, j in enumerate(self.order):
+        groups[key[j]].append(i)
+    return groups
+
+##################################################################
+
+class BallotsView(Ballots):
+  """A read-only view of clean ballots without some of the candidates.
+
+  The view hides withdrawn candidates without copying the ballots.  Candidate
+  numbers are renumbered as getCleanBallots() would do, but the translation is
+  done when a ballot is read, so creating a view only costs O(candidates).
+  Ballots left empty are skipped, and the index of the remaining ballots is
+  only built the first time it is needed.
+
+  Unlike getCleanBallots(), unique ballots that become identical once the
+  withdrawn candidates are removed are not merged.  This does not change the
+  outcome of methods that only depend on the weighted ballots.
+  """
+
+  def __init__(self, ballots, withdrawn, removeEmpty=True):
+    Ballots.__init__(self, customBallotIDs=True)
+
+    self.title = ballots.title
+    self.date = ballots.date
+    self.numSeats = ballots.numSeats
+    self.dirtyBallots = ballots
+    self.removeEmpty = removeEmpty
+
+    # c2c translates a candidate number in the underlying ballots into a
+    # candidate number in the view, and is None for withdrawn candidates.
+    withdrawn = set(withdrawn)
+    self.c2c = []
+    names = []
+    for c, name in enumerate(ballots.names):
+      if c in withdrawn:
+        self.c2c.append(None)
+      else:
+        self.c2c.append(len(names))
+        names.append(name)
+    self.names = names
+
+    self.source = ballots
+    self._index = None
+    self._ballotOrder = None
+    self._viewBallotOrder = None
+
+  def _getIndex(self):
+    "Return the underlying unique ballots that are part of the view."
+    if self._index is None:
+      c2c = self.c2c
+      self._index = [j for j in range(self.source.numWeightedBallots)
+                     if not self.removeEmpty or
+                        any(c2c[c] is not None
+                            for c in self.source.uniqueBallots[j])]
+    return self._index
+
+  def _getBallotOrder(self):
+    "Map each ballot of the view to the underlying ballot it comes from."
+    if self._ballotOrder is None:
+      index = self._getIndex()
+      if len(index) == self.source.numWeightedBallots:
+        self._ballotOrder = range(self.source.numBallots)
+      else:
+        kept = set(index)
+        sourceOrder = self.source.ballotOrder
+        self._ballotOrder = [i for i in range(self.source.numBallots)
+                             if sourceOrder[i] in kept]
+    return self._ballotOrder
+
+  @property
+  def ballotOrder(self):
+    # Translate the underlying unique ballot indices into view indices
+    if self._viewBallotOrder is None:
+      position = dict((j, k) for k, j in enumerate(self._getIndex()))
+      sourceOrder = self.source.ballotOrder
+      self._viewBallotOrder = [position[sourceOrder[i]]
+                               for i in self._getBallotOrder()]
+    return self._viewBallotOrder
+
+  @ballotOrder.setter
+  def ballotOrder(self, value):
+    # Set by Ballots.__init__(); the order always comes from the source.
+    pass
+
+  @property
+  def uniqueBallots(self):
+    return [self.translate(self.source.uniqueBallots[j])
+            for j in self._getIndex()]
+
+  @uniqueBallots.setter
+  def uniqueBallots(self, value):
+    pass
+
+  @property
+  def uniqueBallotCount(self):
+    return [self.source.uniqueBallotCount[j] for j in self._getIndex()]
+
+  @uniqueBallotCount.setter
+  def uniqueBallotCount(self, value):
+    pass
+
+  @property
+  def numBallots(self):
+    return len(self._getBallotOrder())
+
+  @property
+  def numWeightedBallots(self):
+    return len(self._getIndex())
+
+  def translate(self, ballot):
+    "Return a ballot of the underlying ballots as seen through the view."
+    c2c = self.c2c
+    return [c2c[c] for c in ballot if c2c[c] is not None]
+
+  def getWeight(self, i):
+    "Return the weight of the ith weighted ballot."
+    return self.source.uniqueBallotCount[self._getIndex()[i]]
+
+  def getWeightedBallot(self, i):
+    "Return the ith weighted ballot."
+    j = self._getIndex()[i]
+    return (self.source.uniqueBallotCount[j],
+            self.translate(self.source.uniqueBallots[j]))
+
+  def getBallot(self, i):
+    return self.translate(self.source.getBallot(self._getBallotOrder()[i]))
+
+  def getBallotID(self, i):
+    return self.source.getBallotID(self._getBallotOrder()[i])
+
+  def getBallotsAndIDs(self):
+    return [self.getBallotAndID(i) for i in range(self.numBallots)]
+
+  def getTopChoiceFromBallot(self, i, choices):
+    "Return the top choice on a ballot among candidates still in the running."
+
+    j = self.source.ballotOrder[self._getBallotOrder()[i]]
+    return self._getTopChoice(self.source.uniqueBallots[j], choices)
+
+  def getTopChoiceFromWeightedBallot(self, i, choices):
+    "Return the top choice on a ballot among candidates still in the running."
+
+    j = self._getIndex()[i]
+    return self._getTopChoice(self.source.uniqueBallots[j], choices)
+
+  def _getTopChoice(self, ballot, choices):
+    c2c = self.c2c
+    for c in ballot:
+      c2 = c2c[c]
+      if c2 is not None and c2 in choices:
+        return c2
+    return None
+
+  def copy(self, copyBallots=True):
+    "Return a regular Ballots object with the contents of the view."
+
+    ballotList = Ballots(customBallotIDs=True)
+    ballotList.title = self.title
+    ballotList.date = self.date
+    ballotList.numSeats = self.numSeats
+    ballotList.names = self.names[:]
+    if copyBallots:
+      for i in range(self.numBallots):
+        ballot, ballotID = self.getBallotAndID(i)
+        ballotList.appendBallot(ballot, ballotID)
+    return ballotList
+
+  def appendBallot(self, ballot, ballotID=None):
+    raise RuntimeError("Can't add ballots to a view of other ballots.")
+
+  def deleteBallots(self):
+    raise RuntimeError("Can't delete ballots from a view of other ballots.")
+
+  def reorderCandidates(self, order=None):
+    raise RuntimeError("Can't reorder the candidates of a view of ballots.")
+
+##################################################################
+
+class PackedBallots(Ballots):
+  """Read-only weighted ballots stored in flat integer arrays.
+
+  The unique ballots are stored one after the other in candidates, the kth
+  of them being candidates[offsets[k]:offsets[k+1]] with weight weights[k],
+  and order[i] is the unique ballot of the ith ballot.  Any sequences that
+  can be sliced into lists work, in particular memoryviews of a buffer
+  shared with other processes, so that the ballots are not copied.  Only
+  the unique ballots are turned into lists, the first time they are needed.
+  """
+
+  def __init__(self, candidates, offsets, weights, order, names=[]):
+    Ballots.__init__(self)
+    self.candidates = candidates
+    self.offsets = offsets
+    self.weights = weights
+    self.order = order
+    self.names = names
+    self._uniqueBallots = None
+    self._uniqueBallotCount = None
+
+  @staticmethod
+  def pack(ballots):
+    """Return the arrays of some ballots: candidates and order as 32-bit
+    integers and offsets and weights as 64-bit integers."""
+
+    candidates = array("i")
+    offsets = array("q", [0])
+    weights = array("q")
+    for k in range(ballots.numWeightedBallots):
+      weight, ballot = ballots.getWeightedBallot(k)
+      candidates.extend(ballot)
+      offsets.append(len(candidates))
+      weights.append(weight)
+    order = array("i", ballots.ballotOrder)
+    return (candidates, offsets, weights, order)
+
+  @staticmethod
+  def digestArrays(arrays):
+    "Return the SHA-256 digest of the arrays of some ballots."
+
+    h = hashlib.sha256()
+    for (a, typecode) in zip(arrays, "iqqi"):
+      if not isinstance(a, (array, memoryview)):
+        a = array(typecode, a)
+      h.update(a)
+    return h.hexdigest()
+
+  def getDigest(self):
+    return self.digestArrays([self.candidates, self.offsets, self.weights,
+                              self.order])
+
+  @property
+  def uniqueBallots(self):
+    if self._uniqueBallots is None:
+      offsets = self.offsets
+      self._uniqueBallots = [self.candidates[offsets[k]:offsets[k+1]].tolist()
+                             for k in range(len(self.weights))]
+    return self._uniqueBallots
+
+  @uniqueBallots.setter
+  def uniqueBallots(self, value):
+    # Set by Ballots.__init__(); the ballots always come from the arrays.
+    pass
+
+  @property
+  def uniqueBallotCount(self):
+    if self._uniqueBallotCount is None:
+      self._uniqueBallotCount = self.weights.tolist()
+    return self._uniqueBallotCount
+
+  @uniqueBallotCount.setter
+  def uniqueBallotCount(self, value):
+    pass
+
+  @property
+  def ballotOrder(self):
+    return self.order
+
+  @ballotOrder.setter
+  def ballotOrder(self, value):
+    pass
+
+  @property
+  def numBallots(self):
+    return len(self.order)
+
+  @property
+  def numWeightedBallots(self):
+    return len(self.weights)
+
+  def getWeightedBallot(self, i):
+    "Return the ith weighted ballot."
+    return (self.weights[i],
+            self.candidates[self.offsets[i]:self.offsets[i+1]].tolist())
+
+  def getBallot(self, i):
+    return self.getWeightedBallot(self.order[i])[1]
+
+  def release(self):
+    "Release the arrays, so that a shared buffer can be freed."
+    for a in [self.candidates, self.offsets, self.weights, self.order]:
+      if isinstance(a, memoryview):
+        a.release()
+    self.candidates = self.offsets = self.weights = self.order = None
+    self._uniqueBallots = self._uniqueBallotCount = None
+
+  def copy(self, copyBallots=True):
+    "Return a regular Ballots object with the same ballots."
+
+    ballotList = Ballots()
+    ballotList.title = self.title
+    ballotList.date = self.date
+    ballotList.numSeats = self.numSeats
+    ballotList.names = self.names[:]
+    if copyBallots:
+      for i in range(self.numBallots):
+        ballotList.appendBallot(self.getBallot(i))
+    return ballotList
+
+  def appendBallot(self, ballot, ballotID=None):
+    raise RuntimeError("Can't add ballots to packed ballots.")
+
+  def deleteBallots(self):
+    raise RuntimeError("Can't delete packed ballots.")
+
+  def reorderCandidates(self, order=None):
+    raise RuntimeError("Can't reorder the candidates of packed ballots.")
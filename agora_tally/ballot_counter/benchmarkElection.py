@@ -0,0 +1,484 @@
+#!/usr/bin/env python
+"benchmark and profile election methods from the command line"
+
+# This file is part of agora-tally.
+# Copyright (C) 2026  Agora Voting SL <agora@agoravoting.com>
+
+# agora-tally is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+
+# agora-tally  is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with agora-tally.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(
+  os.path.abspath(__file__)))))
+import csv
+import gc
+import getopt
+import json
+import platform
+import threading
+import time
+import traceback
+
+try:
+  import tracemalloc
+except ImportError:
+  tracemalloc = None
+
+from agora_tally.ballot_counter.ballots import Ballots
+from agora_tally.ballot_counter.plugins import getMethodPlugins, getReportPlugins
+from agora_tally.ballot_counter import spars
+
+# The phases of a count timed separately.  Saving the initial state of a
+# count run without the narrative is part of preCount, and the report
+# includes the narrative it has to produce for such counts.
+phases = ["preCount", "countBallots", "postCount", "report"]
+
+csvColumns = ["source", "method", "phase", "median", "p95", "blocks",
+              "collections", "peakKB", "error"]
+
+##################################################################
+
+def median(values):
+  "Return the median of a list of numbers."
+  values = sorted(values)
+  middle = len(values) // 2
+  if len(values) % 2 == 1:
+    return values[middle]
+  return (values[middle-1] + values[middle]) / 2.0
+
+def percentile(values, p):
+  "Return the p-th percentile of a list of numbers by the nearest rank."
+  values = sorted(values)
+  rank = max(1, int(-(-p * len(values) // 100)))
+  return values[rank-1]
+
+##################################################################
+
+class StackSampler(object):
+  """Sample the stack of a thread to get flamegraph collapsed stacks.
+
+  A daemon thread looks at the frames of the sampled thread every interval
+  seconds and counts the stacks below the timePhase() frame of this module,
+  prefixed by the current label, which is set to the method and phase being
+  run.  The counts are written one per line, with the frames separated by
+  semicolons, as expected by flamegraph.pl and speedscope.
+  """
+
+  def __init__(self, interval=0.001):
+    self.interval = interval
+    self.label = None
+    self.counts = {}
+    self.target = threading.current_thread().ident
+    self.running = False
+    self.thread = None
+
+  def start(self):
+    self.running = True
+    self.thread = threading.Thread(target=self.run)
+    self.thread.daemon = True
+    self.thread.start()
+
+  def stop(self):
+    self.running = False
+    if self.thread is not None:
+      self.thread.join()
+      self.thread = None
+
+  def run(self):
+    while self.running:
+      label = self.label
+      frame = sys._current_frames().get(self.target)
+      if label is not None and frame is not None:
+        stack = self.getStack(frame)
+        if stack is not None:
+          key = ";".join([label] + stack)
+          self.counts[key] = self.counts.get(key, 0) + 1
+      time.sleep(self.interval)
+
+  def getStack(self, frame):
+    "Return the frames below timePhase(), outermost first."
+    stack = []
+    while frame is not None:
+      code = frame.f_code
+      if code is timePhase.__code__:
+        stack.reverse()
+        return stack
+      stack.append("%s:%s" % (os.path.basename(code.co_filename),
+                              code.co_name))
+      frame = frame.f_back
+    return None
+
+  def write(self, f):
+    for key in sorted(self.counts):
+      f.write("%s %d\n" % (key, self.counts[key]))
+
+##################################################################
+
+def gcCollections():
+  "Return the number of garbage collections run so far."
+  return sum(s["collections"] for s in gc.get_stats())
+
+def timePhase(measure, phase, f, sampler=None):
+  """Run one phase of a count, adding its measures to measure[phase].
+
+  The allocation measures are the net number of memory blocks allocated by
+  the phase and the number of garbage collections run during it, which is
+  driven by the allocations of container objects.
+  """
+
+  if sampler is not None:
+    sampler.label = "%s;%s" % (measure["method"], phase)
+  collections = gcCollections()
+  blocks = sys.getallocatedblocks()
+  start = time.perf_counter()
+  try:
+    f()
+  finally:
+    elapsed = time.perf_counter() - start
+    if sampler is not None:
+      sampler.label = None
+    m = measure["phases"][phase]
+    m["time"] = elapsed
+    m["blocks"] = sys.getallocatedblocks() - blocks
+    m["collections"] = gcCollections() - collections
+
+def runCount(methodClass, cleanBallots, options, reportClass, seed,
+             sampler=None, traceMemory=False):
+  """Count the ballots once with a method and generate the report.
+
+  Returns the time and allocations of each phase, and with traceMemory
+  the peak memory traced by tracemalloc during each phase.
+  """
+
+  measure = {"method": methodClass.__name__,
+             "phases": dict([(phase, {}) for phase in phases])}
+
+  e = methodClass(cleanBallots)
+  e.setSeed(seed)
+  for (name, value) in options.items():
+    setattr(e, name, value)
+
+  def preCount():
+    if not e.narrative:
+      e.saveInitialState()
+    e.preCount()
+
+  def report():
+    with open(os.devnull, "w") as devnull:
+      r = reportClass(e, outputFile=devnull)
+      r.generateReport()
+
+  for (phase, f) in zip(phases, [preCount, e.countBallots, e.postCount,
+                                 report]):
+    if traceMemory:
+      tracemalloc.start()
+      timePhase(measure, phase, f, sampler)
+      measure["phases"][phase]["peakKB"] = \
+        tracemalloc.get_traced_memory()[1] / 1024.0
+      tracemalloc.stop()
+    else:
+      timePhase(measure, phase, f, sampler)
+
+  return measure
+
+def benchmarkMethod(methodClass, cleanBallots, options, reportClass,
+                    warmup=1, reps=5, seed=0, sampler=None, traceMemory=False):
+  """Benchmark a method with a set of clean ballots.
+
+  The ballots are counted warmup times without being measured and then reps
+  times.  Returns the median and 95th percentile of the time of each phase
+  and of the whole count, with the median allocations.  With traceMemory,
+  the ballots are counted once more under tracemalloc, which is too slow to
+  be timed, to get the peak memory of each phase.
+  """
+
+  result = {"method": methodClass.__name__, "error": None,
+            "phases": {}}
+  try:
+    for i in range(warmup):
+      runCount(methodClass, cleanBallots, options, reportClass, seed)
+    if sampler is not None:
+      sampler.start()
+    try:
+      measures = [runCount(methodClass, cleanBallots, options, reportClass,
+                           seed, sampler)
+                  for i in range(reps)]
+    finally:
+      if sampler is not None:
+        sampler.stop()
+    if traceMemory and tracemalloc is not None:
+      traced = runCount(methodClass, cleanBallots, options, reportClass,
+                        seed, traceMemory=True)
+    else:
+      traced = None
+  except Exception:
+    result["error"] = traceback.format_exc().strip().split("\n")[-1]
+    return result
+
+  for phase in phases:
+    m = [measure["phases"][phase] for measure in measures]
+    times = [x["time"] for x in m]
+    result["phases"][phase] = {
+      "median": median(times),
+      "p95": percentile(times, 95),
+      "blocks": median([x["blocks"] for x in m]),
+      "collections": median([x["collections"] for x in m]),
+      "peakKB": traced["phases"][phase]["peakKB"] if traced else None
+      }
+  totals = [sum([measure["phases"][phase]["time"] for phase in phases])
+            for measure in measures]
+  result["median"] = median(totals)
+  result["p95"] = percentile(totals, 95)
+  return result
+
+##################################################################
+
+def loadBallots(fName, numSeats=None):
+  "Load and clean a ballot file."
+  dirtyBallots = Ballots()
+  dirtyBallots.loadKnown(fName, exclude0=False)
+  if numSeats:
+    dirtyBallots.numSeats = numSeats
+  return dirtyBallots.getCleanBallots()
+
+def generateBallots(numBallots, numCandidates, numSeats=None, seed=0,
+                    model="spars"):
+  """Generate and clean a set of ballots from a random voter model.
+
+  The model and the ballots are drawn from a NumPy random generator seeded
+  with seed, so that the same ballots can be generated again.
+  """
+
+  rng = spars.newRNG(seed)
+  if model == "spars":
+    voterModel = spars.Spars(2)
+    voterModel.random(numCandidates, rng=rng)
+  elif model == "bigrams":
+    voterModel = spars.Bigrams(spars.NOTA)
+    voterModel.random([str(i) for i in range(numCandidates)], rng=rng)
+  else:
+    raise RuntimeError("Unknown voter model '%s'" % model)
+  dirtyBallots = spars.Ballots()
+  dirtyBallots.generate(numBallots, voterModel, rng)
+  if numSeats:
+    dirtyBallots.numSeats = numSeats
+  return dirtyBallots.getCleanBallots()
+
+def runBenchmarks(sources, methodClasses, options, reportClass, warmup=1,
+                  reps=5, seed=0, sampler=None, traceMemory=False, log=None):
+  """Benchmark every method with every set of ballots.
+
+  sources is a list of (name, cleanBallots) pairs.  Returns the results
+  together with some information about the environment they ran in.
+  """
+
+  results = []
+  for (source, cleanBallots) in sources:
+    for methodClass in methodClasses:
+      result = benchmarkMethod(methodClass, cleanBallots, options,
+                               reportClass, warmup, reps, seed, sampler,
+                               traceMemory)
+      result["source"] = source
+      result["numBallots"] = cleanBallots.numBallots
+      result["numCandidates"] = cleanBallots.numCandidates
+      result["numSeats"] = cleanBallots.numSeats
+      results.append(result)
+      if log is not None:
+        log.write(formatResult(result) + "\n")
+        log.flush()
+
+  return {"python": platform.python_version(),
+          "platform": platform.platform(),
+          "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+          "warmup": warmup,
+          "reps": reps,
+          "seed": seed,
+          "results": results}
+
+def formatResult(result):
+  "Return a one line summary of a result."
+  name = "%s %s" % (result["source"], result["method"])
+  if result["error"] is not None:
+    return "%s error: %s" % (name, result["error"])
+  return "%s %.4fs (p95 %.4fs) %s" % (
+    name, result["median"], result["p95"],
+    " ".join(["%s=%.4fs" % (phase, result["phases"][phase]["median"])
+              for phase in phases]))
+
+def writeCSV(results, f):
+  "Write the results with one row for each method and phase."
+  writer = csv.writer(f)
+  writer.writerow(csvColumns)
+  for result in results["results"]:
+    if result["error"] is not None:
+      writer.writerow([result["source"], result["method"]] +
+                      [""] * (len(csvColumns) - 3) + [result["error"]])
+      continue
+    for phase in phases + ["total"]:
+      if phase == "total":
+        m = {"median": result["median"], "p95": result["p95"]}
+      else:
+        m = result["phases"][phase]
+      writer.writerow([result["source"], result["method"], phase,
+                       m["median"], m["p95"], m.get("blocks", ""),
+                       m.get("collections", ""),
+                       "" if m.get("peakKB") is None else m["peakKB"], ""])
+
+##################################################################
+
+if __name__ == "__main__":
+
+  methods = getMethodPlugins("byName", exclude0=False)
+  methodNames = sorted(methods.keys())
+
+  reports = getReportPlugins("byName", exclude0=False)
+  reportNames = sorted(reports.keys())
+
+  usage = """
+Usage:
+
+  benchmarkElection.py [-m methods] [-g ballots] [-c candidates] [-G model]
+                       [-s seats] [-t tiebreak] [-n] [-r report] [-W warmup]
+                       [-x reps] [-S seed] [-M] [-F stacksfile] [-f format]
+                       [-o output] [ballotfile ...]
+
+  -m: comma separated methods to benchmark (default all)
+  -g: generate this many ballots
+  -c: number of candidates of the generated ballots (default 10)
+  -G: voter model of the generated ballots: spars*, bigrams
+  -s: number of seats
+  -t: strong tie-break method: random*, alpha, index
+  -n: count without the narrative, produced by the report
+  -r: report format: %s (default TextReport)
+  -W: number of warm-up counts (default 1)
+  -x: number of measured counts (default 5)
+  -S: seed of the generated ballots and of the random tie breaks
+  -M: count once more under tracemalloc to get the peak memory
+  -F: write the sampled stacks in collapsed format to this file
+  -f: output format: json*, csv
+  -o: output file (default stdout)
+    *default
+
+  Counts the ballots of each ballot file, and the generated ones, with each
+  method, and reports the median and 95th percentile time of preCount,
+  countBallots, postCount and report generation, the net memory blocks
+  they allocate and the garbage collections run. The following methods
+  are available:
+%s
+""" % (", ".join(reportNames),
+       "\n".join(["    " + name for name in methodNames]))
+
+  try:
+    (opts, args) = getopt.getopt(sys.argv[1:], "m:g:c:G:s:t:nr:W:x:S:MF:f:o:")
+  except getopt.GetoptError as err:
+    print(str(err))
+    print(usage)
+    sys.exit(1)
+
+  names = methodNames
+  numBallots = None
+  numCandidates = 10
+  model = "spars"
+  numSeats = None
+  options = {}
+  reportformat = "TextReport"
+  warmup = 1
+  reps = 5
+  seed = 0
+  traceMemory = False
+  stacksFile = None
+  outputFormat = "json"
+  outputFile = None
+  for o, a in opts:
+    if o == "-m":
+      names = a.split(",")
+      for name in names:
+        if name not in methods:
+          print("Unrecognized method '%s'" % name)
+          print(usage)
+          sys.exit(1)
+    if o == "-g":
+      numBallots = int(a)
+    if o == "-c":
+      numCandidates = int(a)
+    if o == "-G":
+      model = a
+    if o == "-s":
+      numSeats = int(a)
+    if o == "-t":
+      if a in ["random", "alpha", "index"]:
+        options["strongTieBreakMethod"] = a
+      else:
+        print("Unrecognized tie-break method '%s'" % a)
+        print(usage)
+        sys.exit(1)
+    if o == "-n":
+      options["narrative"] = False
+    if o == "-r":
+      if a in reportNames:
+        reportformat = a
+      else:
+        print("Unrecognized report format '%s'" % a)
+        print(usage)
+        sys.exit(1)
+    if o == "-W":
+      warmup = int(a)
+    if o == "-x":
+      reps = int(a)
+    if o == "-S":
+      seed = int(a)
+    if o == "-M":
+      traceMemory = True
+    if o == "-F":
+      stacksFile = a
+    if o == "-f":
+      if a in ["json", "csv"]:
+        outputFormat = a
+      else:
+        print("Unrecognized output format '%s'" % a)
+        print(usage)
+        sys.exit(1)
+    if o == "-o":
+      outputFile = a
+
+  if not args and numBallots is None:
+    print("Specify ballot files or a number of ballots to generate")
+    print(usage)
+    sys.exit(1)
+
+  try:
+    sources = [(bltFn, loadBallots(bltFn, numSeats)) for bltFn in args]
+    if numBallots is not None:
+      sources.append(("%s:%d:%d:%d" % (model, numBallots, numCandidates, seed),
+                      generateBallots(numBallots, numCandidates, numSeats,
+                                      seed, model)))
+  except RuntimeError as msg:
+    print(msg)
+    sys.exit(1)
+
+  sampler = StackSampler() if stacksFile else None
+  results = runBenchmarks(sources, [methods[name] for name in names],
+                          options, reports[reportformat], warmup, reps, seed,
+                          sampler, traceMemory, log=sys.stderr)
+
+  f = open(outputFile, "w", newline="") if outputFile else sys.stdout
+  if outputFormat == "csv":
+    writeCSV(results, f)
+  else:
+    f.write(json.dumps(results, indent=2, sort_keys=True) + "\n")
+  if outputFile:
+    f.close()
+
+  if sampler is not None:
+    with open(stacksFile, "w") as f:
+      sampler.write(f)
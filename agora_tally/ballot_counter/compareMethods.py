@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+"compare the outcome of several methods on the same ballots"
+
+# This file is part of agora-tally.
+# Copyright (C) 2026  Agora Voting SL <agora@agoravoting.com>
+
+# agora-tally is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+
+# agora-tally  is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with agora-tally.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(
+  os.path.abspath(__file__)))))
+import getopt
+import json
+import multiprocessing
+import time
+import traceback
+from multiprocessing import shared_memory
+
+from agora_tally.ballot_counter.ballots import Ballots, PackedBallots
+from agora_tally.ballot_counter.plugins import getMethodPlugins
+from agora_tally.ballot_counter.STV import resumeCheckpoint
+
+# Type codes of the packed arrays, in the order they are stored
+arrayTypes = [("candidates", "i"), ("offsets", "q"), ("weights", "q"),
+              ("order", "i")]
+
+##################################################################
+
+def shareBallots(cleanBallots):
+  """Pack clean ballots into a new block of shared memory.
+
+  Returns the block and its layout, a small picklable dict that workers
+  pass to attachBallots().  The caller must close and unlink the block.
+  """
+
+  arrays = dict(zip([name for (name, typecode) in arrayTypes],
+                    PackedBallots.pack(cleanBallots)))
+  layout = {"arrays": [], "names": list(cleanBallots.names),
+            "numSeats": cleanBallots.numSeats, "title": cleanBallots.title,
+            "date": cleanBallots.date}
+  size = 0
+  for (name, typecode) in arrayTypes:
+    a = arrays[name]
+    # Align every array on 8 bytes
+    size += -size % 8
+    layout["arrays"].append((name, typecode, size, len(a)))
+    size += len(a) * a.itemsize
+
+  shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+  for (name, typecode, offset, length) in layout["arrays"]:
+    data = memoryview(arrays[name]).cast("B")
+    shm.buf[offset:offset + len(data)] = data
+  layout["name"] = shm.name
+  return (shm, layout)
+
+def attachBallots(layout):
+  """Attach to ballots shared by shareBallots() without copying them.
+
+  Returns the block of shared memory and the ballots.  Call release() on
+  the ballots before closing the block.
+  """
+
+  shm = shared_memory.SharedMemory(name=layout["name"])
+  views = {}
+  for (name, typecode, offset, length) in layout["arrays"]:
+    itemsize = 4 if typecode == "i" else 8
+    views[name] = shm.buf[offset:offset + length * itemsize].cast(typecode)
+  b = PackedBallots(views["candidates"], views["offsets"], views["weights"],
+                    views["order"], layout["names"])
+  b.numSeats = layout["numSeats"]
+  b.title = layout["title"]
+  b.date = layout["date"]
+  return (shm, b)
+
+def summarize(e):
+  "Return the outcome of an election as a dict."
+
+  result = {"method": e.__class__.__name__,
+            "methodName": e.methodName,
+            "winners": [e.b.names[c] for c in sorted(e.winners)],
+            "numRounds": getattr(e, "numRounds", None),
+            "error": None}
+  if e.iterative:
+    count = e.count[e.numRounds-1]
+  else:
+    count = e.count
+  if not isinstance(count, (list, tuple)) or \
+     len(count) != e.b.numCandidates or \
+     any(isinstance(x, (list, tuple)) for x in count):
+    # Condorcet and others keep matrices rather than a count per candidate
+    return result
+  result["count"] = dict([(e.b.names[c], e.displayValue(count[c]))
+                          for c in range(e.b.numCandidates)])
+  return result
+
+def runMethod(layout, name, options, seed, checkpointDir=None,
+              checkpointInterval=None):
+  """Run one method on shared ballots; the work done by each worker process.
+
+  With checkpointDir, iterative methods save checkpoints there while they
+  count, and a count interrupted in a previous run resumes from its last
+  checkpoint if it was run with the same ballots, options and seed.  The
+  checkpoint is removed once the count is over.
+  """
+
+  methods = getMethodPlugins("byName", exclude0=False)
+  (shm, b) = attachBallots(layout)
+  e = restored = None
+  path = None
+  if checkpointDir is not None and checkpointInterval and \
+     methods[name].iterative:
+    path = os.path.join(checkpointDir, name + ".checkpoint")
+  try:
+    start = time.perf_counter()
+    e = methods[name](b)
+    e.setSeed(seed)
+    for (option, value) in options.items():
+      setattr(e, option, value)
+    resumedAtRound = None
+    restored = resumeCheckpoint(path, e)
+    if restored is not None:
+      e = restored
+      resumedAtRound = e.R
+      e.continueElection()
+    else:
+      if path is not None:
+        e.checkpointInterval = checkpointInterval
+        e.checkpointPath = path
+      e.runElection()
+    result = summarize(e)
+    result["time"] = time.perf_counter() - start
+    result["resumedAtRound"] = resumedAtRound
+    if path is not None and os.path.exists(path):
+      os.remove(path)
+  except Exception:
+    result = {"method": name, "error":
+              traceback.format_exc().strip().split("\n")[-1]}
+  finally:
+    # The views on the shared memory must go before the block is closed
+    e = restored = None
+    b.release()
+    b = None
+    shm.close()
+  return result
+
+def compareMethods(cleanBallots, names, options={}, processes=None, seed=0,
+                   checkpointDir=None, checkpointInterval=10):
+  """Run several methods on the same clean ballots in parallel.
+
+  The ballots are packed once in shared memory, which the worker processes
+  attach to.  Returns a dict with the ballots, the outcome of every method
+  and, for each candidate, the methods electing the candidate.  With
+  checkpointDir, iterative methods save a checkpoint every
+  checkpointInterval rounds, so that running again after a crash resumes
+  their counts.
+  """
+
+  (shm, layout) = shareBallots(cleanBallots)
+  try:
+    context = multiprocessing.get_context("spawn")
+    processes = processes or min(len(names), multiprocessing.cpu_count())
+    pool = context.Pool(processes=max(1, processes))
+    try:
+      results = pool.starmap(runMethod,
+                             [(layout, name, options, seed, checkpointDir,
+                               checkpointInterval) for name in names])
+    finally:
+      pool.close()
+      pool.join()
+  finally:
+    shm.close()
+    shm.unlink()
+
+  electedBy = dict([(name, []) for name in cleanBallots.names])
+  for result in results:
+    for winner in result.get("winners", []):
+      electedBy[winner].append(result["method"])
+  agree = [result for result in results if result["error"] is None]
+  return {"title": cleanBallots.title,
+          "candidates": list(cleanBallots.names),
+          "numSeats": cleanBallots.numSeats,
+          "numBallots": cleanBallots.numBallots,
+          "numWeightedBallots": cleanBallots.numWeightedBallots,
+          "seed": seed,
+          "methods": results,
+          "electedBy": electedBy,
+          "unanimous": len(agree) > 0 and
+                       all(r["winners"] == agree[0]["winners"] for r in agree)}
+
+##################################################################
+
+if __name__ == "__main__":
+
+  methods = getMethodPlugins("byName", exclude0=False)
+  methodNames = sorted(methods.keys())
+
+  usage = """
+Usage:
+
+  compareMethods.py [-m methods] [-s seats] [-t tiebreak] [-j processes]
+                    [-S seed] [-C checkpointdir] [-k rounds] [-o output]
+                    ballotfile
+
+  -m: comma separated methods to run (default IRV,MeekSTV,ERS97STV,
+      Condorcet,Borda)
+  -s: number of seats (for text-format ballot files)
+  -t: strong tie-break method: random*, alpha, index
+  -j: number of worker processes (default one per method, up to the CPUs)
+  -S: seed of the random tie breaks
+  -C: directory of the checkpoints of iterative methods (default
+      ballotfile.checkpoints)
+  -k: rounds between checkpoints, 0 to disable them (default 10)
+  -o: output file (default stdout)
+    *default
+
+  Cleans the ballots once, shares them with worker processes that run each
+  method, and writes JSON comparing their winners and numbers of rounds.
+  Counts interrupted by a crash resume from their checkpoints when run
+  again with the same ballots, seats, options and seed.
+  The following methods are available:
+%s
+""" % "\n".join(["    " + name for name in methodNames])
+
+  try:
+    (opts, args) = getopt.getopt(sys.argv[1:], "m:s:t:j:S:C:k:o:")
+  except getopt.GetoptError as err:
+    print(str(err))
+    print(usage)
+    sys.exit(1)
+
+  names = ["IRV", "MeekSTV", "ERS97STV", "Condorcet", "Borda"]
+  numSeats = None
+  options = {}
+  processes = None
+  seed = 0
+  checkpointDir = None
+  checkpointInterval = 10
+  outputFile = None
+  for o, a in opts:
+    if o == "-m":
+      names = a.split(",")
+      for name in names:
+        if name not in methods:
+          print("Unrecognized method '%s'" % name)
+          print(usage)
+          sys.exit(1)
+    if o == "-s":
+      numSeats = int(a)
+    if o == "-t":
+      if a in ["random", "alpha", "index"]:
+        options["strongTieBreakMethod"] = a
+      else:
+        print("Unrecognized tie-break method '%s'" % a)
+        print(usage)
+        sys.exit(1)
+    if o == "-j":
+      processes = int(a)
+    if o == "-S":
+      seed = int(a)
+    if o == "-C":
+      checkpointDir = a
+    if o == "-k":
+      checkpointInterval = int(a)
+    if o == "-o":
+      outputFile = a
+
+  if len(args) != 1:
+    print("Specify a ballot file")
+    print(usage)
+    sys.exit(1)
+
+  try:
+    dirtyBallots = Ballots()
+    dirtyBallots.loadKnown(args[0], exclude0=False)
+    if numSeats:
+      dirtyBallots.numSeats = numSeats
+    cleanBallots = dirtyBallots.getCleanBallots()
+  except RuntimeError as msg:
+    print(msg)
+    sys.exit(1)
+
+  if checkpointDir is None:
+    checkpointDir = args[0] + ".checkpoints"
+  if checkpointInterval:
+    if not os.path.isdir(checkpointDir):
+      os.makedirs(checkpointDir)
+  else:
+    checkpointDir = None
+
+  results = compareMethods(cleanBallots, names, options, processes, seed,
+                           checkpointDir, checkpointInterval)
+  if checkpointDir is not None and not os.listdir(checkpointDir):
+    os.rmdir(checkpointDir)
+  output = json.dumps(results, indent=2, sort_keys=True)
+  if outputFile:
+    with open(outputFile, "w") as f:
+      f.write(output + "\n")
+  else:
+    print(output)
@@ -0,0 +1,129 @@
+"Vectorized pairwise comparison engine"
+
+# This file is part of agora-tally.
+# Copyright (C) 2026  Agora Voting SL <agora@agoravoting.com>
+
+# agora-tally is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+
+# agora-tally  is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with agora-tally.  If not, see <http://www.gnu.org/licenses/>.
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+# Maximum number of candidate pairs expanded at once when accumulating
+# the pairwise matrix.  Bounds the temporary memory used by long ballots.
+PAIRS_PER_CHUNK = 1 << 22
+
+##################################################################
+
+def available():
+  "Return True if the vectorized engine can be used."
+  return numpy is not None
+
+##################################################################
+
+def pairwiseMatrix(b):
+  """Compute the pairwise comparison matrix of a set of clean ballots.
+
+  pMat[c][d] is the number of votes ranking candidate c over candidate d,
+  where a ranked candidate is preferred to any unranked one.  Every ranked
+  pair is accumulated once per unique ballot with its weight, so that
+  pMat = rankedWeight - Pairs^T, where rankedWeight[c] is the weight of the
+  ballots ranking c and Pairs[c][d] the weight of those ranking c before d.
+  """
+
+  n = b.numCandidates
+  pairs = numpy.zeros(n * n, numpy.float64)
+  ranked = numpy.zeros(n, numpy.float64)
+
+  # Group the unique ballots by length so that each group is a matrix
+  byLength = {}
+  for i in range(b.numWeightedBallots):
+    weight, ballot = b.getWeightedBallot(i)
+    if len(ballot) == 0:
+      continue
+    group = byLength.setdefault(len(ballot), ([], []))
+    group[0].append(weight)
+    group[1].append(ballot)
+
+  for length, (weights, ballots) in byLength.items():
+    weights = numpy.array(weights, numpy.float64)
+    ballots = numpy.array(ballots, numpy.int64)
+    ranked += numpy.bincount(ballots.ravel(), numpy.repeat(weights, length),
+                             minlength=n)
+    if length == 1:
+      continue
+    first, second = numpy.triu_indices(length, 1)
+    rows = max(1, PAIRS_PER_CHUNK // len(first))
+    for start in range(0, len(ballots), rows):
+      chunk = ballots[start:start+rows]
+      index = chunk[:, first] * n + chunk[:, second]
+      pairs += numpy.bincount(index.ravel(),
+                              numpy.repeat(weights[start:start+rows],
+                                           len(first)),
+                              minlength=n * n)
+
+  # Weights are integers, and the sums fit exactly in a double
+  pairs = numpy.rint(pairs).astype(numpy.int64).reshape(n, n)
+  ranked = numpy.rint(ranked).astype(numpy.int64)
+  pMat = ranked[:, numpy.newaxis] - pairs.T
+  numpy.fill_diagonal(pMat, 0)
+  return pMat
+
+##################################################################
+
+def smithSet(pMat):
+  """Return the sorted Smith set of a pairwise matrix.
+
+  c beats or ties d when pMat[c][d] >= pMat[d][c].  This relation is
+  complete, so its top strongly connected component is the shortest prefix
+  of the candidates, ordered by decreasing number of wins and ties, whose
+  members strictly beat every candidate outside of it.
+  """
+
+  n = len(pMat)
+  dominates = pMat >= pMat.T
+  numpy.fill_diagonal(dominates, True)
+  order = numpy.argsort(-dominates.sum(axis=1), kind="stable")
+  dominates = dominates[order][:, order]
+
+  # lastNotBeaten[k] is the last position not strictly beaten by the k-th
+  # candidate, which is at least k itself
+  notBeaten = ~(dominates & ~dominates.T)
+  lastNotBeaten = n - 1 - numpy.argmax(notBeaten[:, ::-1], axis=1)
+  reach = numpy.maximum.accumulate(lastNotBeaten)
+  size = int(numpy.argmax(reach <= numpy.arange(n))) + 1
+  return sorted(order[:size].tolist())
+
+##################################################################
+
+def beatpathMatrix(pMat):
+  """Return the strongest beatpath magnitudes of a pairwise matrix.
+
+  Only strict defeats are kept, with their magnitude being the number of
+  votes for the winner of the pairwise contest.  The widest paths are then
+  computed with a Floyd-Warshall sweep, one intermediate candidate at a
+  time over the whole matrix.
+  """
+
+  dMat = numpy.where(pMat > pMat.T, pMat, 0)
+  for k in range(len(dMat)):
+    numpy.maximum(dMat, numpy.minimum(dMat[:, k:k+1], dMat[k:k+1, :]),
+                  out=dMat)
+  return dMat
+
+def beatpathWinners(dMat):
+  "Return the sorted candidates not beaten by any beatpath."
+
+  beaten = (dMat.T > dMat).any(axis=1)
+  return numpy.flatnonzero(~beaten).tolist()
@@ -21,6 +21,7 @@ import textwrap
 import pkgutil
 
 from agora_tally.ballot_counter.utils import getHome
+from agora_tally import instrumentation
 
 ##################################################################
 
@@ -179,9 +180,13 @@ class ReportPlugin(object):
   "Base class used to identify report loader plugins."
 
   status = 0
+  needsNarrative = True  # reports of the text describing the count
   
   def __init__(self, e, outputFile=None, test=False):
 
+    # Counts run without the narrative produce it now if needed
+    if self.needsNarrative:
+      e.generateNarrative()
     self.e = e
     self.cleanB = self.e.b
     self.dirtyB = self.e.b.dirtyBallots
@@ -196,12 +201,15 @@ class ReportPlugin(object):
     
   def generateReport(self):
     "Selector for major categories of methods."
-    if self.e.methodName == "Condorcet":
-      self.generateReportCondorcet()
-    elif self.e.iterative:
-      self.generateReportIterative()
-    else:
-      self.generateReportNonIterative()
+    with instrumentation.span("generateReport", "report",
+                              report=self.__class__.__name__,
+                              method=self.e.methodName):
+      if self.e.methodName == "Condorcet":
+        self.generateReportCondorcet()
+      elif self.e.iterative:
+        self.generateReportIterative()
+      else:
+        self.generateReportNonIterative()
 
   def getWinnerText(self, winners, width=0):
     """Get the text for the declaration of winners."""
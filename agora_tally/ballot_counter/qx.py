@@ -14,6 +14,11 @@
 
 __revision__ = "$Id: qx.py 710 2010-02-22 00:19:20Z jlundell $"
 
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
 from agora_tally.ballot_counter.STV import RecursiveSTV
 
 #  class QX: quasi-exact fixed-point arithmetic support
@@ -32,8 +37,8 @@ class QX(object):
   guard = 0
   p = 10**(precision+guard)
   g = 10**guard
-  grnd = g/2
-  geps = g/10
+  grnd = g//2
+  geps = g//10
   One = p
   Epsilon = 1
   maxDiff = 0
@@ -54,8 +59,8 @@ class QX(object):
     "set number of decimal guard digits"
     QX.guard = v
     QX.g = 10 ** QX.guard
-    QX.grnd = QX.g/2
-    QX.geps = QX.g/10
+    QX.grnd = QX.g//2
+    QX.geps = QX.g//10
     QX.set_precision(e, QX.precision)
 
   @staticmethod
@@ -98,12 +103,12 @@ class QX(object):
   @staticmethod
   def mult(a, b):
     "multiply two fixed-point numbers"
-    return a * b / QX.p
+    return a * b // QX.p
 
   @staticmethod
   def div(a, b):
     "divide two fixed-point numbers"
-    return (a * QX.p) / b
+    return (a * QX.p) // b
 
   @staticmethod
   def add(a, b):
@@ -121,8 +126,8 @@ class QX(object):
     if QX.p == 0:
       return str(v)
     nfmt = "%d.%0" + str(QX.precision) + "d" # %d.%0_d
-    gv = (v + QX.grnd)/QX.g	              # round off guard digits
-    return nfmt % (gv/(QX.p/QX.g), gv%(QX.p/QX.g))
+    gv = (v + QX.grnd)//QX.g	              # round off guard digits
+    return nfmt % (gv//(QX.p//QX.g), gv%(QX.p//QX.g))
 
   @staticmethod
   def postCount(e, R):
@@ -145,12 +150,212 @@ prec:    %d
 
 ##################################################################
 
+#  class QXArray: QX arithmetic on whole arrays of values
+#
+#  All methods of QXArray are static and follow the precision, guard and
+#  rounding rules of QX, giving the same results value by value.  Arrays
+#  hold 64-bit integers when the values and intermediate products provably
+#  fit in them, which is checked from the largest magnitudes involved, and
+#  exact Python ints otherwise.  Requires numpy.
+#
+class QXArray(object):
+  "Fixed-point arithmetic on arrays with the rounding rules of QX"
+  maxInt = 2**63 - 1
+
+  @staticmethod
+  def available():
+    "Return True if the arrays can be used."
+    return numpy is not None
+
+  @staticmethod
+  def array(values):
+    "Return an array of integers"
+    if isinstance(values, numpy.ndarray) and values.dtype != numpy.float64:
+      return values
+    values = [int(v) for v in values]
+    if len(values) > 0 and max(abs(v) for v in values) > QXArray.maxInt:
+      return numpy.array(values, dtype=object)
+    return numpy.array(values, dtype=numpy.int64)
+
+  @staticmethod
+  def zeros(n, bound):
+    "Return an array of n zeros that can hold values up to bound"
+    if bound > QXArray.maxInt:
+      return numpy.array([0] * n, dtype=object)
+    return numpy.zeros(n, dtype=numpy.int64)
+
+  @staticmethod
+  def bound(a):
+    "Return the largest magnitude in an array or of a number"
+    if isinstance(a, numpy.ndarray):
+      if a.size == 0:
+        return 0
+      return int(abs(a).max())
+    return abs(int(a))
+
+  @staticmethod
+  def exact(a, b, bound):
+    """Return a and b as arrays of 64-bit integers if the results of an
+    operation on them are bounded by bound, and as Python ints otherwise"""
+    if bound <= QXArray.maxInt and \
+       getattr(a, "dtype", None) != object and \
+       getattr(b, "dtype", None) != object:
+      return numpy.int64(a) if numpy.ndim(a) == 0 else a, b
+    if isinstance(a, numpy.ndarray):
+      a = a.astype(object)
+    else:
+      a = int(a)
+    if isinstance(b, numpy.ndarray):
+      b = b.astype(object)
+    else:
+      b = int(b)
+    return a, b
+
+  @staticmethod
+  def narrow(a):
+    "Store an array in 64-bit integers if its values fit"
+    if isinstance(a, numpy.ndarray) and a.dtype == object and \
+       QXArray.bound(a) <= QXArray.maxInt:
+      return a.astype(numpy.int64)
+    return a
+
+  @staticmethod
+  def fix(a):
+    "convert ints to fixed point"
+    return QXArray.mul(a, QX.p)
+
+  @staticmethod
+  def mul(a, b):
+    "multiply two arrays of integers exactly"
+    a, b = QXArray.exact(a, b, QXArray.bound(a) * QXArray.bound(b))
+    return QXArray.narrow(a * b)
+
+  @staticmethod
+  def mulDiv(a, b, d):
+    "return a * b // d with the product computed exactly"
+    bound = QXArray.bound(a) * QXArray.bound(b)
+    if getattr(d, "dtype", None) == object:
+      bound = QXArray.maxInt + 1
+    a, b = QXArray.exact(a, b, bound)
+    if getattr(a, "dtype", None) == object and isinstance(d, numpy.ndarray):
+      d = d.astype(object)
+    return QXArray.narrow(a * b // d)
+
+  @staticmethod
+  def mult(a, b):
+    "multiply two arrays of fixed-point numbers"
+    return QXArray.mulDiv(a, b, QX.p)
+
+  @staticmethod
+  def div(a, b):
+    "divide two arrays of fixed-point numbers"
+    return QXArray.mulDiv(a, QX.p, b)
+
+  @staticmethod
+  def add(a, b):
+    "add two arrays of fixed-point numbers"
+    a, b = QXArray.exact(a, b, QXArray.bound(a) + QXArray.bound(b))
+    return QXArray.narrow(a + b)
+
+  @staticmethod
+  def sub(a, b):
+    "subtract two arrays of fixed-point numbers"
+    a, b = QXArray.exact(a, b, QXArray.bound(a) + QXArray.bound(b))
+    return QXArray.narrow(a - b)
+
+  @staticmethod
+  def minimum(a, b):
+    "return the smaller of a and b, value by value"
+    a, b = QXArray.exact(a, b, max(QXArray.bound(a), QXArray.bound(b)))
+    return QXArray.narrow(numpy.minimum(a, b))
+
+  @staticmethod
+  def addAt(total, index, values):
+    "add values[k] to total[index[k]] for every k, in place"
+    if total.dtype == object and values.dtype != object:
+      values = values.astype(object)
+    numpy.add.at(total, index, values)
+
+  @staticmethod
+  def sum(a):
+    "return the exact sum of an array"
+    if a.dtype != object and QXArray.bound(a) * len(a) <= QXArray.maxInt:
+      return int(a.sum())
+    return int(a.astype(object).sum())
+
+  @staticmethod
+  def groupSum(values, groups, n):
+    "return the exact sum of the values in each of n groups, as a list"
+    total = QXArray.zeros(n, QXArray.bound(values) * len(values))
+    QXArray.addAt(total, groups, values)
+    return [int(v) for v in total]
+
+  @staticmethod
+  def eqWhere(a, b, where):
+    """Compare a and b within the guard where a mask is set, updating the
+    statistics of QX only for those values as QX.eq() would"""
+    a, b = numpy.broadcast_arrays(a, b)
+    a, b = QXArray.exact(a, b, QXArray.bound(a) + QXArray.bound(b))
+    gdiff = abs(a[where] - b[where])
+    close = gdiff < QX.geps
+    if close.any():
+      QX.maxDiff = max(QX.maxDiff, int(gdiff[close].max()))
+    if (~close).any():
+      QX.minDiff = min(QX.minDiff, int(gdiff[~close].min()))
+    result = numpy.zeros(a.shape, dtype=bool)
+    result[where] = close
+    return result
+
+  @staticmethod
+  def eq(a, b):
+    "return a boolean array of a == b"
+    if QX.guard == 0:
+      return numpy.asarray(a == b)
+    where = numpy.ones(numpy.broadcast(a, b).shape, dtype=bool)
+    return QXArray.eqWhere(a, b, where)
+
+  @staticmethod
+  def lt(a, b):
+    "return a boolean array of a < b"
+    less = numpy.asarray(a < b)
+    if QX.guard == 0:
+      return less
+    return less & ~QXArray.eqWhere(a, b, less)
+
+  @staticmethod
+  def gt(a, b):
+    "return a boolean array of a > b"
+    greater = numpy.asarray(a > b)
+    if QX.guard == 0:
+      return greater
+    return greater & ~QXArray.eqWhere(a, b, greater)
+
+  @staticmethod
+  def le(a, b):
+    "return a boolean array of a <= b"
+    lessEqual = numpy.asarray(a <= b)
+    if QX.guard == 0:
+      return lessEqual
+    return lessEqual | QXArray.eqWhere(a, b, ~lessEqual)
+
+  @staticmethod
+  def ge(a, b):
+    "return a boolean array of a >= b"
+    greaterEqual = numpy.asarray(a >= b)
+    if QX.guard == 0:
+      return greaterEqual
+    return greaterEqual | QXArray.eqWhere(a, b, ~greaterEqual)
+
+##################################################################
+
 class RecursiveQXSTV(RecursiveSTV):
   """Class that reimplements recursive methods using QX (quasi-exact) arithmetic.
   
   No additional attributes.
   """
 
+  exactTies = False   # ties are found within the precision
+
   def __init__(self, b):
     RecursiveSTV.__init__(self, b)
     self.prec = 9
@@ -179,7 +384,7 @@ class RecursiveQXSTV(RecursiveSTV):
     "RecursiveQXSTV: Compute the value of the winning threshold."
 
     threshNum = QX.fix(self.b.numBallots) - self.exhausted[self.R]
-    self.thresh[self.R] = threshNum/(self.numSeats + 1)
+    self.thresh[self.R] = threshNum//(self.numSeats + 1)
 
   def updateWinners(self):
     "RecursiveQXSTV: Find new winning candidates."
@@ -201,15 +406,12 @@ class RecursiveQXSTV(RecursiveSTV):
     else:
       return True
     
-  def getSureLosers(self, R=None):
-    "RecursiveQXSTV: Return all candidates who are sure losers."
+  def computeSureLosers(self, R):
+    "RecursiveQXSTV: Compute the sure losers at round R."
 
     # Return all candidates who are sure losers but do not look at previous
     # rounds to break ties.
 
-    if R is None: 
-      R = self.R - 1
-      
     maxNumLosers = len(self.continuing) + len(self.winners) - self.numSeats
     assert(maxNumLosers < len(self.continuing))
     losers = []
@@ -279,13 +481,16 @@ class RecursiveQXSTV(RecursiveSTV):
         if rem > 0: 
           kf += QX.Epsilon
         self.keepFactor[self.R][c] = kf
-        winners.append("%s, %s"\
-                       % (self.b.names[c],
-                          self.displayValue(self.keepFactor[self.R][c]))
-                       )
+        if self.narrative:
+          winners.append("%s, %s"\
+                         % (self.b.names[c],
+                            self.displayValue(self.keepFactor[self.R][c]))
+                         )
       else:
         self.keepFactor[self.R][c] = self.keepFactor[self.R-1][c]
 
+    if not self.narrative:
+      return ""
     if len(self.winners) != 0:
       desc += self.b.joinList(winners, convert="none") + ". "
     return desc
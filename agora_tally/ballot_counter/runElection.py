@@ -5,25 +5,25 @@ __revision__ = "$Id: runElection.py 715 2010-02-27 17:00:55Z jeff.oneill $"
 
 import sys
 import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(
+  os.path.abspath(__file__)))))
 import getopt
 
 from agora_tally.ballot_counter.ballots import Ballots
 from agora_tally.ballot_counter.plugins import getMethodPlugins, getReportPlugins
+from agora_tally import instrumentation
 
 methods = getMethodPlugins("byName", exclude0=False)
-methodNames = methods.keys()
-methodNames.sort()
+methodNames = sorted(methods.keys())
 
 reports = getReportPlugins("byName", exclude0=False)
-reportNames = reports.keys()
-reportNames.sort()
+reportNames = sorted(reports.keys())
 
 usage = """
 Usage:
 
   runElection.py [-p prec] [-r report] [-t tiebreak] [-w weaktie] [-s seats] 
-                 [-P] [-x reps] method ballotfile
+                 [-P] [-x reps] [-T tracefile] [-S seed] method ballotfile
 
   -p: override default precision (in digits)
   -r: report format: %s
@@ -32,6 +32,8 @@ Usage:
   -s: number of seats (for text-format ballot files)
   -P: profile and send output to profile.out
   -x: specify repeat count (for profiling)
+  -T: write a timeline of the count in Chrome trace format to tracefile
+  -S: seed of the random tie breaks
     *default
 
   Runs an election for the given method and ballot file. Results are
@@ -42,7 +44,7 @@ Usage:
 
 # Parse the command line.
 try:
-  (opts, args) = getopt.getopt(sys.argv[1:], "Pp:r:s:t:w:x:")
+  (opts, args) = getopt.getopt(sys.argv[1:], "Pp:r:s:t:w:x:T:S:")
 except getopt.GetoptError as err:
   print(str(err)) # will print something like "option -a not recognized"
   print(usage)
@@ -55,6 +57,8 @@ strongTieBreakMethod = None
 weakTieBreakMethod = None
 numSeats = None
 prec = None
+tracefile = None
+seed = None
 for o, a in opts:
   if o == "-r":
     if a in reportNames:
@@ -88,6 +92,10 @@ for o, a in opts:
     profilefile = "profile.out"
   if o == "-x":
     reps = int(a)
+  if o == "-T":
+    tracefile = a
+  if o == "-S":
+    seed = int(a)
 
 if len(args) != 2:
   if len(args) < 2:
@@ -125,9 +133,15 @@ def doElection(reps=1):
       e.weakTieBreakMethod = weakTieBreakMethod
     if prec is not None:
       e.prec = prec
+    if seed is not None:
+      e.setSeed(seed)
     e.runElection()
   return e
 
+trace = instrumentation.ChromeTrace()
+if tracefile:
+  instrumentation.add_listener(trace)
+
 if profile:
   cProfile.run('e = doElection(reps)', profilefile)
 else:
@@ -136,6 +150,9 @@ else:
 r = reports[reportformat](e)
 r.generateReport()
 
+if tracefile:
+  trace.write(tracefile)
+
 if profile:
   p = pstats.Stats(profilefile)
   p.strip_dirs().sort_stats('time').print_stats(50)
@@ -108,18 +108,25 @@ Ballots -> Spars: Spars.estimate()
 __revision__ = "$Id: spars.py 693 2010-01-03 19:12:05Z jeff.oneill $"
 
 import re
-import string
 import math
 import os.path
 import time
 import random
-from types import *
 
-from agora_tally.ballot_counter import STV
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+from agora_tally.ballot_counter import ballots
 
 NOTA = 1
 noNOTA = 0
-eps = STV.eps
+eps = 1e-6
+
+# Number of ballots generated at once by the vectorized generators.
+# Bounds the temporary memory used for many candidates.
+ROWS_PER_CHUNK = 1 << 16
 
 ##################################################################
 
@@ -147,7 +154,7 @@ def entropy(x):
       e -= p * math.log(p)
   return e
 
-def probDist(n, low = 0.8, high=1.0):
+def probDist(n, low = 0.8, high=1.0, rng=None):
   """Generate a probability distribution randomly in an entropy range.
 
   Returns a vector of length n where each element is in [0,1] and the
@@ -173,11 +180,13 @@ def probDist(n, low = 0.8, high=1.0):
     p[i] = p[n] * tan(a[i])   for i != n
   This is only an approximation to a uniform distribution but it is
   accurate for higher entropies.  The rejection method is used to
-  get probabilities in the desired entropy range."""
+  get probabilities in the desired entropy range.  The angles are drawn
+  from rng if given, otherwise from the random module."""
 
   if high > 1.0 or high < low or low < 0.0:
     raise RuntimeError("high and low must be in [0,1].")
 
+  uniform = random.uniform if rng is None else rng.uniform
   eMax = entropy([1.0/n]*n)
   eLow = eMax * low
   eHigh = eMax * high
@@ -186,7 +195,7 @@ def probDist(n, low = 0.8, high=1.0):
   while not (e < eHigh and e > eLow):
     angles = []
     for i in range(n-1):
-      angles.append(random.uniform(0, math.pi/2))
+      angles.append(uniform(0, math.pi/2))
     sumtan = sum([math.tan(i) for i in angles])
     x = [1.0/(1+sumtan)]
     for i in range(n-1):
@@ -218,6 +227,19 @@ def pickOne(p, candidates):
   # This will happen if all candidates have probability 0.
   return ""
 
+def newRNG(seed=None):
+  "Return a NumPy random generator for the vectorized generators."
+  return numpy.random.default_rng(seed)
+
+def pickEach(rng, weights):
+  """Randomly pick one column in each row of an array of weights.
+
+  Rows where all the weights are 0 pick the first column."""
+
+  cum = weights.cumsum(axis=1)
+  x = rng.random(len(weights)) * cum[:, -1]
+  return (cum > x[:, numpy.newaxis]).argmax(axis=1)
+
 
 ##################################################################
 
@@ -239,22 +261,27 @@ class Spars:
 
 ###
     
-  def genCoord(self, a=1):
+  def genCoord(self, a=1, rng=None):
     "Generate a coordinate from Gaussian(0,a) distribution."
+    if rng is not None:
+      return rng.normal(0, a, self.d).tolist()
     p = []
     for i in range(self.d):
       p.append(random.gauss(0, a))
     return p
 
-  def random(self, n, a=0.5, norm='none'):
-    "Generate coordinates for n candidates from a Gaussian distribution."
+  def random(self, n, a=0.5, norm='none', rng=None):
+    """Generate coordinates for n candidates from a Gaussian distribution.
+
+    The coordinates are drawn from rng if given, otherwise from the
+    random module."""
 
     self.c = []
     self.p = {}
     
     for i in range(n):
       self.c.append(str(i))
-      self.p[str(i)] = self.genCoord(a)
+      self.p[str(i)] = self.genCoord(a, rng)
 
     if norm == 'none':
       return
@@ -298,6 +325,22 @@ class Spars:
 
     return cList
 
+  def genRankings(self, n, rng):
+    """Generate n ballots at once from the spatial parameters.
+
+    Returns a matrix where each row ranks all of the candidates, by
+    their index in self.c, in order of proximity to a voter drawn from
+    a unit gaussian, and the lengths of the ballots."""
+
+    coords = numpy.array([self.p[c] for c in self.c], numpy.float64)
+    rankings = numpy.empty((n, len(self.c)), numpy.int32)
+    for start in range(0, n, ROWS_PER_CHUNK):
+      voters = rng.standard_normal((min(ROWS_PER_CHUNK, n - start), self.d))
+      dist = ((voters[:, numpy.newaxis, :] -
+               coords[numpy.newaxis, :, :]) ** 2).sum(axis=2)
+      rankings[start:start+len(voters)] = dist.argsort(axis=1, kind="stable")
+    return (rankings, numpy.full(n, len(self.c), numpy.int32))
+
   def grid(self, n):
     "Create a grid of equiprobable regions for a 2D gaussian."
 
@@ -380,7 +423,7 @@ class Spars:
       
     # display the graph
     for i in range(2*ybins+1):
-      print(string.join(graph[i], ""))
+      print("".join(graph[i]))
 
 ##################################################################
 
@@ -510,7 +553,7 @@ class Bigrams:
     else:
       f.write("NOTA = 0\n")
 
-    f.write(string.join(self.c) + "\n")
+    f.write(" ".join(self.c) + "\n")
 
     for i in range(len(self.c)):
       f.write("P(len=%d) = %s\n" % (i+1, str(self.plength[i])))
@@ -621,7 +664,7 @@ class Bigrams:
     # Estimate conditional probabilities
     #
 
-    if ( (type(levels) is not IntType) or 
+    if ( (not isinstance(levels, int)) or 
          (levels not in range(1, len(self.c)-1)) ):
       raise RuntimeError("Parameter 'levels' must be an integer between 1 and len(candidates)-2, inclusive.")
 
@@ -645,7 +688,7 @@ class Bigrams:
         else:
           tmp = ballot[:level]
           tmp.sort()
-          previous = string.join(tmp)
+          previous = " ".join(tmp)
         if previous not in par_count[level][current]:
           par_count[level][current][previous] = {}
 
@@ -746,13 +789,56 @@ class Bigrams:
 
     return g
 
-  def random(self, candidates, low=0.8, high=1.0, maxNOTA=0.05):
-    "Generate bigrams randomly in an entropy range."
+  def genRankings(self, n, rng):
+    """Generate n ballots at once from the bigram probabilities.
+
+    Returns a matrix where each row ranks all of the candidates, by
+    their index in self.c, and the lengths of the ballots.  Candidates
+    are ranked as in Ballots.genFromBigrams() until NOTA is picked or
+    all the remaining candidates have probability 0, which gives the
+    length of the ballot.  The remaining rankings are then picked
+    without NOTA, or uniformly, so that ballots can be lengthened."""
+
+    nc = len(self.c)
+    p1 = numpy.array([self.p1[c] for c in self.c], numpy.float64)
+    p2 = numpy.array([[self.p2[c].get(d, 0.0) for d in self.c]
+                      for c in self.c], numpy.float64)
+    pNOTA = numpy.zeros(nc)
+    if self.NOTA:
+      pNOTA = numpy.array([self.p2[c]["NOTA"] for c in self.c])
+
+    rankings = numpy.empty((n, nc), numpy.int32)
+    lengths = numpy.full(n, nc, numpy.int32)
+    for start in range(0, n, ROWS_PER_CHUNK):
+      m = min(ROWS_PER_CHUNK, n - start)
+      rows = numpy.arange(m)
+      unused = numpy.ones((m, nc), bool)
+      length = lengths[start:start+m]
+      weights = numpy.broadcast_to(p1, (m, nc))
+      for k in range(nc):
+        w = numpy.where(unused, weights, 0.0)
+        total = w.sum(axis=1)
+        if k > 0 and self.NOTA:
+          x = rng.random(m) * (total + pNOTA[c])
+          length[(length == nc) & (x >= total)] = k
+        empty = total == 0
+        length[empty & (length == nc)] = k
+        w[empty] = unused[empty]
+        c = pickEach(rng, w)
+        rankings[start:start+m, k] = c
+        unused[rows, c] = False
+        weights = p2[c]
+    return (rankings, lengths)
+
+  def random(self, candidates, low=0.8, high=1.0, maxNOTA=0.05, rng=None):
+    "Generate bigrams randomly in an entropy range, drawing from rng if given."
+
+    uniform = random.uniform if rng is None else rng.uniform
 
     self.c = candidates
     self.comment = "Generated randomly with entropy range [%3.1f, %3.1f]" % (low, high)
     self.p1 = {}
-    x = probDist(len(candidates), low, high)
+    x = probDist(len(candidates), low, high, rng)
     for c in candidates:
       self.p1[c] = x.pop()
     e = entropy(self.p1.values()) # check for validity!
@@ -760,8 +846,8 @@ class Bigrams:
     self.p2 = self.initP2Dict()
     for c in candidates:
       if self.NOTA:
-        self.p2[c]["NOTA"] = random.uniform(0, maxNOTA)
-      x = probDist(len(candidates)-1, low, high)
+        self.p2[c]["NOTA"] = uniform(0, maxNOTA)
+      x = probDist(len(candidates)-1, low, high, rng)
       for d in candidates:
         if c == d:
           continue
@@ -772,40 +858,41 @@ class Bigrams:
 
 ##################################################################
 
-class Ballots(STV.Ballots):
-  """Class for working with ballot data.
+class Ballots(ballots.Ballots):
+  """Class for working with ballot data generated from a model.
 
-  fName      -- File name where the ballot data is stored.
   c          -- List of all the possible candidates.
-  n          -- Number of ballots.
-  raw        -- List of all ballots.
-  packed     -- List of unique ballots.
-  weight     -- Number of times that each packed ballot occurred.
   comment    -- Some information as to where the data came from.
   """
 
-  def generate(self, n, model):
-    "Wrapper routine for generating ballots from different models."
+  def generate(self, n, model, rng=None):
+    """Wrapper routine for generating ballots from different models.
+
+    If rng is a NumPy random generator, all the ballots are generated
+    at once with the vectorized generator of the model."""
 
-    self.n = n # number of ballots to generate
     self.c = model.c
-    self.nCand = len(self.c)
-    self.raw = []
+    self.names = model.c
 
     self.comment = "Ballots generated randomly on " 
     self.comment += time.strftime("%x %X %Z") + ".\n"
     self.comment += "Parameters are %s.\n" % (model.pars)
 
+    if model.pars not in ["bigrams", "spars"]:
+      raise RuntimeError("Can't generate ballots from this object.")
+
+    if rng is not None:
+      (rankings, lengths) = model.genRankings(n, rng)
+      for ballot, length in zip(rankings.tolist(), lengths.tolist()):
+        self.appendBallot(ballot[:length])
+      return
+
     for i in range(n):
       if model.pars == "bigrams":
         ballot = self.genFromBigrams(model)
-      elif model.pars == "spars":
-        ballot = self.genFromSpars(model)
       else:
-        raise RuntimeError("Can't generate ballots from this object.")
-      self.raw.append(ballot)
-
-    self.pack()
+        ballot = self.genFromSpars(model)
+      self.appendBallotUsingNames(ballot)
 
   def genFromBigrams(self, bigrams):
     """Generate one ballot from bigram probabilities.
@@ -0,0 +1,340 @@
+#!/usr/bin/env python
+
+# This file is part of agora-tally.
+# Copyright (C) 2026  Agora Voting SL <agora@agoravoting.com>
+
+# agora-tally is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+
+# agora-tally  is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with agora-tally.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+End to end benchmarks of do_dirtally() and do_tartally() on synthetic
+elections. Every tally runs in a fresh process, so that its peak RSS is its
+own, and reports its throughput and the wall time spent parsing votes,
+aggregating them and in post_tally(). Results are written as JSON and can be
+compared with the results of a previous release to detect regressions.
+'''
+
+import argparse
+import codecs
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+import traceback
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from agora_tally import synthetic
+from agora_tally.tally import do_dirtally, do_tartally
+from agora_tally.voting_systems.base import get_voting_system_classes
+
+# phases of a tally and the tally methods timed for each of them. The time
+# not spent in any of them, reading files and in pre_tally(), is 'other'.
+PHASES = (
+    ('parse', 'parse_vote'),
+    ('aggregate', 'add_vote'),
+    ('post_tally', 'post_tally'),
+)
+
+# parameters identifying a benchmark case, used to match cases when comparing
+CASE_KEYS = ('tally_type', 'mode', 'voters', 'answers', 'max', 'skew',
+             'unique_votes')
+
+class PhaseTimer(object):
+    '''
+    Monkey patcher for do_tally() that accumulates the wall time spent in
+    each phase of the tallies
+    '''
+
+    def __init__(self):
+        self.times = dict((phase, 0.0) for phase, method in PHASES)
+
+    def __call__(self, tally):
+        for phase, method in PHASES:
+            self.wrap(tally, phase, method)
+
+    def wrap(self, tally, phase, method_name):
+        method = getattr(tally, method_name)
+        times = self.times
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                times[phase] += time.perf_counter() - start
+
+        setattr(tally, method_name, timed)
+
+def peak_rss_mb():
+    '''
+    Returns the peak resident set size of this process in MB, or None where
+    it is not available
+    '''
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    if sys.platform == 'darwin':
+        return rss / (1024.0 * 1024.0)
+    return rss / 1024.0
+
+def run_tally(path, mode):
+    '''
+    Tallies the election at path, a directory or a tar.gz file depending on
+    the mode, and returns the times of each phase and the peak RSS
+    '''
+    timer = PhaseTimer()
+    start = time.perf_counter()
+    try:
+        if mode == 'tar':
+            do_tartally(path, ignore_invalid_votes=True, monkey_patcher=timer)
+        else:
+            do_dirtally(path, ignore_invalid_votes=True, monkey_patcher=timer)
+        error = None
+    except Exception:
+        error = traceback.format_exc().strip().split('\n')[-1]
+    total = time.perf_counter() - start
+    phases = dict(timer.times)
+    phases['other'] = total - sum(timer.times.values())
+    return dict(time=total, phases=phases, peak_rss_mb=peak_rss_mb(),
+                error=error)
+
+def make_question(tally_type, num_answers, max_selections, num_winners=1):
+    '''
+    Returns a question for the given voting system, with the extra settings
+    that some of them need
+    '''
+    question = dict(
+        answer_total_votes_percentage='over-total-valid-votes',
+        answers=[
+            dict(category='', details='', id=i, text='Answer %d' % i,
+                 urls=[])
+            for i in range(num_answers)
+        ],
+        description='Benchmark question',
+        layout='simple',
+        max=max_selections,
+        min=0,
+        num_winners=num_winners,
+        randomize_answer_order=False,
+        tally_type=tally_type,
+        title='Benchmark question'
+    )
+    if tally_type == 'borda-custom':
+        question['borda_custom_weights'] = list(range(max_selections, 0, -1))
+    return question
+
+def write_tar(dir_path, tar_path):
+    '''
+    Packs an election directory in the layout read by do_tartally()
+    '''
+    with tarfile.open(tar_path, mode='w:gz') as tally_gz:
+        tally_gz.add(os.path.join(dir_path, 'questions_json'),
+                     arcname='question_json')
+        for name in sorted(os.listdir(dir_path)):
+            plaintexts_path = os.path.join(dir_path, name, 'plaintexts_json')
+            if os.path.exists(plaintexts_path):
+                tally_gz.add(plaintexts_path,
+                             arcname=os.path.join(name, 'plaintexts_json'))
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2 == 1:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+def run_case(case, repetitions, seed, work_path, pool):
+    '''
+    Generates the election of a benchmark case and tallies it repetitions
+    times, each in a new process. Returns the result of the case, with the
+    median times and the largest peak RSS of the runs.
+    '''
+    question = make_question(case['tally_type'], case['answers'], case['max'])
+    dir_path = os.path.join(work_path, 'election')
+    start = time.perf_counter()
+    synthetic.generate_election(
+        dir_path, [question], case['voters'], seed,
+        blank_rate=case['blank_rate'], invalid_rate=case['invalid_rate'],
+        unique_votes=case['unique_votes'],
+        skew=case['skew'] if case['skew'] is not None else 1.0)
+    path = dir_path
+    if case['mode'] == 'tar':
+        path = os.path.join(work_path, 'election.tar.gz')
+        write_tar(dir_path, path)
+    generate_time = time.perf_counter() - start
+
+    runs = [pool.apply(run_tally, (path, case['mode']))
+            for i in range(repetitions)]
+    shutil.rmtree(dir_path)
+    if case['mode'] == 'tar':
+        os.remove(path)
+
+    result = dict(case)
+    result['seed'] = seed
+    result['generate_time'] = generate_time
+    result['runs'] = runs
+    result['error'] = runs[-1]['error']
+    result['time'] = median([run['time'] for run in runs])
+    result['votes_per_second'] = case['voters'] / result['time']
+    result['phases'] = dict(
+        (phase, median([run['phases'][phase] for run in runs]))
+        for phase in runs[0]['phases'])
+    rss = [run['peak_rss_mb'] for run in runs if run['peak_rss_mb']]
+    result['peak_rss_mb'] = max(rss) if rss else None
+    return result
+
+def get_cases(tally_types, voters, answers, max_selections, skews, modes,
+              unique_votes=1000, blank_rate=0.01, invalid_rate=0.01):
+    '''
+    Returns the benchmark cases for every combination of the parameters. A
+    skew of None draws every vote independently, otherwise the votes are
+    drawn from a pool of unique_votes ballots with that skew.
+    '''
+    cases = []
+    for tally_type, num_voters, num_answers, max_sel, skew, mode in \
+            itertools.product(tally_types, voters, answers, max_selections,
+                              skews, modes):
+        if max_sel > num_answers:
+            continue
+        cases.append(dict(
+            tally_type=tally_type,
+            mode=mode,
+            voters=num_voters,
+            answers=num_answers,
+            max=max_sel,
+            skew=skew,
+            unique_votes=unique_votes if skew is not None else None,
+            blank_rate=blank_rate,
+            invalid_rate=invalid_rate
+        ))
+    return cases
+
+def run_benchmarks(cases, repetitions=3, seed=0, label=None, log=None):
+    '''
+    Runs the benchmark cases and returns the results with some information
+    about the environment they ran in
+    '''
+    results = []
+    work_path = tempfile.mkdtemp('benchmark')
+    context = multiprocessing.get_context('spawn')
+    # a new process for every tally, so that each peak RSS is its own
+    pool = context.Pool(processes=1, maxtasksperchild=1)
+    try:
+        for case in cases:
+            result = run_case(case, repetitions, seed, work_path, pool)
+            results.append(result)
+            if log is not None:
+                log.write(format_result(result) + "\n")
+                log.flush()
+    finally:
+        pool.close()
+        pool.join()
+        shutil.rmtree(work_path)
+
+    return dict(
+        label=label,
+        python=platform.python_version(),
+        platform=platform.platform(),
+        started=time.strftime('%Y-%m-%dT%H:%M:%S'),
+        repetitions=repetitions,
+        seed=seed,
+        results=results
+    )
+
+def format_result(result):
+    case = ' '.join('%s=%s' % (key, result[key]) for key in CASE_KEYS)
+    if result['error'] is not None:
+        return '%s error: %s' % (case, result['error'])
+    phases = ' '.join('%s=%.3fs' % (phase, result['phases'][phase])
+                      for phase in sorted(result['phases']))
+    rss = result['peak_rss_mb']
+    return '%s %.0f votes/s %s rss=%sMB' % (
+        case, result['votes_per_second'], phases,
+        '%.1f' % rss if rss is not None else '?')
+
+def compare(baseline, current, threshold=1.2):
+    '''
+    Compares benchmark results with a baseline, returning a description of
+    every case where the time or the peak RSS grew more than threshold times
+    '''
+    def key(result):
+        return tuple(result[k] for k in CASE_KEYS)
+
+    base = dict((key(result), result) for result in baseline['results'])
+    regressions = []
+    for result in current['results']:
+        old = base.get(key(result))
+        if old is None or result['error'] or old['error']:
+            continue
+        for metric in ('time', 'peak_rss_mb'):
+            if old[metric] and result[metric] and \
+                    result[metric] > old[metric] * threshold:
+                regressions.append('%s: %s %.3f -> %.3f' % (
+                    ' '.join('%s=%s' % (k, result[k]) for k in CASE_KEYS),
+                    metric, old[metric], result[metric]))
+    return regressions
+
+if __name__ == "__main__":
+    tally_types = [klass.get_id() for klass in get_voting_system_classes()]
+    parser = argparse.ArgumentParser(
+        description="benchmark tallies of synthetic elections")
+    parser.add_argument("--systems", nargs="+", default=tally_types,
+        choices=tally_types, help="voting system ids, all by default")
+    parser.add_argument("--voters", nargs="+", type=int, default=[10000])
+    parser.add_argument("--answers", nargs="+", type=int, default=[10])
+    parser.add_argument("--max", nargs="+", type=int, default=[3],
+        help="maximum number of selections")
+    parser.add_argument("--skew", nargs="+", type=float, default=[None],
+        help="repeat ballots from a pool with these skews")
+    parser.add_argument("--unique-votes", type=int, default=1000,
+        help="size of the pool of ballots used with --skew")
+    parser.add_argument("--tar", action="store_true",
+        help="benchmark do_tartally() too")
+    parser.add_argument("--repetitions", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--label", default=None,
+        help="name of the release being benchmarked")
+    parser.add_argument("--output", default=None, help="JSON results file")
+    parser.add_argument("--compare", default=None,
+        help="JSON results of a baseline to compare with")
+    parser.add_argument("--threshold", type=float, default=1.2)
+    args = parser.parse_args()
+
+    modes = ['dir', 'tar'] if args.tar else ['dir']
+    cases = get_cases(args.systems, args.voters, args.answers, args.max,
+                      args.skew, modes, args.unique_votes)
+    results = run_benchmarks(cases, args.repetitions, args.seed, args.label,
+                             log=sys.stderr)
+
+    if args.output:
+        with codecs.open(args.output, encoding='utf-8', mode='w') as f:
+            f.write(json.dumps(results, indent=4, sort_keys=True))
+
+    if args.compare:
+        with codecs.open(args.compare, encoding='utf-8', mode='r') as f:
+            baseline = json.loads(f.read())
+        regressions = compare(baseline, results, args.threshold)
+        for regression in regressions:
+            print("regression: " + regression)
+        if regressions:
+            exit(1)
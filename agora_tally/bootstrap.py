@@ -0,0 +1,459 @@
+#!/usr/bin/env python
+
+# This file is part of agora-tally.
+# Copyright (C) 2026  Agora Voting SL <agora@agoravoting.com>
+
+# agora-tally is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+
+# agora-tally  is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with agora-tally.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Bootstrap resampling of the outcome of a question. The plaintexts are parsed
+once into a histogram of the unique valid ballots and their number of votes.
+Resamples of the same number of valid votes are then drawn from the
+histogram with multinomial draws, the voting system of the question is run
+on each of them, and the frequency with which every answer wins, and holds
+each winner position, estimates how stable the result is.
+
+Resamples are drawn in blocks of BLOCK_SIZE, each with its own random stream
+spawned from the seed, and the blocks run in worker processes. The result
+only depends on the seed and the number of resamples, not on the number of
+processes.
+
+Systems that give each answer a number of points for each position it is
+ranked at are counted with a vectorized engine, which scores a whole chunk
+of resamples with a single matrix product. Every other system is counted by
+its own tally: the weights of its ballots are replaced with the resampled
+votes and post_tally() is run again.
+
+Every resample gets the seed of the random tie breaks of its tally, drawn
+from the stream of its block, so that both engines give the same results.
+The histogram itself is counted with the seed do_tally() would give the
+question, derived from tally_seed (by default, the seed of the bootstrap).
+'''
+
+import argparse
+import codecs
+import copy
+import glob
+import json
+import multiprocessing
+import os
+import time
+
+import numpy
+
+from agora_tally.tally import derive_seed, parse_votes
+from agora_tally.voting_systems.base import get_voting_system_by_id
+
+# number of resamples of each task run by the worker processes
+BLOCK_SIZE = 100
+
+# maximum number of resampled ballot weights held at once by the vectorized
+# engine, which draws the resamples of a block in chunks of this size
+CHUNK_ELEMENTS = 1 << 22
+
+# voting systems whose tallies break every tie by the text of the answers, so
+# that the vectorized engine gives their winners on its own. The others break
+# ties for the last winner randomly, and the resamples tied there are counted
+# by their tally
+TEXT_TIE_BREAKS = ('plurality-at-large', 'desborda')
+
+# voting systems whose tallies can choose answers without points as winners.
+# The others leave them out, even if that leaves seats empty
+UNSCORED_WINNERS = ('desborda',)
+
+def positional_points(question):
+    '''
+    Returns the points an answer gets for each position it is ranked at with
+    the voting system of the question, or None if the system does not simply
+    add up points per position
+    '''
+    tally_type = question['tally_type']
+    max_options = question['max']
+    if tally_type == 'plurality-at-large':
+        return [1.0] * max_options
+    elif tally_type == 'borda':
+        max_points = question.get('bordas-max-points', question['max'])
+        return [float(max_points - i) for i in range(max_options)]
+    elif tally_type == 'borda-nauru':
+        return [1.0 / (1 + i) for i in range(max_options)]
+    elif tally_type == 'borda-custom':
+        return [float(weight)
+                for weight in question['borda_custom_weights'][:max_options]]
+    elif tally_type == 'desborda':
+        return [80.0 - i for i in range(max_options)]
+    return None
+
+def get_histogram(dir_path, questions, qindex, withdrawals=[]):
+    '''
+    Parses the plaintexts of a question of the election at dir_path, in the
+    layout read by do_dirtally(), as do_tally() does. Returns the unique
+    valid ballots, as tuples of answer indexes, and a numpy array with the
+    number of votes of each of them. Blank and invalid votes are left out.
+    '''
+    question = questions[qindex]
+    tally = get_voting_system_by_id(question['tally_type']).create_tally(
+        None, qindex)
+    plaintexts_path = glob.glob(
+        os.path.join(dir_path, "%d-*" % qindex, "plaintexts_json"))[0]
+
+    votes = dict()
+    with codecs.open(plaintexts_path, encoding='utf-8', mode='r') as plaintexts_file:
+        for line, choices, kind in parse_votes(tally, question, qindex,
+                                               plaintexts_file, withdrawals):
+            if kind == 'valid':
+                choices = tuple(choices)
+                votes[choices] = votes.get(choices, 0) + 1
+
+    ballots = list(votes.keys())
+    counts = numpy.array([votes[ballot] for ballot in ballots], dtype=numpy.int64)
+    return ballots, counts
+
+def get_winners(question):
+    '''
+    Returns the winners of a tallied question as answer indexes, ordered by
+    winner position and then, as some systems give every winner the same
+    position, by total count and text
+    '''
+    winners = [
+        (answer['winner_position'], -answer['total_count'], answer['text'],
+         index)
+        for index, answer in enumerate(question['answers'])
+        if answer.get('winner_position') is not None]
+    return [winner[-1] for winner in sorted(winners)][:question['num_winners']]
+
+class PositionalEngine(object):
+    '''
+    Vectorized engine for the systems supported by positional_points(). The
+    points of each unique ballot are kept as a row of a matrix, so that the
+    points of the answers in a chunk of resamples are the product of the
+    resampled weights and that matrix. Winners are ordered by points and then
+    by text, as the tallies do. Unless the system breaks every tie by text,
+    the resamples with a tie between the first num_winners + 1 answers are
+    counted by a TallyEngine instead, as their winners depend on the random
+    tie breaks of the tally.
+    '''
+
+    name = 'positional'
+
+    def __init__(self, questions, qindex, ballots):
+        question = questions[qindex]
+        points = positional_points(question)
+        num_answers = len(question['answers'])
+        self.num_answers = num_answers
+        self.num_winners = min(question['num_winners'], num_answers)
+        self.points = numpy.zeros((len(ballots), num_answers))
+        for row, ballot in enumerate(ballots):
+            for position, answer in enumerate(ballot[:len(points)]):
+                self.points[row, answer] += points[position]
+        # answers sorted by text, so that a stable sort breaks ties by text
+        self.by_text = numpy.array(sorted(
+            range(num_answers), key=lambda i: question['answers'][i]['text']))
+        self.text_ties = question['tally_type'] in TEXT_TIE_BREAKS
+        self.unscored_winners = question['tally_type'] in UNSCORED_WINNERS
+
+        # the engine counting the tied resamples, created on first use
+        self.tally_args = (questions, qindex, ballots)
+        self.tally_engine = None
+
+    def rank(self, weights, seeds):
+        '''
+        Returns a matrix with the winners of each row of resampled weights,
+        as answer indexes ordered by winner position, or -1 for the seats left
+        empty. The seeds are those of the random tie breaks of each row.
+        '''
+        scores = numpy.dot(weights.astype(numpy.float64), self.points)
+        order = numpy.argsort(-scores[:, self.by_text], axis=1, kind='stable')
+        num_ranked = min(self.num_winners + 1, self.num_answers)
+        ranked = self.by_text[order[:, :num_ranked]]
+        ranked_scores = numpy.take_along_axis(scores, ranked, axis=1)
+        ranks = ranked[:, :self.num_winners].copy()
+        if not self.unscored_winners:
+            ranks[ranked_scores[:, :self.num_winners] == 0] = -1
+        if self.text_ties:
+            return ranks
+
+        # the points of the weights of several positions are not exact, so
+        # close scores are taken as ties
+        tolerance = 1e-9 * numpy.abs(ranked_scores[:, :1])
+        gaps = ranked_scores[:, :-1] - ranked_scores[:, 1:]
+        tied = numpy.nonzero((gaps <= tolerance).any(axis=1))[0]
+        if len(tied) > 0:
+            if self.tally_engine is None:
+                self.tally_engine = TallyEngine(*self.tally_args)
+            ranks[tied] = self.tally_engine.rank(weights[tied], seeds[tied])
+        return ranks
+
+class TallyEngine(object):
+    '''
+    Engine running the tally of the voting system on every resample. Each
+    unique ballot is added once, and the weights of the ballots gathered by
+    the tally are then set to the resampled votes before each post_tally().
+    '''
+
+    name = 'tally'
+
+    def __init__(self, questions, qindex, ballots):
+        self.questions = copy.deepcopy(questions)
+        self.qindex = qindex
+        question = self.questions[qindex]
+        self.num_answers = len(question['answers'])
+        self.num_winners = min(question['num_winners'], self.num_answers)
+        self.tally = get_voting_system_by_id(question['tally_type']).create_tally(
+            None, qindex)
+        self.tally.pre_tally(self.questions)
+
+        # the entry of the tally each unique ballot was added to
+        self.entries = []
+        base_vote = [dict(choices=[]) for q in self.questions]
+        for ballot in ballots:
+            num_entries = len(self.tally.ballots)
+            voter_answers = copy.deepcopy(base_vote)
+            voter_answers[qindex]['choices'] = list(ballot)
+            self.tally.add_vote(voter_answers=voter_answers,
+                                questions=self.questions, is_delegated=False)
+            entries = self.get_entries()
+            if len(entries) > num_entries:
+                self.entries.append(entries[-1])
+                continue
+            # the tally grouped it with a previous ballot, whose votes are
+            # now more than the unique ballots added to it
+            added = [entry for entry in entries
+                     if entry['votes'] > sum(1 for other in self.entries
+                                             if other is entry)]
+            self.entries.append(added[0] if added else None)
+        self.all_ballots = self.tally.ballots
+
+    def get_entries(self):
+        if isinstance(self.tally.ballots, dict):
+            return list(self.tally.ballots.values())
+        return self.tally.ballots
+
+    def set_weights(self, weights):
+        for entry in self.entries:
+            if entry is not None:
+                entry['votes'] = 0
+        for entry, votes in zip(self.entries, weights):
+            if entry is not None:
+                entry['votes'] += int(votes)
+        # ballots without votes are left out, some methods do not accept them
+        if isinstance(self.all_ballots, dict):
+            self.tally.ballots = dict(
+                (key, entry) for key, entry in self.all_ballots.items()
+                if entry['votes'] > 0)
+        else:
+            self.tally.ballots = [
+                entry for entry in self.all_ballots if entry['votes'] > 0]
+
+    def run(self, weights, seed):
+        '''
+        Runs the tally with the given ballot weights and seed of its random
+        tie breaks, and returns its winners, as answer indexes ordered by
+        winner position
+        '''
+        self.set_weights(weights)
+        self.tally.seed = int(seed)
+        questions = copy.deepcopy(self.questions)
+        question = questions[self.qindex]
+        question['winners'] = []
+        question['totals'] = dict(blank_votes=0, null_votes=0, valid_votes=0)
+        for answer in question['answers']:
+            answer['total_count'] = 0
+            answer['winner_position'] = None
+        self.tally.post_tally(questions)
+
+        return get_winners(question)[:self.num_winners]
+
+    def rank(self, weights, seeds):
+        ranks = numpy.full((len(weights), self.num_winners), -1, dtype=numpy.int64)
+        for row, row_weights in enumerate(weights):
+            winners = self.run(row_weights, seeds[row])
+            ranks[row, :len(winners)] = winners
+        return ranks
+
+def create_engine(questions, qindex, ballots, engine=None):
+    '''
+    Returns the engine used to count the resamples: the vectorized one when
+    the voting system supports it, unless engine is 'tally'
+    '''
+    if engine is None:
+        if positional_points(questions[qindex]) is not None:
+            engine = PositionalEngine.name
+        else:
+            engine = TallyEngine.name
+    if engine == PositionalEngine.name:
+        return PositionalEngine(questions, qindex, ballots)
+    elif engine == TallyEngine.name:
+        return TallyEngine(questions, qindex, ballots)
+    raise Exception("unknown bootstrap engine: %s" % engine)
+
+def position_counts(ranks, num_answers, num_winners):
+    '''
+    Returns a matrix with the number of times each answer holds each winner
+    position in the rows of ranks
+    '''
+    counts = numpy.zeros((num_answers, num_winners), dtype=numpy.int64)
+    for position in range(num_winners):
+        winners = ranks[:, position]
+        counts[:, position] += numpy.bincount(
+            winners[winners >= 0], minlength=num_answers)
+    return counts
+
+# state of the worker processes, set by init_worker()
+_worker = dict()
+
+def init_worker(engine_args, counts):
+    _worker['engine'] = create_engine(*engine_args)
+    _worker['counts'] = counts
+
+def run_block(seed_sequence, num_resamples):
+    '''
+    Draws and counts a block of resamples, the task of the worker processes.
+    Returns the number of times each answer holds each winner position.
+    '''
+    engine = _worker['engine']
+    counts = _worker['counts']
+    total = int(counts.sum())
+    probabilities = counts / float(total)
+    rng = numpy.random.default_rng(seed_sequence)
+    # the seeds of the random tie breaks of the tallies have their own stream
+    tie_rng = numpy.random.default_rng(seed_sequence.spawn(1)[0])
+
+    chunk = max(1, min(num_resamples, CHUNK_ELEMENTS // max(1, len(counts))))
+    ret = numpy.zeros((engine.num_answers, engine.num_winners),
+                      dtype=numpy.int64)
+    done = 0
+    while done < num_resamples:
+        size = min(chunk, num_resamples - done)
+        weights = rng.multinomial(total, probabilities, size=size)
+        seeds = tie_rng.integers(0, 2**63, size=size)
+        ret += position_counts(engine.rank(weights, seeds), engine.num_answers,
+                               engine.num_winners)
+        done += size
+    return ret
+
+def bootstrap(questions, qindex, ballots, counts, num_resamples=1000,
+              seed=None, processes=None, engine=None, tally_seed=None):
+    '''
+    Runs the bootstrap of a question on the histogram returned by
+    get_histogram(), with num_resamples resamples. The seed is chosen
+    randomly if not given, and is returned with the results so that they
+    can be reproduced. The histogram is counted with the random tie breaks
+    do_tally() gives the question for tally_seed, or for the seed if not
+    given, so that its winners are those of the tally with that seed. Returns a dict with, for each answer, its winner
+    position in the histogram, the probability that it wins and the
+    probability that it holds each winner position.
+    '''
+    start = time.perf_counter()
+    question = questions[qindex]
+    counts = numpy.asarray(counts, dtype=numpy.int64)
+    if len(ballots) == 0 or counts.sum() == 0:
+        raise Exception("question %d has no valid votes" % qindex)
+    if seed is None:
+        seed = numpy.random.SeedSequence().entropy
+    if tally_seed is None:
+        tally_seed = seed
+
+    engine_args = (questions, qindex, ballots, engine)
+    init_worker(engine_args, counts)
+    local = _worker['engine']
+    observed = local.rank(
+        counts.reshape(1, -1),
+        numpy.array([derive_seed(tally_seed, qindex)], dtype=numpy.uint64))[0]
+
+    num_blocks = (num_resamples + BLOCK_SIZE - 1) // BLOCK_SIZE
+    sizes = [min(BLOCK_SIZE, num_resamples - i * BLOCK_SIZE)
+             for i in range(num_blocks)]
+    tasks = list(zip(numpy.random.SeedSequence(seed).spawn(num_blocks), sizes))
+    processes = processes or min(num_blocks, multiprocessing.cpu_count())
+    if processes <= 1 or num_blocks <= 1:
+        results = [run_block(*task) for task in tasks]
+    else:
+        context = multiprocessing.get_context('spawn')
+        pool = context.Pool(processes=processes, initializer=init_worker,
+                            initargs=(engine_args, counts))
+        try:
+            results = pool.starmap(run_block, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    positions = sum(results)
+
+    answers = []
+    for index, answer in enumerate(question['answers']):
+        observed_position = [position for position, winner in enumerate(observed)
+                             if winner == index]
+        answers.append(dict(
+            id=answer['id'],
+            text=answer['text'],
+            observed_position=observed_position[0] if observed_position else None,
+            win_probability=int(positions[index].sum()) / float(num_resamples),
+            position_probabilities=[
+                int(count) / float(num_resamples) for count in positions[index]]
+        ))
+
+    return dict(
+        question=qindex,
+        tally_type=question['tally_type'],
+        engine=local.name,
+        resamples=num_resamples,
+        seed=int(seed),
+        tally_seed=int(tally_seed),
+        valid_votes=int(counts.sum()),
+        unique_ballots=len(ballots),
+        winners=[int(winner) for winner in observed if winner >= 0],
+        answers=answers,
+        time=time.perf_counter() - start
+    )
+
+def bootstrap_dirtally(dir_path, qindex=0, num_resamples=1000, seed=None,
+                       processes=None, engine=None, withdrawals=[],
+                       tally_seed=None):
+    '''
+    Runs the bootstrap of a question of the election at dir_path, in the
+    layout read by do_dirtally()
+    '''
+    res_path = os.path.join(dir_path, 'questions_json')
+    with codecs.open(res_path, encoding='utf-8', mode='r') as res_f:
+        questions = json.loads(res_f.read())
+    ballots, counts = get_histogram(dir_path, questions, qindex, withdrawals)
+    return bootstrap(questions, qindex, ballots, counts, num_resamples, seed,
+                     processes, engine, tally_seed)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="bootstrap the outcome of a question of an election")
+    parser.add_argument("dir_path", help="election directory")
+    parser.add_argument("--question", type=int, default=0,
+        help="index of the question")
+    parser.add_argument("--resamples", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--tally-seed", type=int, default=None,
+        help="seed of the tally, whose random tie breaks the histogram is "
+             "counted with, the seed by default")
+    parser.add_argument("--processes", type=int, default=None,
+        help="number of worker processes, one per CPU by default")
+    parser.add_argument("--engine", default=None,
+        choices=[PositionalEngine.name, TallyEngine.name],
+        help="count every resample with the tally of the voting system")
+    parser.add_argument("--output", default=None, help="JSON results file")
+    args = parser.parse_args()
+
+    results = bootstrap_dirtally(args.dir_path, args.question, args.resamples,
+                                 args.seed, args.processes, args.engine,
+                                 tally_seed=args.tally_seed)
+    output = json.dumps(results, indent=4, sort_keys=True)
+    if args.output:
+        with codecs.open(args.output, encoding='utf-8', mode='w') as f:
+            f.write(output)
+    else:
+        print(output)
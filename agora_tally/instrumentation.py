@@ -0,0 +1,194 @@
+# This file is part of agora-tally.
+# Copyright (C) 2026  Agora Voting SL <agora@agoravoting.com>
+
+# agora-tally is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+
+# agora-tally  is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with agora-tally.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Instrumentation of the tally pipeline. The tally and the counting methods
+emit timing spans and counters through a registry of listeners, which are
+plain callables receiving each event as a dict. While no listener is
+registered, span() returns a shared no-op span and counter() returns at
+once, so instrumented code costs a function call per event.
+
+The events are dicts with the keys:
+
+ - kind: 'span' or 'counter'
+ - name, category: what the event is about
+ - start: time.perf_counter() when the span started or the counter was taken
+ - duration: seconds taken by a span, 0 for counters
+ - thread: identifier of the thread emitting the event
+ - args: dict with details of the span, or the values of the counter
+'''
+
+import codecs
+import json
+import os
+import threading
+import time
+
+_listeners = []
+
+def add_listener(listener):
+    '''
+    Registers a callable to receive every event emitted from now on
+    '''
+    _listeners.append(listener)
+
+def remove_listener(listener):
+    _listeners.remove(listener)
+
+def enabled():
+    '''
+    Returns True if there is any listener, so that callers can skip gathering
+    the arguments of their events otherwise
+    '''
+    return len(_listeners) > 0
+
+def _emit(event):
+    for listener in list(_listeners):
+        listener(event)
+
+class Span(object):
+    '''
+    A span of time, emitted when it ends. Use it as a context manager, or
+    call end() explicitly when the span does not follow a block of code.
+    '''
+
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = time.perf_counter()
+
+    def set(self, **args):
+        '''
+        Adds details to the span, like the number of items processed
+        '''
+        self.args.update(args)
+
+    def end(self):
+        _emit(dict(
+            kind='span',
+            name=self.name,
+            category=self.category,
+            start=self.start,
+            duration=time.perf_counter() - self.start,
+            thread=threading.current_thread().ident,
+            args=self.args
+        ))
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.end()
+        return False
+
+class _NullSpan(object):
+    def set(self, **args):
+        pass
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+NULL_SPAN = _NullSpan()
+
+def span(name, category='tally', **args):
+    '''
+    Returns a span to use as a context manager, which does nothing if there
+    are no listeners
+    '''
+    if not _listeners:
+        return NULL_SPAN
+    return Span(name, category, args)
+
+def start_span(name, category='tally', **args):
+    '''
+    Starts a span to be ended with its end() method, returning None if there
+    are no listeners so that no span needs to be kept
+    '''
+    if not _listeners:
+        return None
+    return Span(name, category, args)
+
+def counter(name, category='tally', **values):
+    '''
+    Emits the current values of a counter
+    '''
+    if not _listeners:
+        return
+    _emit(dict(
+        kind='counter',
+        name=name,
+        category=category,
+        start=time.perf_counter(),
+        duration=0,
+        thread=threading.current_thread().ident,
+        args=values
+    ))
+
+class ChromeTrace(object):
+    '''
+    Listener that collects the events in the Chrome trace event format, to be
+    loaded in chrome://tracing, Perfetto or speedscope. Use it as a context
+    manager to listen to the events emitted inside a block of code:
+
+        with ChromeTrace() as trace:
+            do_dirtally(path)
+        trace.write('tally.trace.json')
+    '''
+
+    def __init__(self):
+        self.events = []
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+
+    def __call__(self, event):
+        trace_event = dict(
+            name=event['name'],
+            cat=event['category'],
+            ts=(event['start'] - self.origin) * 1e6,
+            pid=self.pid,
+            tid=event['thread'],
+            args=event['args']
+        )
+        if event['kind'] == 'span':
+            trace_event['ph'] = 'X'
+            trace_event['dur'] = event['duration'] * 1e6
+        else:
+            trace_event['ph'] = 'C'
+        self.events.append(trace_event)
+
+    def __enter__(self):
+        add_listener(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        remove_listener(self)
+        return False
+
+    def to_json(self):
+        return dict(traceEvents=self.events, displayTimeUnit='ms')
+
+    def write(self, path):
+        with codecs.open(path, encoding='utf-8', mode='w') as trace_file:
+            trace_file.write(json.dumps(self.to_json(), default=str))
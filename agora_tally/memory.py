@@ -0,0 +1,196 @@
+# This file is part of agora-tally.
+# Copyright (C) 2026  Agora Voting SL <agora@agoravoting.com>
+
+# agora-tally is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+
+# agora-tally  is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with agora-tally.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Memory accounting of tallies, enabled with do_tally(memory_profile=True).
+
+The profile listens to the spans of agora_tally.instrumentation and, at the
+end of each of them, records the memory traced by tracemalloc and its peak
+since the previous span ended. At the end of the larger phases it also takes
+a snapshot and keeps the lines that allocated the most. Once a question is
+tallied, the size of its big structures is estimated, and everything is added
+to its tally log under 'memory_profile'.
+'''
+
+import sys
+import tracemalloc
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from agora_tally import instrumentation
+
+# spans at whose end a tracemalloc snapshot is taken
+SNAPSHOT_SPANS = ('add_votes', 'countBallots', 'post_tally')
+
+# attributes of the ballots of a count whose size is estimated
+BALLOTS_STRUCTURES = ('uniqueBallots', 'uniqueBallotCount', 'ballotOrder',
+                      'uniqueBallotIndexToBallotIndices',
+                      'uniqueBallotsLookup')
+
+# attributes of a count whose size is estimated
+ELECTION_STRUCTURES = ('tree', 'count', 'exhausted', 'roundInfo', 'msg')
+
+def deep_size(obj, seen):
+    '''
+    Estimates the bytes used by an object and everything it references that
+    is not in seen, a set of the ids of the objects already counted. NumPy
+    arrays count their buffer; classes, modules and functions are ignored.
+    '''
+    size = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, type) or callable(obj):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj, 0)
+        if numpy is not None and isinstance(obj, numpy.ndarray):
+            if obj.base is not None and not isinstance(obj.base, bytes):
+                stack.append(obj.base)
+            if obj.dtype == object:
+                stack.extend(obj.ravel().tolist())
+        elif isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif hasattr(obj, '__dict__'):
+            stack.append(obj.__dict__)
+        elif hasattr(obj, '__slots__'):
+            stack.extend(getattr(obj, slot) for slot in obj.__slots__
+                         if hasattr(obj, slot))
+    return size
+
+def structure_sizes(tally):
+    '''
+    Returns the estimated size in KB of the big structures of a tally: the
+    ballots gathered by the adapter, the unique ballots and their order in
+    the ballots of the count, and the Meek/Warren tree and round tables of
+    the count. Memory shared by several structures is counted in the first.
+    '''
+    seen = set()
+    sizes = dict()
+
+    def add(name, obj):
+        sizes[name] = deep_size(obj, seen) / 1024.0
+
+    if isinstance(getattr(tally, 'ballots', None), (list, dict)):
+        add('ballots', tally.ballots)
+
+    election = getattr(getattr(tally, 'report', None), 'e', None)
+    if election is None:
+        return sizes
+
+    ballots = election.b.dirtyBallots or election.b
+    for name in BALLOTS_STRUCTURES:
+        if hasattr(ballots, name):
+            add(name, getattr(ballots, name))
+    # the attributes of the clean ballots, a view of the ones above
+    add('cleanBallots', election.b)
+    for name in ELECTION_STRUCTURES:
+        if getattr(election, name, None) is not None:
+            add(name, getattr(election, name))
+    return sizes
+
+class MemoryProfile(object):
+    '''
+    Instrumentation listener recording the memory used at the end of every
+    span. Use it as a context manager around the tally, and then call
+    add_to_log() for each tally.
+    '''
+
+    def __init__(self, top=10):
+        self.top = top
+        self.started_tracing = False
+        self.pending = []
+        self.by_question = dict()
+
+    def __enter__(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+        instrumentation.add_listener(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        instrumentation.remove_listener(self)
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+        return False
+
+    def __call__(self, event):
+        if event['kind'] != 'span':
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        phase = dict(
+            name=event['name'],
+            args=dict((key, value) for key, value in event['args'].items()
+                      if key != 'question'),
+            current_kb=current / 1024.0,
+            peak_kb=peak / 1024.0
+        )
+        if event['name'] in SNAPSHOT_SPANS:
+            phase['top_allocations'] = self.top_allocations()
+
+        # the spans of the counting methods do not know their question, and
+        # are given the one of the next post_tally, which runs them
+        question = event['args'].get('question')
+        if question is None:
+            self.pending.append(phase)
+            return
+        phases = self.by_question.setdefault(question, [])
+        if event['name'] == 'post_tally':
+            phases.extend(self.pending)
+            self.pending = []
+        phases.append(phase)
+
+    def top_allocations(self):
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>')
+        ])
+        return [
+            dict(
+                line='%s:%d' % (stat.traceback[0].filename,
+                                stat.traceback[0].lineno),
+                size_kb=stat.size / 1024.0,
+                count=stat.count
+            )
+            for stat in snapshot.statistics('lineno')[:self.top]
+        ]
+
+    def get_profile(self, tally):
+        '''
+        Returns the memory profile of a tally
+        '''
+        return dict(
+            phases=self.by_question.get(tally.question_num, []),
+            structures_kb=structure_sizes(tally)
+        )
+
+    def add_to_log(self, tally):
+        '''
+        Adds the memory profile of a tally to its log, when it is a dict
+        '''
+        log = tally.get_log()
+        if isinstance(log, dict):
+            log['memory_profile'] = self.get_profile(tally)
@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+
+# This file is part of agora-tally.
+# Copyright (C) 2026  Agora Voting SL <agora@agoravoting.com>
+
+# agora-tally is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+
+# agora-tally  is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with agora-tally.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Preview tallies of a uniform random sample of the votes of a question, to
+get provisional results while its plaintexts_json is still being decrypted
+or ingested.
+
+The sample is taken either by reading random byte offsets of a plaintexts
+file, which only reads the sampled lines, or with reservoir sampling while
+the votes are streamed. The voting system of the question is run on the
+sampled votes to get the provisional winners. For the systems that add up
+points per position (see agora_tally.bootstrap.positional_points()), the
+points each answer gets per vote are estimated with normal confidence
+bounds, which tell whether the provisional winners are already decided.
+'''
+
+import argparse
+import codecs
+import copy
+import glob
+import itertools
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import time
+
+import numpy
+
+from agora_tally.bootstrap import positional_points, get_winners
+from agora_tally.tally import parse_votes
+from agora_tally.voting_systems.base import get_voting_system_by_id
+
+# bytes of the shortest vote line, '"1"' and its newline. Lines sampled by
+# offset are accepted with a probability inversely proportional to their
+# length, relative to this one
+MIN_LINE_LENGTH = 4
+
+# bytes read around each sampled offset to find the line that contains it
+LOOKBACK = 1024
+
+# sampled offsets tried for each line of the sample before giving up
+MAX_ATTEMPTS = 100
+
+def reservoir_sample(lines, size, rng):
+    '''
+    Returns a uniform random sample of size lines of an iterable, read once,
+    and the number of lines read. Uses Li's algorithm L, which draws random
+    numbers only for the lines that enter the sample.
+    '''
+    lines = iter(lines)
+    sample = list(itertools.islice(lines, size))
+    count = len(sample)
+    if count < size or size == 0:
+        return sample, count
+
+    w = math.exp(math.log(1.0 - rng.random()) / size)
+    while True:
+        if w >= 1.0:
+            skip = sys.maxsize
+        else:
+            skip = int(math.log(1.0 - rng.random()) / math.log(1.0 - w))
+        skipped = sum(1 for line in itertools.islice(lines, skip))
+        count += skipped
+        if skipped < skip:
+            return sample, count
+        line = next(lines, None)
+        if line is None:
+            return sample, count
+        count += 1
+        sample[rng.randrange(size)] = line
+        w *= math.exp(math.log(1.0 - rng.random()) / size)
+
+def offset_sample(path, size, rng):
+    '''
+    Returns a uniform random sample of size lines of a file, drawn with
+    replacement from random byte offsets, and an estimate of the number of
+    lines of the file. A line at an offset is accepted with probability
+    MIN_LINE_LENGTH / its length, so that long lines are not favoured; a
+    last line without newline, maybe still being written, is never accepted.
+    '''
+    file_size = os.path.getsize(path)
+    sample = []
+    length = 0
+    attempts = 0
+    with open(path, 'rb') as sample_file:
+        while len(sample) < size and file_size > 0:
+            attempts += 1
+            if attempts > size * MAX_ATTEMPTS:
+                raise Exception("could not sample the lines of %s" % path)
+            offset = rng.randrange(file_size)
+            start = max(0, offset - LOOKBACK)
+            sample_file.seek(start)
+            block = sample_file.read(offset - start + LOOKBACK)
+            line_start = block.rfind(b'\n', 0, offset - start) + 1
+            line_end = block.find(b'\n', offset - start)
+            if line_end < 0 or (line_start == 0 and start > 0):
+                continue
+            line = block[line_start:line_end + 1]
+            if rng.random() * len(line) >= MIN_LINE_LENGTH:
+                continue
+            sample.append(line.decode('utf-8'))
+            length += len(line)
+
+    population = int(round(file_size * len(sample) / float(length))) \
+        if length else 0
+    return sample, population
+
+def sample_plaintexts(path, size, seed=None, method=None):
+    '''
+    Samples size lines of a plaintexts file, or of the standard input if
+    path is '-'. The method is 'offsets' or 'reservoir', by default offsets
+    on regular files and reservoir otherwise. Returns the sample, the
+    number of lines in the file and whether that number is exact, which it
+    is only when the whole file was read.
+    '''
+    rng = random.Random(seed)
+    if method is None:
+        method = 'offsets' if path != '-' and os.path.isfile(path) \
+            else 'reservoir'
+    if method == 'offsets':
+        sample, population = offset_sample(path, size, rng)
+        return sample, population, False
+    elif method == 'reservoir':
+        if path == '-':
+            sample, population = reservoir_sample(sys.stdin, size, rng)
+        else:
+            with codecs.open(path, encoding='utf-8', mode='r') as lines:
+                sample, population = reservoir_sample(lines, size, rng)
+        return sample, population, True
+    raise Exception("unknown sampling method: %s" % method)
+
+def tally_lines(questions, qindex, lines, withdrawals=[]):
+    '''
+    Tallies a question with the given plaintexts lines as do_tally() does,
+    returning the tally and the tallied question
+    '''
+    questions = copy.deepcopy(questions)
+    question = questions[qindex]
+    question['winners'] = []
+    question['totals'] = dict(blank_votes=0, null_votes=0, valid_votes=0)
+    for answer in question['answers']:
+        answer['total_count'] = 0
+
+    tally = get_voting_system_by_id(question['tally_type']).create_tally(
+        None, qindex)
+    tally.pre_tally(questions)
+    base_vote = [dict(choices=[]) for q in questions]
+    for line, choices, kind in parse_votes(tally, question, qindex, lines,
+                                           withdrawals):
+        voter_answers = copy.deepcopy(base_vote)
+        if kind == 'valid':
+            voter_answers[qindex]['choices'] = choices
+        elif kind == 'blank':
+            question['totals']['blank_votes'] += 1
+        else:
+            question['totals']['null_votes'] += 1
+        tally.add_vote(voter_answers=voter_answers, questions=questions,
+                       is_delegated=False)
+    tally.post_tally(questions)
+    return tally, question
+
+def points_per_vote(question, lines, points, withdrawals=[], qindex=0):
+    '''
+    Returns a matrix with the points each sampled vote gives to each answer,
+    with zeros for blank and invalid votes
+    '''
+    tally = get_voting_system_by_id(question['tally_type']).create_tally(
+        None, qindex)
+    ret = numpy.zeros((len(lines), len(question['answers'])))
+    votes = parse_votes(tally, question, qindex, lines, withdrawals)
+    for row, (line, choices, kind) in enumerate(votes):
+        if kind != 'valid':
+            continue
+        for position, answer in enumerate(choices[:len(points)]):
+            ret[row, answer] += points[position]
+    return ret
+
+def preview_tally(questions, qindex, lines, population, exact=False,
+                  confidence=0.95, withdrawals=[]):
+    '''
+    Tallies the sampled lines of a question of an election with population
+    votes. For positional systems, each answer gets the estimated mean
+    points per vote with confidence bounds, and the same scaled to the
+    population; decided is True when the lowest bound of the provisional
+    winners is above the highest bound of the other answers. The bounds
+    apply the finite population correction when the population is exact.
+    '''
+    start = time.perf_counter()
+    tally, question = tally_lines(questions, qindex, lines, withdrawals)
+    winners = get_winners(question)
+    results = dict(
+        question=qindex,
+        tally_type=question['tally_type'],
+        sample_size=len(lines),
+        population=population,
+        population_exact=exact,
+        confidence=confidence,
+        totals=question['totals'],
+        winners=winners,
+        decided=None,
+        answers=[
+            dict(id=answer['id'], text=answer['text'],
+                 total_count=answer['total_count'],
+                 winner_position=(winners.index(index)
+                                  if index in winners else None))
+            for index, answer in enumerate(question['answers'])]
+    )
+
+    points = positional_points(question)
+    num_samples = len(lines)
+    if points is not None and num_samples > 1:
+        sample_points = points_per_vote(questions[qindex], lines, points,
+                                        withdrawals, qindex)
+        mean = sample_points.mean(axis=0)
+        error = sample_points.std(axis=0, ddof=1) / math.sqrt(num_samples)
+        if exact and population > 1:
+            error *= math.sqrt(max(0, population - num_samples) /
+                               float(population - 1))
+        z = statistics.NormalDist().inv_cdf((1 + confidence) / 2.0)
+        for index, answer in enumerate(results['answers']):
+            answer['mean_points'] = float(mean[index])
+            answer['lower'] = float(mean[index] - z * error[index])
+            answer['upper'] = float(mean[index] + z * error[index])
+            answer['estimated_total'] = float(mean[index] * population)
+            answer['estimated_lower'] = answer['lower'] * population
+            answer['estimated_upper'] = answer['upper'] * population
+
+        losers = [answer['upper'] for index, answer
+                  in enumerate(results['answers']) if index not in winners]
+        if winners:
+            results['decided'] = not losers or min(
+                results['answers'][index]['lower'] for index in winners) > \
+                max(losers)
+
+    results['time'] = time.perf_counter() - start
+    return results
+
+def preview_dirtally(dir_path, qindex=0, size=10000, seed=None, method=None,
+                     confidence=0.95, plaintexts_path=None, withdrawals=[]):
+    '''
+    Previews a question of the election at dir_path, in the layout read by
+    do_dirtally(). The plaintexts can be given as another path, or as '-'
+    to stream them from the standard input.
+    '''
+    res_path = os.path.join(dir_path, 'questions_json')
+    with codecs.open(res_path, encoding='utf-8', mode='r') as res_f:
+        questions = json.loads(res_f.read())
+    if plaintexts_path is None:
+        plaintexts_path = glob.glob(
+            os.path.join(dir_path, "%d-*" % qindex, "plaintexts_json"))[0]
+    start = time.perf_counter()
+    lines, population, exact = sample_plaintexts(plaintexts_path, size, seed,
+                                                 method)
+    sample_time = time.perf_counter() - start
+    results = preview_tally(questions, qindex, lines, population, exact,
+                            confidence, withdrawals)
+    results['seed'] = seed
+    results['sample_time'] = sample_time
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="preview the results of a question on a sample of votes")
+    parser.add_argument("dir_path", help="election directory")
+    parser.add_argument("--question", type=int, default=0,
+        help="index of the question")
+    parser.add_argument("--sample-size", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--method", default=None,
+        choices=['offsets', 'reservoir'], help="how lines are sampled")
+    parser.add_argument("--confidence", type=float, default=0.95)
+    parser.add_argument("--plaintexts", default=None,
+        help="plaintexts file of the question, '-' for the standard input")
+    parser.add_argument("--output", default=None, help="JSON results file")
+    args = parser.parse_args()
+
+    results = preview_dirtally(args.dir_path, args.question, args.sample_size,
+                               args.seed, args.method, args.confidence,
+                               args.plaintexts)
+    output = json.dumps(results, indent=4, sort_keys=True)
+    if args.output:
+        with codecs.open(args.output, encoding='utf-8', mode='w') as f:
+            f.write(output)
+    else:
+        print(output)
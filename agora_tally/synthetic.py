@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+
+# This file is part of agora-tally.
+# Copyright (C) 2026  Agora Voting SL <agora@agoravoting.com>
+
+# agora-tally is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+
+# agora-tally  is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with agora-tally.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Synthetic elections for load testing. Ballots are drawn from the voter models
+of agora_tally.ballot_counter.spars with NumPy random generators, and written
+either as ballot files or as plaintexts_json directories with a matching
+questions_json that do_dirtally() can tally.
+'''
+
+import argparse
+import codecs
+import json
+import os
+import sys
+
+import numpy
+
+from agora_tally.ballot_counter import spars
+from agora_tally.ballot_counter.ballots import Ballots
+from agora_tally.voting_systems.base import get_voting_system_by_id
+
+MODELS = ('spars', 'bigrams')
+
+# Voting systems whose ballots are lists of (winner, loser) comparisons, with
+# min and max counting comparisons instead of answers
+PAIRWISE_TALLY_TYPES = ('pairwise-beta', 'pairwise-bradleyterry')
+
+# Number of votes written to a plaintexts_json file at once
+VOTES_PER_CHUNK = 1 << 16
+
+def random_model(num_candidates, rng, model='spars', dimensions=2):
+    '''
+    Returns a voter model with random parameters for the given number of
+    candidates: either spatial ('spars') or bigrams with NOTA ('bigrams')
+    '''
+    if model == 'spars':
+        ret = spars.Spars(dimensions)
+        ret.random(num_candidates, rng=rng)
+    elif model == 'bigrams':
+        ret = spars.Bigrams(spars.NOTA)
+        ret.random([str(i) for i in range(num_candidates)], rng=rng)
+    else:
+        raise Exception("unknown voter model: %s" % model)
+    return ret
+
+def generate_rankings(question, num_votes, rng, model='spars'):
+    '''
+    Returns the rankings of num_votes ballots for a question, as a matrix of
+    answer indexes, together with the length of each ballot. Lengths are
+    clamped to the min and max number of answers allowed by the question,
+    with at least one answer so that no ballot is blank.
+    '''
+    num_answers = len(question['answers'])
+    voter_model = random_model(num_answers, rng, model)
+    rankings, lengths = voter_model.genRankings(num_votes, rng)
+    min_length = max(1, question.get('min', 1))
+    max_length = min(num_answers, question.get('max', num_answers))
+    return rankings, numpy.clip(lengths, min_length, max_length)
+
+def pairwise_comparisons(rankings, lengths, rng):
+    '''
+    Turns rankings into ballots of pairwise comparisons, as many as the length
+    of each ballot. Each comparison is between two random answers and is won
+    by the one the voter ranks higher.
+    '''
+    num_votes, num_answers = rankings.shape
+    width = int(lengths.max()) if num_votes > 0 else 0
+    rows = numpy.arange(num_votes)[:, numpy.newaxis]
+    position = numpy.empty_like(rankings)
+    position[rows, rankings] = numpy.arange(num_answers)
+    first = rng.integers(0, num_answers, (num_votes, width))
+    second = (first + rng.integers(1, num_answers, (num_votes, width))) % \
+        num_answers
+    first_wins = position[rows, first] < position[rows, second]
+    choices = numpy.empty((num_votes, 2 * width), rankings.dtype)
+    choices[:, 0::2] = numpy.where(first_wins, first, second)
+    choices[:, 1::2] = numpy.where(first_wins, second, first)
+    return choices, 2 * lengths
+
+def encode_votes(rankings, lengths, num_answers):
+    '''
+    Encodes ballots as the numbers stored in plaintexts_json, the reverse of
+    parse_vote(): each answer index plus one is written with a fixed number
+    of digits, and one is added to the concatenation.
+    '''
+    tab_size = len(str(num_answers + 2))
+    width = int(lengths.max()) if len(lengths) > 0 else 0
+    # beyond 18 digits the numbers do not fit in an int64
+    dtype = numpy.int64 if tab_size * width <= 18 else object
+    values = numpy.zeros(len(rankings), dtype)
+    base = 10 ** tab_size
+    for k in range(width):
+        option = rankings[:, k].astype(dtype) + 1
+        values = numpy.where(k < lengths, values * base + option, values)
+    return values + 1
+
+def generate_votes(question, num_votes, rng, model='spars', blank_rate=0.0,
+                   invalid_rate=0.0, unique_votes=None, skew=1.0):
+    '''
+    Returns the encoded votes of a question, as rankings or as pairwise
+    comparisons depending on its tally_type. A blank_rate fraction of them
+    are blank votes and an invalid_rate fraction are invalid, choosing an
+    answer that does not exist.
+
+    If unique_votes is given, the votes are drawn from a pool of that many
+    ballots, the k-th of them with a probability proportional to k**-skew,
+    so that higher skews repeat the same ballots more often.
+    '''
+    num_answers = len(question['answers'])
+    pool_size = num_votes if unique_votes is None else unique_votes
+    choices, lengths = generate_rankings(question, pool_size, rng, model)
+    if question['tally_type'] in PAIRWISE_TALLY_TYPES:
+        choices, lengths = pairwise_comparisons(choices, lengths, rng)
+    values = encode_votes(choices, lengths, num_answers)
+    if unique_votes is not None:
+        weights = numpy.arange(1, pool_size + 1, dtype=numpy.float64) ** -skew
+        values = values[rng.choice(pool_size, num_votes,
+                                   p=weights / weights.sum())]
+    kind = rng.random(num_votes)
+    values[kind < blank_rate] = num_answers + 2 + 1
+    values[(kind >= blank_rate) & (kind < blank_rate + invalid_rate)] = \
+        num_answers + 1 + 1
+    return values
+
+def write_plaintexts(path, values):
+    '''
+    Writes encoded votes to a plaintexts_json file, one quoted number per line
+    '''
+    with codecs.open(path, encoding='utf-8', mode='w') as plaintexts_file:
+        for start in range(0, len(values), VOTES_PER_CHUNK):
+            chunk = values[start:start + VOTES_PER_CHUNK].tolist()
+            plaintexts_file.write("".join('"%d"\n' % v for v in chunk))
+
+def generate_election(dir_path, questions, num_votes, seed=None,
+                      model='spars', blank_rate=0.0, invalid_rate=0.0,
+                      unique_votes=None, skew=1.0):
+    '''
+    Writes a synthetic election to dir_path in the layout read by
+    do_dirtally(): a questions_json file and a plaintexts_json file with
+    num_votes votes for each question, generated as in generate_votes().
+    Each question gets its own random stream spawned from seed. Returns the seed, which is chosen randomly if
+    not given, so that the election can be generated again.
+    '''
+    for question in questions:
+        if get_voting_system_by_id(question['tally_type']) is None:
+            raise Exception("unknown tally_type: %s" % question['tally_type'])
+
+    seed_sequence = numpy.random.SeedSequence(seed)
+    streams = seed_sequence.spawn(len(questions))
+
+    if not os.path.exists(dir_path):
+        os.makedirs(dir_path)
+    questions_path = os.path.join(dir_path, 'questions_json')
+    with codecs.open(questions_path, encoding='utf-8', mode='w') as questions_f:
+        questions_f.write(json.dumps(questions, indent=4))
+
+    for qindex, question in enumerate(questions):
+        rng = numpy.random.default_rng(streams[qindex])
+        values = generate_votes(question, num_votes, rng, model, blank_rate,
+                                invalid_rate, unique_votes, skew)
+        question_path = os.path.join(dir_path, "%d-question" % qindex)
+        if not os.path.exists(question_path):
+            os.makedirs(question_path)
+        write_plaintexts(os.path.join(question_path, 'plaintexts_json'),
+                         values)
+
+    return seed_sequence.entropy
+
+def generate_ballots(question, num_votes, seed=None, model='spars'):
+    '''
+    Returns a Ballots object with num_votes synthetic ballots for a question,
+    which can be saved as a BLT file with saveAs()
+    '''
+    rng = numpy.random.default_rng(seed)
+    rankings, lengths = generate_rankings(question, num_votes, rng, model)
+    ballots = Ballots()
+    ballots.names = [answer['text'] for answer in question['answers']]
+    ballots.numSeats = question.get('num_winners', 1)
+    ballots.title = question.get('title', ballots.title)
+    for ranking, length in zip(rankings.tolist(), lengths.tolist()):
+        ballots.appendBallot(ranking[:length])
+    return ballots
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="generate a synthetic election for load testing")
+    parser.add_argument("questions_path", help="questions_json to use")
+    parser.add_argument("num_votes", type=int, help="votes per question")
+    parser.add_argument("output_path",
+        help="directory for do_dirtally(), or a ballot file with --blt")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--model", choices=MODELS, default='spars')
+    parser.add_argument("--blank-rate", type=float, default=0.0)
+    parser.add_argument("--invalid-rate", type=float, default=0.0)
+    parser.add_argument("--unique-votes", type=int, default=None,
+        help="draw the votes from a pool of this many ballots")
+    parser.add_argument("--skew", type=float, default=1.0,
+        help="how often the most common ballots of the pool repeat")
+    parser.add_argument("--blt", action="store_true",
+        help="write the ballots of the first question as a BLT file")
+    args = parser.parse_args()
+
+    with codecs.open(args.questions_path, encoding='utf-8', mode='r') as f:
+        questions = json.loads(f.read())
+
+    if args.blt:
+        ballots = generate_ballots(questions[0], args.num_votes, args.seed,
+                                   args.model)
+        ballots.saveAs(args.output_path)
+        seed = args.seed
+    else:
+        seed = generate_election(args.output_path, questions, args.num_votes,
+                                 args.seed, args.model, args.blank_rate,
+                                 args.invalid_rate, args.unique_votes,
+                                 args.skew)
+    sys.stderr.write("seed: %s\n" % seed)
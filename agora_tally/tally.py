@@ -17,17 +17,61 @@
 
 
 from agora_tally.voting_systems.base import get_voting_system_by_id, BlankVoteException
+from agora_tally import instrumentation, memory
 
 import copy
 import glob
 import codecs
+import hashlib
+import random
 import tarfile
 import json
 import os
+import shutil
 import sys
 from tempfile import mkdtemp
 
-def do_tartally(tally_path):
+def derive_seed(seed, question_index):
+    '''
+    Returns the seed of the random tie breaks of a question, derived from the
+    seed of the tally and the index of the question. Each question gets its
+    own stream, which does not depend on the order questions are tallied in.
+    '''
+    digest = hashlib.sha256(
+        ('%s:%s' % (seed, question_index)).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+def parse_votes(tally, question, qindex, lines, withdrawals=[]):
+    '''
+    Parses the plaintexts lines of a question, yielding for each of them the
+    line, the choices of the vote and whether it is 'valid', 'blank' or
+    'invalid'. The choices are None unless the vote is valid. The answers
+    withdrawn from the question are left out of the choices.
+    '''
+    q_withdrawals = [
+        answer['answer_id']
+        for answer in withdrawals
+        if answer['question_index'] == qindex]
+
+    for line in lines:
+        try:
+            # Note line starts with " (1 character) and ends with
+            # "\n (2 characters). It contains the index of the
+            # option selected by the user but starting with 1
+            # because number 0 cannot be encrypted with elgammal
+            # so we trim beginning and end, parse the int and
+            # substract one
+            number = int(line[1:-2]) - 1
+            choices = tally.parse_vote(number, question, q_withdrawals)
+        except BlankVoteException:
+            yield line, None, 'blank'
+        except Exception:
+            yield line, None, 'invalid'
+        else:
+            yield line, choices, 'valid'
+
+def do_tartally(tally_path, ignore_invalid_votes=False, monkey_patcher=None,
+                memory_profile=False, seed=None, checkpoint_dir=None):
     dir_path = mkdtemp("tally")
 
     # untar the plaintexts
@@ -50,20 +94,58 @@ def do_tartally(tally_path):
         os.makedirs(subdir)
         tally_gz.extract(member, path=dir_path)
 
-    return do_tally(dir_path, questions)
-
-def do_dirtally(dir_path, ignore_invalid_votes=False, encrypted_invalid_votes=0):
+    try:
+        return do_tally(dir_path, questions,
+                        ignore_invalid_votes=ignore_invalid_votes,
+                        monkey_patcher=monkey_patcher,
+                        memory_profile=memory_profile, seed=seed,
+                        checkpoint_dir=checkpoint_dir)
+    finally:
+        shutil.rmtree(dir_path)
+
+def do_dirtally(dir_path, ignore_invalid_votes=False, encrypted_invalid_votes=0,
+                monkey_patcher=None, memory_profile=False, seed=None,
+                checkpoint_dir=None):
     res_path = os.path.join(dir_path, 'questions_json')
     with codecs.open(res_path, encoding='utf-8', mode='r') as res_f:
         questions = json.loads(res_f.read())
 
     return do_tally(dir_path, questions,
                     ignore_invalid_votes=ignore_invalid_votes,
-                    encrypted_invalid_votes=encrypted_invalid_votes)
+                    encrypted_invalid_votes=encrypted_invalid_votes,
+                    monkey_patcher=monkey_patcher,
+                    memory_profile=memory_profile, seed=seed,
+                    checkpoint_dir=checkpoint_dir)
 
 def do_tally(dir_path, questions, tallies=[], ignore_invalid_votes=False,
              encrypted_invalid_votes=0, monkey_patcher=None,
-             question_indexes=None, withdrawals=[], allow_empty_tally=False):
+             question_indexes=None, withdrawals=[], allow_empty_tally=False,
+             memory_profile=False, seed=None, checkpoint_dir=None):
+    # the random tie breaks of each question use their own stream, derived
+    # from this seed, which is drawn from the random module if not given
+    if seed is None:
+        seed = random.getrandbits(64)
+
+    # the tallies that support it save the checkpoints of the count of each
+    # question in checkpoint_dir, and resume it when the tally is run again
+    # after being interrupted, provided the seed is the same
+    if checkpoint_dir is not None and not os.path.isdir(checkpoint_dir):
+        os.makedirs(checkpoint_dir)
+
+    if memory_profile:
+        # tally with the memory profile enabled, and add it to the tally log
+        # of every question
+        first_tally = len(tallies)
+        with memory.MemoryProfile() as profile:
+            ret = do_tally(dir_path, questions, tallies, ignore_invalid_votes,
+                           encrypted_invalid_votes, monkey_patcher,
+                           question_indexes, withdrawals, allow_empty_tally,
+                           seed=seed, checkpoint_dir=checkpoint_dir)
+        for qindex, tally in enumerate(tallies[first_tally:]):
+            if question_indexes is None or qindex in question_indexes:
+                profile.add_to_log(tally)
+        return ret
+
     # questions is in the same format as get_questions_pretty(). Initialized here
     questions = copy.deepcopy(questions)
     base_vote =[dict(choices=[]) for q in questions]
@@ -76,6 +158,10 @@ def do_tally(dir_path, questions, tallies=[], ignore_invalid_votes=False,
         tally_type = question['tally_type']
         voting_system = get_voting_system_by_id(tally_type)
         tally = voting_system.create_tally(None, i)
+        tally.seed = derive_seed(seed, qindex)
+        if checkpoint_dir is not None:
+            tally.checkpoint_path = os.path.join(
+                checkpoint_dir, "%d.checkpoint" % qindex)
         if monkey_patcher:
             monkey_patcher(tally)
         tallies.append(tally)
@@ -107,7 +193,9 @@ def do_tally(dir_path, questions, tallies=[], ignore_invalid_votes=False,
         for answer in question['answers']:
             answer['total_count'] = 0
 
-        tally.pre_tally(questions)
+        with instrumentation.span('pre_tally', question=qindex,
+                                  tally=type(tally).__name__):
+            tally.pre_tally(questions)
         plaintexts_path = os.path.join(dir_path, "%d-*" % i, "plaintexts_json")
         try:
             plaintexts_path = glob.glob(plaintexts_path)[0]
@@ -118,32 +206,22 @@ def do_tally(dir_path, questions, tallies=[], ignore_invalid_votes=False,
             else:
                 pass
         else:
-            q_withdrawals = [
-            answer['answer_id']
-            for answer in withdrawals
-            if answer['question_index'] == qindex]
-
-            with codecs.open(plaintexts_path, encoding='utf-8', mode='r') as plaintexts_file:
+            with codecs.open(plaintexts_path, encoding='utf-8', mode='r') as plaintexts_file, \
+                    instrumentation.span('add_votes', question=qindex,
+                                         tally=type(tally).__name__) as span:
                 total_count = encrypted_invalid_votes
-                for line in plaintexts_file.readlines():
+                for line, choices, kind in parse_votes(
+                        tally, question, qindex, plaintexts_file.readlines(),
+                        withdrawals):
                     total_count += 1
                     voter_answers = copy.deepcopy(base_vote)
-                    try:
-                        # Note line starts with " (1 character) and ends with
-                        # "\n (2 characters). It contains the index of the
-                        # option selected by the user but starting with 1
-                        # because number 0 cannot be encrypted with elgammal
-                        # so we trim beginning and end, parse the int and
-                        # substract one
-                        number = int(line[1:-2]) - 1
-                        choices = tally.parse_vote(number, question, q_withdrawals)
-
+                    if kind == 'valid':
                         # craft the voter_answers in the format admitted by
                         # tally.add_vote
                         voter_answers[i]['choices'] = choices
-                    except BlankVoteException:
+                    elif kind == 'blank':
                         question['totals']['blank_votes'] += 1
-                    except Exception as e:
+                    else:
                         question['totals']['null_votes'] += 1
                         if not ignore_invalid_votes:
                             print("invalid vote: " + line)
@@ -151,6 +229,10 @@ def do_tally(dir_path, questions, tallies=[], ignore_invalid_votes=False,
                     tally.add_vote(voter_answers=voter_answers,
                         questions=questions, is_delegated=False)
 
+                span.set(votes=total_count - encrypted_invalid_votes)
+                instrumentation.counter('votes', question=qindex,
+                                        **question['totals'])
+
             i += 1
 
 
@@ -160,7 +242,12 @@ def do_tally(dir_path, questions, tallies=[], ignore_invalid_votes=False,
     for qindex, tally in enumerate(tallies):
         if question_indexes is not None and qindex not in question_indexes:
             continue
-        tally.post_tally(questions)
+        with instrumentation.span('post_tally', question=tally.question_num,
+                                  tally=type(tally).__name__):
+            tally.post_tally(questions)
+        log = tally.get_log()
+        if isinstance(log, dict):
+            log['random_seed'] = dict(seed=seed, question_seed=tally.seed)
 
     return dict(
         questions = questions,
@@ -168,16 +255,38 @@ def do_tally(dir_path, questions, tallies=[], ignore_invalid_votes=False,
     )
 
 if __name__ == "__main__":
+    args = sys.argv[1:]
+    trace_path = None
+    seed = None
+    checkpoint_dir = None
     try:
-        tally_path = sys.argv[1]
+        while len(args) > 1 and args[0] in ('--trace', '--seed',
+                                            '--checkpoint-dir'):
+            if args[0] == '--trace':
+                trace_path = args[1]
+            elif args[0] == '--seed':
+                seed = int(args[1])
+            else:
+                checkpoint_dir = args[1]
+            args = args[2:]
+        tally_path, = args
     except:
-        print("usage: %s <tally_path>" % sys.argv[0])
+        print("usage: %s [--trace <trace_path>] [--seed <seed>] "
+              "[--checkpoint-dir <checkpoint_dir>] <tally_path>"
+              % sys.argv[0])
         exit(1)
 
     if not os.path.exists(tally_path):
         print("tally path and/or questions_path don't exist")
         exit(1)
+    trace = instrumentation.ChromeTrace()
+    if trace_path is not None:
+        instrumentation.add_listener(trace)
     if os.path.isdir(tally_path):
-        print(json.dumps(do_dirtally(tally_path), indent=4))
+        print(json.dumps(do_dirtally(tally_path, seed=seed,
+                                     checkpoint_dir=checkpoint_dir), indent=4))
     else:
-        print(json.dumps(do_tartally(tally_path), indent=4))
+        print(json.dumps(do_tartally(tally_path, seed=seed,
+                                     checkpoint_dir=checkpoint_dir), indent=4))
+    if trace_path is not None:
+        trace.write(trace_path)
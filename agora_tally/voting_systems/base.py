@@ -98,6 +98,13 @@ class BaseTally(object):
     question_num = None
     question_id = None
 
+    # seed of the random tie breaks of the question, set by do_tally()
+    seed = None
+
+    # file where the tallies that support it save the checkpoints of their
+    # count, to resume it if the tally is interrupted, set by do_tally()
+    checkpoint_path = None
+
     def __init__(self, election, question_num):
         self.election = election
         self.question_num = question_num
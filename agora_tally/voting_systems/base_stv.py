@@ -27,6 +27,7 @@ import tempfile
 
 from ..ballot_counter.ballots import Ballots
 from ..ballot_counter.plugins import getMethodPlugins
+from ..ballot_counter.STV import resumeCheckpoint
 
 from .base import BaseVotingSystem, BaseTally
 
@@ -87,6 +88,10 @@ class BaseSTVTally(BaseTally):
     weak_tie_break_method = None # None means default
     digits_precision = None # None means default
 
+    # rounds between the checkpoints of the count, saved to checkpoint_path
+    # when do_tally() is given a checkpoint_dir
+    checkpoint_interval = 10
+
     # report object
     report = None
 
@@ -170,7 +175,7 @@ class BaseSTVTally(BaseTally):
 
         return None
 
-    def add_vote(self, voter_answers, result, is_delegated):
+    def add_vote(self, voter_answers, questions, is_delegated):
         '''
         Add to the count a vote from a voter
         '''
@@ -223,6 +228,8 @@ class BaseSTVTally(BaseTally):
 
         # create and configure election
         e = methods[self.method_name](cleanBallots)
+        if self.seed is not None:
+            e.setSeed(self.seed)
 
         if self.strong_tie_break_method is not None:
             e.strongTieBreakMethod = self.strong_tie_break_method
@@ -233,8 +240,24 @@ class BaseSTVTally(BaseTally):
         if self.digits_precision is not None:
             e.prec = self.digits_precision
 
-        # run election and generate the report
-        e.runElection()
+        # only the JSON report is generated, so the text describing the
+        # count is not needed
+        e.narrative = False
+
+        # resume the count from its checkpoint if a previous tally was
+        # interrupted, or run the election saving checkpoints
+        checkpoint_path = self.checkpoint_path if e.iterative else None
+        restored = resumeCheckpoint(checkpoint_path, e)
+        if restored is not None:
+            e = restored
+            e.continueElection()
+        else:
+            if checkpoint_path is not None:
+                e.checkpointInterval = self.checkpoint_interval
+                e.checkpointPath = checkpoint_path
+            e.runElection()
+        if checkpoint_path is not None and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
 
         # generate report
         from .json_report import JsonReport
@@ -249,7 +272,9 @@ class BaseSTVTally(BaseTally):
         question = result[self.question_num]
         question['total_votes'] = json_report['ballots_count']
         question['dirty_votes'] = json_report['dirty_ballots_count'] - json_report['ballots_count']
-        json_report['winners'] = [winner.decode('utf-8') for winner in json_report['winners']]
+        json_report['winners'] = [
+            winner.decode('utf-8') if hasattr(winner, 'decode') else winner
+            for winner in json_report['winners']]
         question['winners'] = []
 
         i = 1
@@ -258,7 +283,10 @@ class BaseSTVTally(BaseTally):
             it_winners = [cand for cand in iteration['candidates']
                 if cand['status'] == 'won']
             for winner in sorted(it_winners, key=lambda winner: winner['count']):
-                question['winners'].append(winner['name'].decode('utf-8'))
+                name = winner['name']
+                if hasattr(name, 'decode'):
+                    name = name.decode('utf-8')
+                question['winners'].append(name)
 
         for answer in question['answers']:
             name = answer['value']
@@ -209,6 +209,8 @@ class BordaTally(BaseTally):
 
         # create and configure election
         e = methods[self.method_name](cleanBallots)
+        if self.seed is not None:
+            e.setSeed(self.seed)
         question = questions[self.question_num]
 
         if 'bordas-max-points' not in question:
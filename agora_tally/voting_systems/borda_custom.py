@@ -77,6 +77,8 @@ class BordaCustomTally(BordaTally):
 
         # create and configure election
         e = methods[self.method_name](cleanBallots)
+        if self.seed is not None:
+            e.setSeed(self.seed)
         question = questions[self.question_num]
         e.maxChosableOptions = question['max']
         self.weightByPosition = question['borda_custom_weights']
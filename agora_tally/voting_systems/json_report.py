@@ -20,6 +20,7 @@ class JsonReport(ReportPlugin):
 
     status = 0
     reportName = "JSON"
+    needsNarrative = False
     json = {}
 
     def __init__(self, e):
@@ -217,6 +217,8 @@ class PluralityAtLargeTally(BaseTally):
 
         # create and configure election
         e = methods[self.method_name](cleanBallots)
+        if self.seed is not None:
+            e.setSeed(self.seed)
         if self.strongTieBreakMethod is not None:
             e.strongTieBreakMethod = self.strongTieBreakMethod
 
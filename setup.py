@@ -31,5 +31,10 @@ setup(
     license='LICENSE.txt',
     description='agora voting tally system',
     long_description=open('README.md').read(),
-    install_requires=[]
+    install_requires=[],
+    # synthetic elections, benchmarks, bootstrap and preview. The counting
+    # methods also use numpy when it is installed, to run faster
+    extras_require={
+        'tools': ['numpy>=1.17'],
+    }
 )
@@ -4,10 +4,26 @@ import codecs
 import os
 import copy
 import json
+import pickle
+import tempfile
 from operator import itemgetter
 
-from agora_tally.tally import do_tartally, do_dirtally, do_tally
+from agora_tally.tally import do_tartally, do_dirtally, do_tally, derive_seed, \
+    parse_votes
+from agora_tally import instrumentation, memory
+from agora_tally.voting_systems import base as voting_base
+from agora_tally.voting_systems.base import get_voting_system_by_id
 from agora_tally.voting_systems.plurality_at_large import PluralityAtLarge
+from agora_tally.ballot_counter.ballots import Ballots, BallotsView, \
+    BallotStream, PackedBallots
+from agora_tally.ballot_counter.plugins import getMethodPlugins, \
+    getReportPlugins
+from agora_tally.ballot_counter import pairwise, spars, benchmarkElection, \
+    compareMethods
+from agora_tally.ballot_counter.qx import QX, QXArray
+from agora_tally.ballot_counter.MethodPlugins.Condorcet import Condorcet
+from agora_tally.ballot_counter.STV import VotePiles, BallotTree, RoundTable, \
+    Standings, TransferLog, loadCheckpoint
 from test import file_helpers
 import test.desborda_test
 import test.desborda_test_data
@@ -260,5 +276,1182 @@ class TestDesborda2(unittest.TestCase):
     def test2(self):
         self._do_test(test.desborda_test_data.test_desborda2_2)
 
+def random_ballots(num_candidates, num_ballots, max_length, seed):
+    '''
+    Returns clean ballots with random rankings of up to max_length
+    candidates, reproducible for a given seed.
+    '''
+    rand = random.Random(seed)
+    ballots = Ballots()
+    ballots.numCandidates = num_candidates
+    ballots.names = ["C%d" % i for i in range(num_candidates)]
+    ballots.numSeats = 1
+    for i in range(num_ballots):
+        length = rand.randint(1, min(num_candidates, max_length))
+        ballots.appendBallot(rand.sample(range(num_candidates), length))
+    return ballots.getCleanBallots()
+
+@unittest.skipUnless(pairwise.available(), "numpy is not installed")
+class TestCondorcet(unittest.TestCase):
+    COMPLETIONS = [
+        "Schwartz Sequential Dropping",
+        "IRV on Smith Set",
+        "Borda on Smith Set"
+    ]
+
+    def _run(self, ballots, completion, vectorized, seed):
+        election = Condorcet(ballots)
+        election.completion = completion
+        election.vectorized = vectorized
+        random.seed(seed)
+        election.runElection()
+        return election
+
+    def _assert_same(self, ballots, seed):
+        for completion in self.COMPLETIONS:
+            fast = self._run(ballots, completion, True, seed)
+            slow = self._run(ballots, completion, False, seed)
+            self.assertEqual(fast.pMat, slow.pMat)
+            self.assertEqual(fast.smithSet, slow.smithSet)
+            self.assertEqual(fast.dMat, slow.dMat)
+            self.assertEqual(fast.SSDinfo, slow.SSDinfo)
+            self.assertEqual(fast.winners, slow.winners)
+
+    def test_random(self):
+        for seed in range(100):
+            rand = random.Random(seed)
+            ballots = random_ballots(
+                rand.randint(2, 8), rand.randint(3, 40), 4, seed)
+            self._assert_same(ballots, seed)
+
+    def test_cycle(self):
+        # rock-paper-scissors among the first three candidates
+        ballots = Ballots()
+        ballots.numCandidates = 4
+        ballots.names = ["A", "B", "C", "D"]
+        ballots.numSeats = 1
+        for ballot in [[0, 1, 2]] * 4 + [[1, 2, 0]] * 3 + [[2, 0, 1]] * 2:
+            ballots.appendBallot(ballot + [3])
+        ballots = ballots.getCleanBallots()
+        self._assert_same(ballots, 0)
+        self.assertEqual(self._run(ballots, self.COMPLETIONS[0], True, 0).smithSet,
+                         [0, 1, 2])
+
+    def test_many_candidates(self):
+        ballots = random_ballots(60, 400, 60, 1)
+        self._assert_same(ballots, 1)
+
+class TestCleanBallots(unittest.TestCase):
+    def _dirty_ballots(self):
+        ballots = Ballots()
+        ballots.names = ["A", "B", "C", "D"]
+        ballots.withdrawn = [1]
+        for ballot in [[0, 1, 2], [-1, 2, [0, 3], 3], [1], [2, 2, 0], [0, 1, 2]]:
+            ballots.appendBallot(ballot)
+        return ballots
+
+    def test_clean(self):
+        clean = self._dirty_ballots().getCleanBallots()
+        self.assertEqual(clean.names, ["A", "C", "D"])
+        self.assertEqual(clean.uniqueBallots, [[0, 1], [1, 2], [1, 0]])
+        self.assertEqual(clean.uniqueBallotCount, [2, 1, 1])
+        self.assertEqual(clean.ballotOrder, [0, 1, 2, 0])
+        self.assertEqual(clean.uniqueBallotIndexToBallotIndices,
+                         [set([0, 3]), set([1]), set([2])])
+        self.assertEqual([clean.getBallotID(i) for i in range(4)], [1, 2, 4, 5])
+
+    def test_memoized(self):
+        dirty = self._dirty_ballots()
+        first = dirty.getCleanBallots()
+        second = dirty.getCleanBallots()
+        self.assertIs(first.uniqueBallots[0], second.uniqueBallots[0])
+        self.assertIsNot(first, second)
+        self.assertIsNot(
+            dirty.getCleanBallots(removeEmpty=False).uniqueBallots[0],
+            first.uniqueBallots[0])
+
+        dirty.withdrawn = []
+        self.assertEqual(dirty.getCleanBallots().names, ["A", "B", "C", "D"])
+        dirty.withdrawn = [1]
+        dirty.appendBallot([3])
+        third = dirty.getCleanBallots()
+        self.assertEqual(third.uniqueBallots, [[0, 1], [1, 2], [1, 0], [2]])
+        self.assertEqual(first.numBallots, 4)
+
+    def test_modify_clean(self):
+        dirty = self._dirty_ballots()
+        clean = dirty.getCleanBallots()
+        clean.appendBallot([2], 99)
+        clean.appendBallot([0, 1], 100)
+        clean.reorderCandidates([2, 1, 0])
+        self.assertEqual(clean.numBallots, 6)
+
+        again = dirty.getCleanBallots()
+        self.assertEqual(again.uniqueBallots, [[0, 1], [1, 2], [1, 0]])
+        self.assertEqual(again.uniqueBallotCount, [2, 1, 1])
+        self.assertEqual(again.ballotOrder, [0, 1, 2, 0])
+        self.assertEqual(again.uniqueBallotIndexToBallotIndices,
+                         [set([0, 3]), set([1]), set([2])])
+        self.assertEqual([again.getBallotID(i) for i in range(4)],
+                         [1, 2, 4, 5])
+
+class TestBallotsView(unittest.TestCase):
+    METHODS = ["IRV", "Borda", "Bucklin", "SNTV", "Approval", "MeekSTV"]
+
+    def test_same_as_clean_ballots(self):
+        methods = getMethodPlugins("byName", exclude0=False)
+        for seed in range(20):
+            ballots = random_ballots(6, 50, 6, seed)
+            withdrawn = random.Random(seed).sample(range(6), 2)
+            dirty = ballots.copy()
+            dirty.withdrawn = withdrawn
+            clean = dirty.getCleanBallots()
+            view = BallotsView(ballots, withdrawn)
+
+            self.assertEqual(view.names, clean.names)
+            self.assertEqual(view.numBallots, clean.numBallots)
+            self.assertEqual(
+                [view.getBallotAndID(i) for i in range(view.numBallots)],
+                [clean.getBallotAndID(i) for i in range(clean.numBallots)])
+            for name in self.METHODS:
+                view_election = methods[name](view)
+                random.seed(seed)
+                view_election.runElection()
+                clean_election = methods[name](clean)
+                random.seed(seed)
+                clean_election.runElection()
+                self.assertEqual(view_election.winners, clean_election.winners)
+                self.assertEqual(view_election.count, clean_election.count)
+
+class TestBallotCursors(unittest.TestCase):
+    METHODS = ["IRV", "Coombs", "MinneapolisSTV", "FTSTV", "GPCA2000STV",
+               "NIrelandSTV", "ScottishSTV", "CambridgeSTV", "RTSTV"]
+
+    def test_lookup(self):
+        ballots = Ballots()
+        ballots.numCandidates = 4
+        ballots.appendBallot([2, 0, 3])
+        ballots.appendBallot([1])
+        ballots.appendBallot([2, 0, 3])
+        cursors = ballots.getCursors()
+        self.assertEqual(cursors.getTopChoiceFromBallot(2, set([0, 1, 3])), 0)
+        self.assertEqual(cursors.position, [1, 0])
+        self.assertEqual(cursors.getTopChoiceFromBallot(0, set([0, 3])), 0)
+        self.assertEqual(cursors.getTopChoiceFromWeightedBallot(0, set([3])), 3)
+        self.assertEqual(cursors.getTopChoiceFromWeightedBallot(1, set([3])), None)
+        cursors.reset()
+        self.assertEqual(cursors.getTopChoiceFromWeightedBallot(0, set([2])), 2)
+
+    def test_same_as_ballots(self):
+        methods = getMethodPlugins("byName", exclude0=False)
+        for seed in range(10):
+            ballots = random_ballots(7, 300, 7, seed)
+            ballots.numSeats = 1 + seed % 3
+            for name in self.METHODS:
+                results = []
+                for use_cursors in [True, False]:
+                    if not use_cursors:
+                        # Ballots have the same lookups without cursors
+                        ballots.getCursors = lambda: ballots
+                    election = methods[name](ballots)
+                    random.seed(seed)
+                    election.runElection()
+                    results.append(
+                        (election.winners, election.count, election.msg))
+                del ballots.getCursors
+                self.assertEqual(results[0], results[1])
+
+class TestBallotStream(unittest.TestCase):
+    def test_runs(self):
+        ballots = Ballots()
+        ballots.numCandidates = 3
+        for ballot in [[0], [0], [1, 2], [0], [2], [2], [2]]:
+            ballots.appendBallot(ballot)
+        stream = ballots.getBallotStream()
+        self.assertEqual(len(stream), 7)
+        self.assertEqual(list(stream.getRuns()),
+                         [(0, 2, 0), (2, 3, 1), (3, 4, 0), (4, 7, 2)])
+
+    def test_group_by(self):
+        rand = random.Random(0)
+        for order in [[rand.randrange(5) for i in range(100)],
+                      sorted(rand.randrange(5) for i in range(100))]:
+            stream = BallotStream(order)
+            key = [1, None, 1, 0, 2]
+            groups = stream.groupBy(key)
+            for k in set(key):
+                self.assertEqual(groups[k], [i for i, j in enumerate(order)
+                                             if key[j] == k])
+
+class TestRankHistogram(unittest.TestCase):
+    def test_histogram(self):
+        ballots = Ballots()
+        ballots.numCandidates = 3
+        for ballot in [[2, 0, 1], [1], [2, 0, 1], [0, 2]]:
+            ballots.appendBallot(ballot)
+        clean = ballots.getCleanBallots()
+        ranked, lengths = clean.getRankHistogram()
+        self.assertEqual(ranked, [[1, 1, 2], [2, 0, 1], [0, 2, 0]])
+        self.assertEqual(lengths, [0, 1, 1, 2])
+
+    def test_coombs_exact_shares(self):
+        # Shares of a fifth add up to the same last place votes for A and E,
+        # which summing them as floating point numbers would miss
+        ballots = Ballots()
+        ballots.numCandidates = 6
+        ballots.names = ["A", "B", "C", "D", "E", "F"]
+        for ballot in [[2], [3], [3, 5, 0, 2, 4, 1], [5],
+                       [3, 1, 2, 4, 5, 0]]:
+            ballots.appendBallot(ballot)
+        e = getMethodPlugins("byName")["Coombs"](ballots.getCleanBallots())
+        random.seed(0)
+        e.runElection()
+        self.assertIn("were tied", e.msg[1])
+
+class TestVotePiles(unittest.TestCase):
+    def test_piles(self):
+        votes = VotePiles(3, 8)
+        for i, c in [(5, 0), (1, 0), (7, 1), (3, 0)]:
+            votes.add(c, i)
+        self.assertEqual(list(votes[0]), [5, 1, 3])
+        self.assertTrue(7 in votes[1])
+
+        votes.add(2, 1)
+        self.assertEqual(list(votes[0]), [5, 3])
+        self.assertEqual(list(votes[2]), [1])
+        self.assertEqual(votes.getHolder(1), 2)
+
+        votes.remove(5)
+        votes.remove(5)
+        self.assertEqual(votes.getHolder(5), None)
+        votes.clear(0)
+        self.assertEqual(len(votes[0]), 0)
+        self.assertEqual(votes.getHolder(3), None)
+        self.assertEqual([len(pile) for pile in votes], [0, 1, 1])
+
+    def test_totals(self):
+        votes = VotePiles(3, 8)
+        for i, c, value in [(0, 0, 5), (1, 0, 3), (2, 1, 4)]:
+            votes.add(c, i, value)
+        self.assertEqual(votes.totals, [8, 4, 0])
+        votes.add(2, 1, 2)
+        self.assertEqual(votes.totals, [5, 4, 2])
+        self.assertEqual(votes.getValue(1), 2)
+        votes.remove(2)
+        votes.clear(0)
+        self.assertEqual(votes.totals, [0, 0, 2])
+        votes.extend(0, [6, 4, 5], 3)
+        self.assertEqual(list(votes[0]), [6, 4, 5])
+        self.assertEqual(votes.totals, [9, 0, 2])
+        self.assertEqual(votes.getHolder(4), 0)
+
+    def test_checked_counts(self):
+        methods = getMethodPlugins("byName", exclude0=False)
+        for name in ["IRV", "ScottishSTV", "MinneapolisSTV", "ERS97STV",
+                     "NIrelandSTV"]:
+            for seed in range(5):
+                b = random_ballots(7, 200, 7, seed)
+                b.numSeats = 3
+                counts = []
+                for checkCount in [False, True]:
+                    e = methods[name](b)
+                    e.checkCount = checkCount
+                    random.seed(seed)
+                    e.runElection()
+                    counts.append((e.count, sorted(e.winners)))
+                self.assertEqual(counts[0], counts[1])
+
+class TestBallotTree(unittest.TestCase):
+    def paths(self, b, continuing, winners):
+        # weight of each path of non-losing candidates and the ballots
+        # stopping at each path, worked out ballot by ballot
+        weights = {}
+        ballots = {}
+        for i in range(b.numWeightedBallots):
+            weight, ballot = b.getWeightedBallot(i)
+            path = ()
+            for c in ballot:
+                if c in continuing or c in winners:
+                    path += (c,)
+                    weights[path] = weights.get(path, 0) + weight
+                    if c in continuing:
+                        ballots.setdefault(path, []).append(i)
+                        break
+        return weights, ballots
+
+    def tree_paths(self, tree):
+        paths = {0: ()}
+        weights = {}
+        ballots = {}
+        for k, c, parent, n in tree.nodes():
+            paths[k] = paths[parent] + (c,)
+            weights[paths[k]] = n
+            if tree.ballots[k]:
+                ballots[paths[k]] = sorted(tree.ballots[k])
+        return weights, ballots
+
+    def test_updates(self):
+        for seed in range(10):
+            b = random_ballots(8, 200, 8, seed)
+            rand = random.Random(seed)
+            continuing = set(range(8))
+            winners = set()
+            tree = BallotTree(b)
+            for i in range(b.numWeightedBallots):
+                tree.addBallot(i, 0, 0, continuing, winners)
+            while len(continuing) > 1:
+                c = rand.choice(sorted(continuing))
+                continuing.remove(c)
+                if rand.random() < 0.5:
+                    winners.add(c)
+                tree.update(continuing, winners)
+                self.assertEqual(self.tree_paths(tree),
+                                 self.paths(b, continuing, winners))
+
+    def test_meek_count(self):
+        methods = getMethodPlugins("byName")
+        for seed in range(5):
+            b = random_ballots(6, 100, 6, seed)
+            b.numSeats = 2
+            e = methods["MeekSTV"](b)
+            e.runElection()
+            # recount the last round path by path
+            R = e.R
+            weights = self.tree_paths(e.tree)[0]
+            count = [0] * b.numCandidates
+            for path in sorted(weights, key=len):
+                rrr = e.p
+                for c in path[:-1]:
+                    rrr = rrr * (e.p - e.keepFactor[R][c]) // e.p
+                c = path[-1]
+                count[c] += rrr * e.keepFactor[R][c] * weights[path] // e.p
+            self.assertEqual(count, list(e.count[R]))
+
+class TestRoundTable(unittest.TestCase):
+    def fill(self, table, rand, num_rounds):
+        rows = []
+        for r in range(num_rounds):
+            table.appendRow()
+            row = [rand.randint(0, 3) for c in range(table.numColumns)]
+            for c, value in enumerate(row):
+                table[r][c] += value
+            rows.append(row)
+        return rows
+
+    def test_rows(self):
+        rand = random.Random(0)
+        table = RoundTable(5, 1000)
+        self.assertEqual(table.typecode, "q")
+        rows = self.fill(table, rand, 100)
+        self.assertEqual(table.toList(), rows)
+        table[3] = table[2][:]
+        self.assertEqual(list(table[3]), rows[2])
+        self.assertEqual(pickle.loads(pickle.dumps(table)).toList(),
+                         table.toList())
+
+        self.assertEqual(RoundTable(5, 2**70).typecode, None)
+        table = RoundTable(5)
+        table.appendRow()
+        table[0][1] += 0.5
+        self.assertEqual(table[0], [0, 0.5, 0, 0, 0])
+
+    @unittest.skipUnless(pairwise.available(), "numpy is not installed")
+    def test_narrow_tie(self):
+        e = getMethodPlugins("byName")["IRV"](random_ballots(3, 5, 3, 0))
+        for seed in range(50):
+            rand = random.Random(seed)
+            table = RoundTable(6, 100)
+            self.fill(table, rand, 40)
+            cList = sorted(rand.sample(range(6), 3))
+            rounds = list(range(40))
+            if seed % 2:
+                rounds.reverse()
+            mostfewest = rand.choice(["most", "fewest"])
+            tied = cList
+            broken = None
+            for r in rounds:
+                tied = e.findTiedCand(tied, mostfewest, table[r])
+                if len(tied) == 1:
+                    broken = r
+                    break
+            self.assertEqual(table.narrowTie(cList, rounds, mostfewest),
+                             (tied, broken))
+
+class TestStandings(unittest.TestCase):
+    def sure_losers(self, values, candidates, surplus, max_losers, inclusive):
+        clusters = []
+        for c in sorted(candidates, key=lambda c: (values[c], c)):
+            if clusters and values[clusters[-1][0]] == values[c]:
+                clusters[-1].append(c)
+            else:
+                clusters.append([c])
+        losers = []
+        potential = []
+        s = surplus
+        for i, cluster in enumerate(clusters[:-1]):
+            s += len(cluster) * values[cluster[0]]
+            potential += cluster
+            next_value = values[clusters[i+1][0]]
+            if (s < next_value or (inclusive and s == next_value)) and \
+               len(potential) <= max_losers:
+                losers = list(potential)
+        return losers
+
+    def test_standings(self):
+        for seed in range(200):
+            rand = random.Random(seed)
+            values = [rand.choice([0, 1, 2, 3, 5, 8, 20, 50])
+                      for c in range(10)]
+            candidates = set(rand.sample(range(10), rand.randint(1, 10)))
+            standings = Standings(0, values, candidates)
+            for c in rand.sample(sorted(candidates), len(candidates) // 3):
+                standings.discard(c)
+                candidates.remove(c)
+            self.assertEqual(len(standings), len(candidates))
+            low = min(values[c] for c in candidates)
+            high = max(values[c] for c in candidates)
+            self.assertEqual(standings.fewest(),
+                             sorted(c for c in candidates if values[c] == low))
+            self.assertEqual(standings.most(),
+                             sorted(c for c in candidates if values[c] == high))
+            self.assertEqual(values[standings.top()], high)
+
+            surplus = rand.randint(0, 5)
+            max_losers = rand.randint(0, len(candidates))
+            for inclusive in [False, True]:
+                self.assertEqual(
+                    standings.sureLosers(surplus, max_losers, inclusive),
+                    self.sure_losers(values, candidates, surplus, max_losers,
+                                     inclusive))
+
+class TestTransferLog(unittest.TestCase):
+    def test_batches(self):
+        rand = random.Random(0)
+        log = TransferLog(4, 50)
+        batches = [[] for c in range(4)]
+        last = {}
+        for k in range(30):
+            c = rand.randrange(4)
+            votes = rand.sample(range(50), rand.randint(0, 5))
+            log.addBatch(c, votes)
+            batches[c].append(votes)
+            for i in votes:
+                last[i] = (c, len(batches[c]) - 1)
+        for c in range(4):
+            for k, votes in enumerate(batches[c]):
+                self.assertEqual(list(log.getBatch(c, k)), votes)
+                for i in range(50):
+                    self.assertEqual(log.inBatch(c, k, i),
+                                     last.get(i) == (c, k))
+
+    def test_stages(self):
+        method = getMethodPlugins("byName")["ERS97STV"]
+        substages = 0
+        for seed in range(20):
+            b = random_ballots(10, 100, 3, seed)
+            b.numSeats = 5
+            e = method(b)
+            e.runElection()
+            substages += e.numRounds - e.numStages
+            for s, rounds in enumerate(e.stages):
+                for r in rounds:
+                    self.assertEqual(e.roundToStage(r), s)
+        self.assertTrue(substages > 0)
+
+@unittest.skipUnless(QXArray.available(), "numpy is not installed")
+class TestQXArray(unittest.TestCase):
+    def setUp(self):
+        self.saved = dict((k, getattr(QX, k)) for k in
+                          ["precision", "guard", "p", "g", "grnd", "geps",
+                           "One", "maxDiff", "minDiff"])
+
+    def tearDown(self):
+        for k, v in self.saved.items():
+            setattr(QX, k, v)
+
+    def values(self, rand, n, magnitude):
+        return [rand.randint(-magnitude, magnitude) for i in range(n)]
+
+    def test_arithmetic(self):
+        class Election(object):
+            pass
+        for prec, guard in [(6, 0), (4, 4), (9, 9)]:
+            QX.set_precision(Election(), prec)
+            QX.set_guard(Election(), guard)
+            rand = random.Random(prec)
+            for magnitude in [10, QX.p, 10**25]:
+                a = self.values(rand, 200, magnitude)
+                b = self.values(rand, 200, magnitude)
+                b[:20] = a[:20]
+                b[20:40] = [v + rand.randint(-QX.geps, QX.geps)
+                            for v in a[20:40]]
+                b = [v if v != 0 else 1 for v in b]
+                arrays = (QXArray.array(a), QXArray.array(b))
+                for op in ["mult", "div", "add", "sub"]:
+                    scalar = [getattr(QX, op)(x, y) for x, y in zip(a, b)]
+                    vector = getattr(QXArray, op)(*arrays)
+                    self.assertEqual([int(v) for v in vector], scalar)
+                self.assertEqual([int(v) for v in QXArray.fix(arrays[0])],
+                                 [QX.fix(x) for x in a])
+                for op in ["eq", "lt", "gt", "le", "ge"]:
+                    QX.maxDiff, QX.minDiff = 0, QX.p * 100
+                    scalar = [getattr(QX, op)(x, y) for x, y in zip(a, b)]
+                    stats = (QX.maxDiff, QX.minDiff)
+                    QX.maxDiff, QX.minDiff = 0, QX.p * 100
+                    vector = getattr(QXArray, op)(*arrays)
+                    self.assertEqual(vector.tolist(), scalar)
+                    self.assertEqual((QX.maxDiff, QX.minDiff), stats)
+
+    def test_fits(self):
+        a = QXArray.array([3, -2**40])
+        self.assertNotEqual(a.dtype, object)
+        product = QXArray.mul(a, a)
+        self.assertEqual(product.dtype, object)
+        self.assertEqual(product.tolist(), [9, 2**80])
+        self.assertNotEqual(QXArray.mulDiv(a, a, 2**50).dtype, object)
+
+    def test_sweeps(self):
+        methods = getMethodPlugins("byName", exclude0=False)
+        minVectorNodes = BallotTree.minVectorNodes
+        try:
+            for seed in range(10):
+                b = random_ballots(7, 300, 7, seed)
+                b.numSeats = 3
+                for name in ["MeekSTV", "WarrenSTV", "MeekQXSTV",
+                             "WarrenQXSTV"]:
+                    results = []
+                    for BallotTree.minVectorNodes in [len(b.names) ** 9, 0]:
+                        e = methods[name](b)
+                        random.seed(seed)
+                        e.runElection()
+                        results.append((e.winners, e.count, e.msg))
+                    self.assertEqual(results[0], results[1])
+        finally:
+            BallotTree.minVectorNodes = minVectorNodes
+
+    def test_qpq(self):
+        method = getMethodPlugins("byName", exclude0=False)["QPQ"]
+        available = QXArray.__dict__["available"]
+        try:
+            for seed in range(10):
+                b = random_ballots(7, 300, 7, seed)
+                b.numSeats = 3
+                results = []
+                for arrays in [True, False]:
+                    QXArray.available = staticmethod(lambda: arrays)
+                    e = method(b)
+                    random.seed(seed)
+                    e.runElection()
+                    self.assertEqual(e.arrays, arrays)
+                    results.append((e.winners, e.count, e.thresh, e.msg))
+                self.assertEqual(results[0], results[1])
+        finally:
+            QXArray.available = available
+
+class TestParseVotes(unittest.TestCase):
+    def test_parse_votes(self):
+        questions = json.loads(file_helpers.read_file(
+            os.path.join("test", "fixtures", "borda", "questions_json")))
+        question = questions[0]
+        tally = get_voting_system_by_id(question['tally_type']).create_tally(
+            None, 0)
+        lines = ['"13"\n', '"6"\n', '"5"\n', 'garbage', '"24"\n']
+        self.assertEqual(
+            list(parse_votes(tally, question, 0, lines)),
+            [('"13"\n', [0, 1], 'valid'), ('"6"\n', None, 'blank'),
+             ('"5"\n', None, 'invalid'), ('garbage', None, 'invalid'),
+             ('"24"\n', [1, 2], 'valid')])
+
+        withdrawals = [dict(question_index=0, answer_id=1),
+                       dict(question_index=1, answer_id=0)]
+        self.assertEqual(
+            [choices for line, choices, kind
+             in parse_votes(tally, question, 0, lines, withdrawals)],
+            [[0], None, None, None, [2]])
+
+@unittest.skipUnless(pairwise.available(), "numpy is not installed")
+class TestSynthetic(unittest.TestCase):
+    FIXTURES_PATH = os.path.join("test", "fixtures")
+
+    def setUp(self):
+        six.get_function_defaults(do_tally)[0][:] = []
+
+    def test_encoding(self):
+        from agora_tally import synthetic
+        rng = spars.newRNG(0)
+        for tally_type in ["borda", "pairwise-beta"]:
+            question = dict(answers=[dict(id=i) for i in range(12)], min=1,
+                            max=4, tally_type=tally_type)
+            tally = get_voting_system_by_id(tally_type).create_tally(None, 0)
+            values = synthetic.generate_votes(question, 300, rng, 'bigrams')
+            for value in values.tolist():
+                choices = tally.parse_vote(value - 1, question)
+                self.assertTrue(1 <= len(choices) <= 8)
+
+    def test_election(self):
+        from agora_tally import synthetic
+        questions = json.loads(file_helpers.read_file(
+            os.path.join(self.FIXTURES_PATH, "borda", "questions_json")))
+        results = []
+        for i in range(2):
+            tally_path = tempfile.mkdtemp()
+            try:
+                seed = synthetic.generate_election(
+                    tally_path, questions, 1000, 7, blank_rate=0.2,
+                    invalid_rate=0.1)
+                self.assertEqual(seed, 7)
+                results.append(do_dirtally(tally_path,
+                                           ignore_invalid_votes=True))
+            finally:
+                file_helpers.remove_tree(tally_path)
+            six.get_function_defaults(do_tally)[0][:] = []
+        self.assertEqual(results[0], results[1])
+        totals = results[0]['questions'][0]['totals']
+        self.assertEqual(results[0]['total_votes'], 1000)
+        self.assertEqual(sum(totals.values()), 1000)
+        self.assertTrue(150 < totals['blank_votes'] < 250)
+        self.assertTrue(50 < totals['null_votes'] < 150)
+
+@unittest.skipUnless(pairwise.available(), "numpy is not installed")
+class TestBenchmark(unittest.TestCase):
+    def setUp(self):
+        six.get_function_defaults(do_tally)[0][:] = []
+
+    def test_run_tally(self):
+        from agora_tally import benchmark, synthetic
+        work_path = tempfile.mkdtemp()
+        try:
+            dir_path = os.path.join(work_path, "election")
+            tar_path = os.path.join(work_path, "election.tar.gz")
+            question = benchmark.make_question("borda-custom", 5, 3)
+            synthetic.generate_election(dir_path, [question], 500, 1,
+                                        invalid_rate=0.1)
+            benchmark.write_tar(dir_path, tar_path)
+            for path, mode in [(dir_path, "dir"), (tar_path, "tar")]:
+                six.get_function_defaults(do_tally)[0][:] = []
+                run = benchmark.run_tally(path, mode)
+                self.assertEqual(run["error"], None)
+                self.assertEqual(sorted(run["phases"]),
+                                 ["aggregate", "other", "parse", "post_tally"])
+                self.assertTrue(run["phases"]["parse"] > 0)
+                self.assertAlmostEqual(sum(run["phases"].values()),
+                                       run["time"])
+        finally:
+            file_helpers.remove_tree(work_path)
+
+@unittest.skipUnless(pairwise.available(), "numpy is not installed")
+class TestMethodBenchmark(unittest.TestCase):
+    def test_benchmark_methods(self):
+        methods = getMethodPlugins("byName", exclude0=False)
+        reports = getReportPlugins("byName", exclude0=False)
+        b = benchmarkElection.generateBallots(2000, 6, 2, seed=1)
+        self.assertEqual(b.numBallots, 2000)
+        sampler = benchmarkElection.StackSampler()
+        results = benchmarkElection.runBenchmarks(
+            [("generated", b)], [methods["IRV"], methods["MeekSTV"]], {},
+            reports["TextReport"], warmup=1, reps=3, sampler=sampler,
+            traceMemory=True)
+        self.assertEqual([r["method"] for r in results["results"]],
+                         ["IRV", "MeekSTV"])
+        for result in results["results"]:
+            self.assertEqual(result["error"], None)
+            self.assertEqual(sorted(result["phases"]),
+                             sorted(benchmarkElection.phases))
+            self.assertTrue(result["phases"]["countBallots"]["median"] > 0)
+            self.assertTrue(result["p95"] >= result["median"])
+            self.assertTrue(result["phases"]["report"]["peakKB"] > 0)
+        for key in sampler.counts:
+            self.assertTrue(key.split(";")[0] in ["IRV", "MeekSTV"])
+
+        output = six.StringIO()
+        benchmarkElection.writeCSV(results, output)
+        lines = output.getvalue().splitlines()
+        self.assertEqual(len(lines), 1 + 2 * 5)
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        six.get_function_defaults(do_tally)[0][:] = []
+
+    def test_disabled(self):
+        self.assertFalse(instrumentation.enabled())
+        self.assertTrue(instrumentation.span("x") is instrumentation.NULL_SPAN)
+        self.assertEqual(instrumentation.start_span("x"), None)
+
+    def test_chrome_trace(self):
+        tally_path = os.path.join("test", "fixtures", "plurality-at-large")
+        with instrumentation.ChromeTrace() as trace:
+            do_dirtally(tally_path)
+            b = random_ballots(5, 200, 5, 1)
+            b.numSeats = 2
+            e = getMethodPlugins("byName", exclude0=False)["MeekSTV"](b)
+            e.runElection()
+        self.assertFalse(instrumentation.enabled())
+
+        names = [event["name"] for event in trace.events]
+        for name in ["pre_tally", "add_votes", "votes", "post_tally",
+                     "preCount", "countBallots", "postCount"]:
+            self.assertTrue(name in names, name)
+        rounds = [event for event in trace.events if event["name"] == "round"]
+        self.assertEqual([event["args"]["round"] for event in rounds],
+                         list(range(e.numRounds)))
+        count = [event for event in trace.events
+                 if event["name"] == "countBallots"][-1]
+        for event in rounds:
+            self.assertTrue(event["ts"] >= count["ts"])
+            self.assertTrue(event["ts"] + event["dur"] <=
+                            count["ts"] + count["dur"])
+        json.dumps(trace.to_json())
+
+class TestMemoryProfile(unittest.TestCase):
+    def setUp(self):
+        six.get_function_defaults(do_tally)[0][:] = []
+
+    def test_tally_log(self):
+        import tracemalloc
+        tally_path = os.path.join("test", "fixtures", "borda")
+        tallies = []
+        results = do_dirtally(tally_path, memory_profile=True,
+                              monkey_patcher=tallies.append)
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertFalse(instrumentation.enabled())
+        should_results = file_helpers.read_file(
+            os.path.join(tally_path, "results_json"))
+        self.assertEqual(file_helpers.serialize(results), should_results)
+
+        profile = tallies[0].get_log()["memory_profile"]
+        self.assertEqual([phase["name"] for phase in profile["phases"]],
+                         ["pre_tally", "add_votes", "preCount",
+                          "countBallots", "postCount", "generateReport",
+                          "post_tally"])
+        for phase in profile["phases"]:
+            self.assertTrue(phase["peak_kb"] >= phase["current_kb"] > 0)
+        self.assertTrue(len(profile["phases"][-1]["top_allocations"]) > 0)
+        for name in ["ballots", "uniqueBallots", "ballotOrder",
+                     "uniqueBallotIndexToBallotIndices", "count"]:
+            self.assertTrue(profile["structures_kb"][name] > 0, name)
+
+    def test_deep_size(self):
+        shared = list(range(100))
+        seen = set()
+        size = memory.deep_size(dict(a=shared, b=[shared]), seen)
+        self.assertTrue(size > memory.deep_size(list(range(100)), set()))
+        self.assertEqual(memory.deep_size(shared, seen), 0)
+
+class TestCompareMethods(unittest.TestCase):
+    def test_packed_ballots(self):
+        b = random_ballots(5, 200, 5, 3).getCleanBallots()
+        packed = PackedBallots(*PackedBallots.pack(b), names=b.names)
+        self.assertEqual(packed.numBallots, b.numBallots)
+        self.assertEqual(packed.getSortedWeightedBallots(),
+                         b.getSortedWeightedBallots())
+        self.assertEqual([packed.getBallot(i) for i in range(b.numBallots)],
+                         [b.getBallot(i) for i in range(b.numBallots)])
+        self.assertRaises(RuntimeError, packed.appendBallot, [0])
+
+    def test_compare(self):
+        methods = getMethodPlugins("byName", exclude0=False)
+        b = random_ballots(6, 300, 6, 4)
+        b.numSeats = 2
+        b = b.getCleanBallots()
+        names = ["IRV", "MeekSTV", "Condorcet", "Borda"]
+        results = compareMethods.compareMethods(b, names, processes=2)
+        self.assertEqual([r["method"] for r in results["methods"]], names)
+        for name, result in zip(names, results["methods"]):
+            e = methods[name](b)
+            e.setSeed(0)
+            e.runElection()
+            self.assertEqual(result["error"], None)
+            self.assertEqual(result["winners"],
+                             [b.names[c] for c in sorted(e.winners)])
+            self.assertEqual(result["numRounds"],
+                             getattr(e, "numRounds", None))
+            for winner in result["winners"]:
+                self.assertTrue(name in results["electedBy"][winner])
+
+@unittest.skipUnless(pairwise.available(), "numpy is not installed")
+class TestBootstrap(unittest.TestCase):
+    def setUp(self):
+        six.get_function_defaults(do_tally)[0][:] = []
+
+    def test_fixture(self):
+        from agora_tally import bootstrap
+        tally_path = os.path.join("test", "fixtures", "borda")
+        questions = json.loads(file_helpers.read_file(
+            os.path.join(tally_path, "questions_json")))
+        ballots, counts = bootstrap.get_histogram(tally_path, questions, 0)
+        self.assertEqual(sum(counts), 6)
+        results = bootstrap.bootstrap(questions, 0, ballots, counts, 50,
+                                      seed=1, processes=1)
+        self.assertEqual(results["engine"], "positional")
+        self.assertEqual(results["valid_votes"], 6)
+        self.assertEqual([answer["observed_position"]
+                          for answer in results["answers"]], [None, 0, None])
+        self.assertAlmostEqual(sum(answer["win_probability"]
+                                   for answer in results["answers"]), 1.0)
+
+    def test_engines(self):
+        from agora_tally import benchmark, bootstrap, synthetic
+        work_path = tempfile.mkdtemp()
+        try:
+            dir_path = os.path.join(work_path, "election")
+            question = benchmark.make_question("plurality-at-large", 5, 3,
+                                               num_winners=2)
+            synthetic.generate_election(dir_path, [question], 300, 2)
+            questions = json.loads(file_helpers.read_file(
+                os.path.join(dir_path, "questions_json")))
+            ballots, counts = bootstrap.get_histogram(dir_path, questions, 0)
+            results = [
+                bootstrap.bootstrap(questions, 0, ballots, counts, 200,
+                                    seed=3, processes=processes,
+                                    engine=engine)
+                for engine, processes in [("positional", 1),
+                                          ("positional", 2), ("tally", 1)]]
+        finally:
+            file_helpers.remove_tree(work_path)
+        for result in results[1:]:
+            self.assertEqual(result["winners"], results[0]["winners"])
+            self.assertEqual(result["answers"], results[0]["answers"])
+        for answer in results[0]["answers"]:
+            self.assertEqual(len(answer["position_probabilities"]), 2)
+        self.assertAlmostEqual(sum(answer["win_probability"]
+                                   for answer in results[0]["answers"]), 2.0)
+
+    def test_engines_ties(self):
+        # borda and borda custom break ties for the last winner randomly, the
+        # resamples tied there are counted by their tally
+        from agora_tally import bootstrap
+        for fixture in ["borda", "borda-custom"]:
+            tally_path = os.path.join("test", "fixtures", fixture)
+            questions = json.loads(file_helpers.read_file(
+                os.path.join(tally_path, "questions_json")))
+            ballots, counts = bootstrap.get_histogram(tally_path, questions, 0)
+            results = [
+                bootstrap.bootstrap(questions, 0, ballots, counts, 200,
+                                    seed=5, processes=1, engine=engine)
+                for engine in ["positional", "tally"]]
+            self.assertEqual(results[1]["answers"], results[0]["answers"])
+
+    def test_tally_seed(self):
+        from agora_tally import bootstrap
+        work_path = tempfile.mkdtemp()
+        try:
+            dir_path = os.path.join(work_path, "election")
+            os.makedirs(os.path.join(dir_path, "0-question"))
+            questions = json.loads(file_helpers.read_file(os.path.join(
+                "test", "fixtures", "borda", "questions_json")))
+            file_helpers.write_file(os.path.join(dir_path, "questions_json"),
+                                    file_helpers.serialize(questions))
+            # Alice and Bob tied for the only seat
+            file_helpers.write_file(
+                os.path.join(dir_path, "0-question", "plaintexts_json"),
+                '"2"\n"3"\n')
+            ballots, counts = bootstrap.get_histogram(dir_path, questions, 0)
+            winners = set()
+            for seed in range(8):
+                results = do_dirtally(dir_path, seed=seed)
+                should = [answer["text"]
+                          for answer in results["questions"][0]["answers"]
+                          if answer["winner_position"] is not None]
+                observed = bootstrap.bootstrap(questions, 0, ballots, counts,
+                                               10, seed=1, processes=1,
+                                               tally_seed=seed)
+                self.assertEqual(observed["tally_seed"], seed)
+                self.assertEqual([questions[0]["answers"][winner]["text"]
+                                  for winner in observed["winners"]], should)
+                winners.update(should)
+        finally:
+            file_helpers.remove_tree(work_path)
+        self.assertEqual(winners, set(["Alice", "Bob"]))
+
+@unittest.skipUnless(pairwise.available(), "numpy is not installed")
+class TestPreview(unittest.TestCase):
+    def setUp(self):
+        six.get_function_defaults(do_tally)[0][:] = []
+
+    def test_reservoir_sample(self):
+        from agora_tally import preview
+        rng = random.Random(1)
+        sample, count = preview.reservoir_sample(range(1000), 100, rng)
+        self.assertEqual(count, 1000)
+        self.assertEqual(len(set(sample)), 100)
+        sample, count = preview.reservoir_sample(range(10), 100, rng)
+        self.assertEqual((sample, count), (list(range(10)), 10))
+
+    def test_preview(self):
+        from agora_tally import benchmark, preview, synthetic
+        work_path = tempfile.mkdtemp()
+        try:
+            dir_path = os.path.join(work_path, "election")
+            question = benchmark.make_question("borda", 5, 3, num_winners=2)
+            synthetic.generate_election(dir_path, [question], 1000, 4,
+                                        blank_rate=0.05, invalid_rate=0.05)
+            results = do_dirtally(dir_path, ignore_invalid_votes=True)
+            # the whole election in the sample, so the bounds are exact
+            complete = preview.preview_dirtally(dir_path, size=1000, seed=1,
+                                                method="reservoir")
+            sampled = preview.preview_dirtally(dir_path, size=300, seed=1,
+                                               method="offsets")
+        finally:
+            file_helpers.remove_tree(work_path)
+
+        question = results["questions"][0]
+        self.assertEqual(complete["population"], 1000)
+        self.assertEqual(complete["totals"], question["totals"])
+        for answer, should in zip(complete["answers"], question["answers"]):
+            self.assertEqual(answer["total_count"], should["total_count"])
+            self.assertAlmostEqual(answer["estimated_lower"],
+                                   should["total_count"])
+            self.assertAlmostEqual(answer["estimated_upper"],
+                                   should["total_count"])
+
+        self.assertEqual(sampled["sample_size"], 300)
+        self.assertFalse(sampled["population_exact"])
+        self.assertTrue(800 < sampled["population"] < 1200)
+        self.assertEqual(len(sampled["winners"]), 2)
+        for answer in sampled["answers"]:
+            self.assertTrue(answer["lower"] <= answer["mean_points"] <=
+                            answer["upper"])
+
+class TestCheckpoint(unittest.TestCase):
+    METHODS = ["MeekSTV", "WarrenSTV", "ERS97STV", "RTSTV", "QPQ"]
+
+    def test_resume(self):
+        methods = getMethodPlugins("byName", exclude0=False)
+        work_path = tempfile.mkdtemp()
+        path = os.path.join(work_path, "checkpoint")
+        try:
+            for name in self.METHODS:
+                for seed in range(3):
+                    b = random_ballots(6, 60, 6, seed)
+                    b.numSeats = 2
+                    b = b.getCleanBallots()
+                    e = methods[name](b)
+                    e.setSeed(seed)
+                    e.runElection()
+                    for interval in [1, 2, 3]:
+                        interrupted = methods[name](b)
+                        interrupted.setSeed(seed)
+                        interrupted.checkpointInterval = interval
+                        interrupted.checkpointPath = path
+                        interrupted.runElection()
+                        fresh = methods[name](b)
+                        fresh.setSeed(seed)
+                        resumed = loadCheckpoint(path, fresh)
+                        self.assertTrue(resumed.resumed)
+                        self.assertTrue(resumed.R < e.numRounds)
+                        resumed.continueElection()
+                        self.assertEqual(resumed.winners, e.winners)
+                        self.assertEqual(resumed.count, e.count)
+                        self.assertEqual(resumed.msg, e.msg)
+                        self.assertEqual(resumed.numRounds, e.numRounds)
+                    self._assert_refused(path, methods[name], b, seed)
+        finally:
+            file_helpers.remove_tree(work_path)
+
+    def _assert_refused(self, path, method, b, seed):
+        other = random_ballots(6, 60, 6, seed + 10)
+        other.numSeats = 2
+        other = other.getCleanBallots()
+        self.assertEqual(other.numBallots, b.numBallots)
+        for ballots, other_seed, option in [(other, seed, None),
+                                            (b, seed + 1, None),
+                                            (b, seed, ("numSeats", 3)),
+                                            (b, seed, ("prec", 4))]:
+            e = method(ballots)
+            e.setSeed(other_seed)
+            if option is not None:
+                setattr(e, *option)
+            self.assertRaises(RuntimeError, loadCheckpoint, path, e)
+
+    def test_compare_resume(self):
+        methods = getMethodPlugins("byName", exclude0=False)
+        b = random_ballots(7, 300, 7, 5)
+        b.numSeats = 2
+        b = b.getCleanBallots()
+        work_path = tempfile.mkdtemp()
+        try:
+            # a count that saved a checkpoint before its worker crashed
+            e = methods["MeekSTV"](b)
+            e.setSeed(0)
+            e.checkpointInterval = 1
+            e.checkpointPath = os.path.join(work_path, "MeekSTV.checkpoint")
+            e.runElection()
+            results = compareMethods.compareMethods(
+                b, ["MeekSTV", "IRV"], processes=1,
+                checkpointDir=work_path, checkpointInterval=1)
+            self.assertEqual(os.listdir(work_path), [])
+        finally:
+            file_helpers.remove_tree(work_path)
+        meek, irv = results["methods"]
+        self.assertEqual(meek["resumedAtRound"], e.numRounds - 2)
+        self.assertEqual(meek["winners"],
+                         [b.names[c] for c in sorted(e.winners)])
+        self.assertEqual(meek["numRounds"], e.numRounds)
+        self.assertEqual(irv["resumedAtRound"], None)
+        self.assertEqual(irv["error"], None)
+
+    def test_compare_other_seats(self):
+        methods = getMethodPlugins("byName", exclude0=False)
+        b = random_ballots(7, 300, 7, 5)
+        b.numSeats = 2
+        b = b.getCleanBallots()
+        work_path = tempfile.mkdtemp()
+        try:
+            e = methods["MeekSTV"](b)
+            e.setSeed(0)
+            e.checkpointInterval = 1
+            e.checkpointPath = os.path.join(work_path, "MeekSTV.checkpoint")
+            e.runElection()
+            b.numSeats = 3
+            results = compareMethods.compareMethods(
+                b, ["MeekSTV"], processes=1, checkpointDir=work_path,
+                checkpointInterval=1)
+            self.assertEqual(os.listdir(work_path), [])
+        finally:
+            file_helpers.remove_tree(work_path)
+        e = methods["MeekSTV"](b)
+        e.setSeed(0)
+        e.runElection()
+        meek, = results["methods"]
+        self.assertEqual(meek["resumedAtRound"], None)
+        self.assertEqual(meek["winners"],
+                         [b.names[c] for c in sorted(e.winners)])
+
+    def _write_stv_election(self, dir_path):
+        rng = random.Random(2)
+        answers = [dict(id=i, text="C%d" % i, value="C%d" % i)
+                   for i in range(7)]
+        questions = [dict(question="Q", tally_type="meek-stv", num_seats=2,
+                          answers=answers)]
+        os.makedirs(os.path.join(dir_path, "0-question"))
+        file_helpers.write_file(os.path.join(dir_path, "questions_json"),
+                                json.dumps(questions))
+        lines = []
+        for i in range(200):
+            ranking = rng.sample(range(7), rng.randint(1, 7))
+            number = int("".join(str(c + 1) for c in ranking))
+            lines.append('"%d"\n' % (number + 1))
+        file_helpers.write_file(
+            os.path.join(dir_path, "0-question", "plaintexts_json"),
+            "".join(lines))
+
+    def test_tally_resume(self):
+        class Interrupted(Exception):
+            pass
+
+        def crash(event):
+            if event["name"] == "checkpoint":
+                raise Interrupted()
+
+        rounds = []
+        def record(event):
+            if event["name"] == "round":
+                rounds.append(event["args"]["round"])
+
+        methods = voting_base.VOTING_METHODS
+        voting_base.VOTING_METHODS = methods + (
+            'agora_tally.voting_systems.meek_stv.MeekSTV',)
+        work_path = tempfile.mkdtemp()
+        try:
+            dir_path = os.path.join(work_path, "election")
+            checkpoint_dir = os.path.join(work_path, "checkpoints")
+            self._write_stv_election(dir_path)
+            for name in ["MeekSTV", "WarrenSTV", "ERS97STV"]:
+                def patcher(tally):
+                    tally.method_name = name
+                    tally.checkpoint_interval = 1
+
+                six.get_function_defaults(do_tally)[0][:] = []
+                expected = do_dirtally(dir_path, monkey_patcher=patcher,
+                                       seed=3)
+
+                six.get_function_defaults(do_tally)[0][:] = []
+                instrumentation.add_listener(crash)
+                try:
+                    self.assertRaises(Interrupted, do_dirtally, dir_path,
+                                      monkey_patcher=patcher, seed=3,
+                                      checkpoint_dir=checkpoint_dir)
+                finally:
+                    instrumentation.remove_listener(crash)
+                self.assertEqual(os.listdir(checkpoint_dir),
+                                 ["0.checkpoint"])
+
+                six.get_function_defaults(do_tally)[0][:] = []
+                del rounds[:]
+                instrumentation.add_listener(record)
+                try:
+                    resumed = do_dirtally(dir_path, monkey_patcher=patcher,
+                                          seed=3,
+                                          checkpoint_dir=checkpoint_dir)
+                finally:
+                    instrumentation.remove_listener(record)
+                self.assertTrue(min(rounds) > 0)
+                self.assertEqual(os.listdir(checkpoint_dir), [])
+                self.assertEqual(resumed["questions"][0]["winners"],
+                                 expected["questions"][0]["winners"])
+                self.assertEqual(resumed["questions"][0]["answers"],
+                                 expected["questions"][0]["answers"])
+        finally:
+            voting_base.VOTING_METHODS = methods
+            six.get_function_defaults(do_tally)[0][:] = []
+            file_helpers.remove_tree(work_path)
+
+class TestSeeds(unittest.TestCase):
+    def setUp(self):
+        six.get_function_defaults(do_tally)[0][:] = []
+
+    def test_election_seed(self):
+        methods = getMethodPlugins("byName", exclude0=False)
+        for name in ["RTSTV", "GPCA2000STV", "IRV"]:
+            for seed in range(5):
+                b = random_ballots(6, 30, 6, seed)
+                b.numSeats = 2
+                results = []
+                for global_seed in [seed, seed + 1]:
+                    random.seed(global_seed)
+                    e = methods[name](b)
+                    e.setSeed(seed)
+                    e.runElection()
+                    self.assertEqual(e.seed, seed)
+                    results.append((e.winners, e.count, e.msg))
+                self.assertEqual(results[0], results[1])
+
+    def test_tally_seed(self):
+        tally_path = os.path.join("test", "fixtures", "plurality-at-large")
+        logs = []
+        for i in range(2):
+            tallies = []
+            do_dirtally(tally_path, seed=7, monkey_patcher=tallies.append)
+            logs.append(tallies[0].get_log())
+            six.get_function_defaults(do_tally)[0][:] = []
+        self.assertEqual(logs[0]["random_seed"],
+                         dict(seed=7, question_seed=derive_seed(7, 0)))
+        self.assertEqual(logs[0], logs[1])
+        self.assertNotEqual(derive_seed(7, 0), derive_seed(7, 1))
+
+class TestNarrative(unittest.TestCase):
+    def test_headless_count(self):
+        methods = getMethodPlugins("byName", exclude0=False)
+        for name in ["IRV", "MeekSTV", "ERS97STV", "RTSTV", "Coombs"]:
+            for seed in range(5):
+                b = random_ballots(6, 100, 6, seed)
+                b.numSeats = 2
+                elections = []
+                for narrative in [True, False]:
+                    e = methods[name](b)
+                    e.narrative = narrative
+                    random.seed(seed)
+                    e.runElection()
+                    elections.append(e)
+                e1, e2 = elections
+                self.assertEqual(e1.winners, e2.winners)
+                self.assertEqual(e1.count, e2.count)
+                self.assertEqual(set(e2.msg), set([""]))
+
+                random.seed(seed + 1)
+                e2.generateNarrative()
+                self.assertEqual(e1.msg, e2.msg)
+                self.assertEqual(e1.count, e2.count)
+
 if __name__ == '__main__':
     unittest.main()